@@ -1,7 +1,28 @@
 import sys
 import os
+import posixpath
 import re
 import json
+import time
+import difflib
+import hashlib
+import argparse
+import threading
+import io
+import tempfile
+import shutil
+import base64
+import importlib.util
+import multiprocessing
+import asyncio
+import functools
+import bisect
+import sqlite3
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html import escape as escape_html, unescape as unescape_html
+from urllib.parse import urlsplit, unquote
 import markdown
 import datetime
 from PyQt6.QtWidgets import (
@@ -9,26 +30,893 @@ from PyQt6.QtWidgets import (
     QTextBrowser, QVBoxLayout, QWidget, QToolBar, QMenu,
     QMenuBar, QStatusBar, QFileDialog, QMessageBox, QDialog,
     QGridLayout, QLabel, QLineEdit, QPushButton, QCheckBox, QGroupBox,
-    QTreeView, QDockWidget, QInputDialog, QHBoxLayout
+    QTreeView, QDockWidget, QInputDialog, QHBoxLayout, QTreeWidget, QTreeWidgetItem,
+    QListWidget, QListWidgetItem, QDialogButtonBox, QCompleter
 )
 from PyQt6.QtCore import (
     Qt, QSize, QTimer, pyqtSignal as Signal, pyqtSlot as Slot, QSettings, QRect, QRegularExpression,
-    QDir, QFileInfo, QModelIndex, QItemSelectionModel, QFile, QTextStream
+    QDir, QFileInfo, QModelIndex, QItemSelectionModel, QFile, QTextStream, QFileSystemWatcher, QObject, QThread,
+    QUrl, QRunnable, QThreadPool, QPoint, QStringListModel, QEvent
 )
 from PyQt6.QtGui import (
     QAction, QIcon, QFont, QColor, QTextCharFormat, QPainter, 
     QTextCursor, QSyntaxHighlighter, QTextFormat, QPalette, QTextDocument,
-    QFileSystemModel, QStandardItemModel, QStandardItem, QKeySequence, QPixmap, QGuiApplication, QImage, QShortcut
+    QFileSystemModel, QStandardItemModel, QStandardItem, QKeySequence, QPixmap, QGuiApplication, QImage, QShortcut,
+    QDesktopServices, QTextBlockUserData, QPdfWriter, QKeyEvent
 )
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
 try:
     from markdown_it import MarkdownIt
     from pygments import highlight
     from pygments.lexers import get_lexer_by_name
     from pygments.formatters import HtmlFormatter
+    from pygments.styles import get_style_by_name
+    from pygments.token import Token
+    from pygments.util import ClassNotFound
     MARKDOWN_IT_AVAILABLE = True
 except ImportError:
     MARKDOWN_IT_AVAILABLE = False
     print("Warning: markdown-it-py or pygments not found. Using basic Markdown rendering.")
+try:
+    import yaml
+    YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+MATPLOTLIB_AVAILABLE = importlib.util.find_spec("matplotlib") is not None
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "markdown-editor")
+MARKDOWN_EXTENSIONS = ('.md', '.markdown')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.bmp')
+ASSET_EXTENSIONS = IMAGE_EXTENSIONS + ('.pdf',)
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+FENCE_LANGUAGE_PATTERN = re.compile(r'```\s*([\w+#.-]+)')
+INLINE_CODE_PATTERN = re.compile(r'`[^`]*`')
+LINK_PATTERN = re.compile(r'(!?)\[(?:[^\]\\]|\\.)*\]\(\s*<?([^)\s>]+)>?(?:\s+["\'(][^)]*)?\)')
+REFERENCE_PATTERN = re.compile(r'^\s{0,3}\[[^\]]+\]:\s*<?([^\s>]+)>?')
+HTML_IMAGE_PATTERN = re.compile(r'<img\s[^>]*src=["\']([^"\']+)["\']', re.IGNORECASE)
+WIKI_LINK_PATTERN = re.compile(r'\[\[([^\]|#]+)(?:#([^\]|]*))?(?:\|[^\]]*)?\]\]')
+LINK_COMPLETION_PATTERN = re.compile(r'(!?)\[[^\]]*\]\(<?([^()\s<>]*)$')
+WIKI_COMPLETION_PATTERN = re.compile(r'\[\[([^\]|#]*)(?:#([^\]|]*))?$')
+TAG_COMPLETION_PATTERN = re.compile(r'^\s*(?:tags?|keywords)\s*:\s*\[?(?:[^,\]]*,\s*)*([^,\]\s]*)$', re.IGNORECASE)
+DATA_URI_PATTERN = re.compile(r'data:[\w/+.-]*(?:;[\w.+-]+=[\w.+-]+)*(?:;base64)?,[A-Za-z0-9+/=%._~-]{256,}')
+WORKSPACE_INDEX_VERSION = 2
+METADATA_INDEX_VERSION = 1
+METADATA_KEY_ALIASES = {"tags": "tag", "keywords": "tag"}
+FRONT_MATTER_LIMIT = 64 * 1024
+RENDERER_VERSION = 3
+MATH_VERSION = 1
+SESSION_VERSION = 1
+MEMORY_CACHE_PRIORITY = 5
+MEMORY_CACHE_SHARE = 0.25
+UNDO_TRIM_FLOOR = 50
+def slugify_heading(title):
+    slug = re.sub(r'[^\w\s-]', '', title.strip().lower())
+    return re.sub(r'\s', '-', slug)
+def parse_markdown_document(text):
+    headings = []
+    links = []
+    wikilinks = []
+    slugs = {}
+    in_fence = False
+    for number, line in enumerate(text.split('\n'), 1):
+        if FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+            continue
+        if in_fence:
+            continue
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            title = heading.group(2)
+            anchor = slugify_heading(title)
+            if anchor in slugs:
+                slugs[anchor] += 1
+                anchor = f"{anchor}-{slugs[anchor]}"
+            else:
+                slugs[anchor] = 0
+            headings.append([len(heading.group(1)), title, anchor, number])
+        line = INLINE_CODE_PATTERN.sub('', line)
+        for match in LINK_PATTERN.finditer(line):
+            links.append([match.group(2), number, bool(match.group(1))])
+        reference = REFERENCE_PATTERN.match(line)
+        if reference:
+            links.append([reference.group(1), number, False])
+        for match in HTML_IMAGE_PATTERN.finditer(line):
+            links.append([match.group(1), number, True])
+        for match in WIKI_LINK_PATTERN.finditer(line):
+            wikilinks.append([match.group(1).strip(), match.group(2) or "", number])
+    return {"headings": headings, "links": links, "wikilinks": wikilinks}
+def iter_workspace_files(root, extensions):
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = [name for name in dirs if not name.startswith('.')]
+        for name in files:
+            if name.lower().endswith(extensions):
+                yield os.path.join(directory, name)
+def iter_markdown_files(root):
+    return iter_workspace_files(root, MARKDOWN_EXTENSIONS)
+def atomic_write(path, data, mode=0o644):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data.encode('utf-8', errors='surrogatepass') if isinstance(data, str) else data)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+class WorkspaceIndex:
+    def __init__(self, root, cache_dir=CACHE_DIR):
+        self.root = os.path.abspath(root)
+        key = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir, f"workspace-{key}.json")
+        self.files = {}
+        self.assets = set()
+        self.loaded = False
+    def load(self):
+        self.loaded = True
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("root") == self.root and data.get("version") == WORKSPACE_INDEX_VERSION:
+                self.files = data.get("files", {})
+        except (OSError, ValueError):
+            self.files = {}
+    def save(self):
+        atomic_write(self.cache_path, json.dumps({"root": self.root, "version": WORKSPACE_INDEX_VERSION, "files": self.files}))
+    def refresh(self):
+        if not self.loaded:
+            self.load()
+        changed = set()
+        seen = set()
+        assets = set()
+        for path in iter_workspace_files(self.root, MARKDOWN_EXTENSIONS + ASSET_EXTENSIONS):
+            rel = os.path.relpath(path, self.root).replace(os.sep, '/')
+            if not rel.lower().endswith(MARKDOWN_EXTENSIONS):
+                assets.add(rel)
+                continue
+            seen.add(rel)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self.files.get(rel)
+            if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                continue
+            try:
+                with open(path, 'rb') as file:
+                    data = file.read()
+            except OSError:
+                continue
+            digest = hashlib.sha1(data).hexdigest()
+            if entry and entry["hash"] == digest:
+                entry["mtime"] = stat.st_mtime_ns
+                entry["size"] = stat.st_size
+                continue
+            entry = parse_markdown_document(data.decode('utf-8', errors='replace'))
+            entry.update({"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": digest})
+            self.files[rel] = entry
+            changed.add(rel)
+        removed = set(self.files) - seen
+        for rel in removed:
+            del self.files[rel]
+        self.assets = assets
+        return changed, removed
+    def anchors(self, rel):
+        entry = self.files.get(rel)
+        return {heading[2] for heading in entry["headings"]} if entry else set()
+    def resolve(self, rel, target):
+        parts = urlsplit(target)
+        if parts.scheme or target.startswith('//'):
+            return None, None
+        path = unquote(parts.path)
+        if not path:
+            return rel, parts.fragment
+        if path.startswith('/'):
+            joined = path.lstrip('/')
+        else:
+            joined = os.path.join(os.path.dirname(rel), path)
+        return os.path.normpath(joined).replace(os.sep, '/'), parts.fragment
+def check_url_syntax(target):
+    try:
+        parts = urlsplit(target)
+    except ValueError:
+        return False
+    if parts.scheme in ('http', 'https', 'ftp') or target.startswith('//'):
+        return bool(parts.netloc) and not re.search(r'[\s<>"{}|\\^]', parts.netloc) and parts.hostname is not None
+    if parts.scheme == 'mailto':
+        return '@' in parts.path
+    return bool(re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*$', parts.scheme))
+class LinkChecker:
+    def __init__(self, index):
+        self.index = index
+        self.problems = {}
+        self.targets = {}
+    def check(self, changed, removed):
+        dirty = set(changed) | set(removed)
+        affected = set(changed) | (set(self.index.files) - set(self.targets))
+        affected.update(rel for rel, targets in self.targets.items() if targets & dirty)
+        for rel in removed:
+            self.problems.pop(rel, None)
+            self.targets.pop(rel, None)
+        for rel in affected:
+            if rel in self.index.files:
+                self.problems[rel] = self.check_file(rel)
+        return self.problem_list()
+    def check_file(self, rel):
+        problems = []
+        targets = set()
+        for target, line, is_image in self.index.files[rel]["links"]:
+            target_rel, anchor = self.index.resolve(rel, target)
+            if target_rel is None:
+                if not check_url_syntax(target):
+                    problems.append((line, f"Некорректный URL: {target}"))
+                continue
+            targets.add(target_rel)
+            if target_rel.startswith('../') or target_rel == '..':
+                exists = os.path.exists(os.path.join(self.index.root, target_rel))
+            else:
+                exists = target_rel in self.index.files or os.path.exists(os.path.join(self.index.root, target_rel))
+            if not exists:
+                kind = "Изображение не найдено" if is_image else "Файл не найден"
+                problems.append((line, f"{kind}: {target}"))
+            elif anchor and target_rel in self.index.files and anchor not in self.index.anchors(target_rel):
+                problems.append((line, f"Якорь не найден: {target}"))
+        self.targets[rel] = targets
+        return problems
+    def problem_list(self):
+        return [(rel, line, message) for rel in sorted(self.problems) for line, message in self.problems[rel]]
+def note_name(rel):
+    return os.path.splitext(os.path.basename(rel))[0].lower()
+class LinkGraph:
+    def __init__(self, index):
+        self.index = index
+        self.outgoing = {}
+        self.incoming = {}
+        self.names = {}
+        self.wiki_sources = {}
+        self.wiki_names = {}
+        self.unresolved_targets = set()
+        self.unresolved_cache = None
+        self.unresolved_version = 0
+        self.built = False
+    def rebuild(self):
+        self.outgoing.clear()
+        self.incoming.clear()
+        self.names.clear()
+        self.wiki_sources.clear()
+        self.wiki_names.clear()
+        self.unresolved_targets.clear()
+        self.unresolved_changed()
+        for rel in self.index.files:
+            self.names.setdefault(note_name(rel), set()).add(rel)
+        for rel in self.index.files:
+            self.link(rel)
+        self.built = True
+    def update(self, changed, removed):
+        if not self.built:
+            self.rebuild()
+            return
+        dirty_names = set()
+        for rel in removed:
+            self.unlink(rel)
+            name = note_name(rel)
+            self.names.get(name, set()).discard(rel)
+            dirty_names.add(name)
+        for rel in changed:
+            if rel not in self.outgoing:
+                name = note_name(rel)
+                self.names.setdefault(name, set()).add(rel)
+                dirty_names.add(name)
+        relink = set(changed)
+        for name in dirty_names:
+            relink.update(self.wiki_sources.get(name, ()))
+        for rel in relink:
+            if rel in self.index.files:
+                self.unlink(rel)
+                self.link(rel)
+        for rel in removed:
+            if rel in self.incoming and rel not in self.index.files:
+                self.unresolved_targets.add(rel)
+                self.unresolved_changed()
+        for rel in changed:
+            if rel in self.unresolved_targets:
+                self.unresolved_targets.discard(rel)
+                self.unresolved_changed()
+    def resolve_wiki(self, name):
+        candidates = self.names.get(name.lower())
+        if not candidates:
+            return None
+        return min(candidates, key=lambda rel: (rel.count('/'), rel))
+    def link(self, rel):
+        entry = self.index.files[rel]
+        targets = {}
+        for target, line, is_image in entry["links"]:
+            if is_image:
+                continue
+            target_rel, anchor = self.index.resolve(rel, target)
+            if target_rel and target_rel != rel and target_rel.lower().endswith(MARKDOWN_EXTENSIONS):
+                targets.setdefault(target_rel, line)
+        wiki_names = set()
+        for name, anchor, line in entry.get("wikilinks", ()):
+            wiki_names.add(name.lower())
+            self.wiki_sources.setdefault(name.lower(), set()).add(rel)
+            target_rel = self.resolve_wiki(name)
+            if target_rel != rel:
+                targets.setdefault(target_rel or f"[[{name}]]", line)
+        self.outgoing[rel] = targets
+        if wiki_names:
+            self.wiki_names[rel] = wiki_names
+        for target_rel, line in targets.items():
+            self.incoming.setdefault(target_rel, {})[rel] = line
+            if target_rel not in self.index.files:
+                self.unresolved_targets.add(target_rel)
+                self.unresolved_changed()
+    def unlink(self, rel):
+        for target_rel in self.outgoing.pop(rel, {}):
+            if target_rel in self.unresolved_targets:
+                self.unresolved_changed()
+            sources = self.incoming.get(target_rel)
+            if sources is not None:
+                sources.pop(rel, None)
+                if not sources:
+                    del self.incoming[target_rel]
+                    self.unresolved_targets.discard(target_rel)
+        for name in self.wiki_names.pop(rel, ()):
+            sources = self.wiki_sources.get(name)
+            if sources is not None:
+                sources.discard(rel)
+                if not sources:
+                    del self.wiki_sources[name]
+    def backlinks(self, rel):
+        return sorted(self.incoming.get(rel, {}).items())
+    def unresolved_changed(self):
+        if self.unresolved_cache is not None:
+            self.unresolved_cache = None
+            self.unresolved_version += 1
+    def unresolved(self):
+        if self.unresolved_cache is None:
+            self.unresolved_cache = sorted(
+                (target, sorted(self.incoming[target].items())) for target in self.unresolved_targets
+            )
+        return self.unresolved_cache
+class TrieNode:
+    def __init__(self, label=""):
+        self.label = label
+        self.children = {}
+        self.values = {}
+class PrefixTrie:
+    def __init__(self):
+        self.root = TrieNode()
+        self.size = 0
+    def add(self, key, value):
+        node = self.root
+        while key:
+            child = node.children.get(key[0])
+            if child is None:
+                child = node.children[key[0]] = TrieNode(key)
+                node = child
+                break
+            label = child.label
+            common = 1
+            limit = min(len(label), len(key))
+            while common < limit and label[common] == key[common]:
+                common += 1
+            if common < len(label):
+                middle = TrieNode(label[:common])
+                child.label = label[common:]
+                middle.children[child.label[0]] = child
+                node.children[key[0]] = middle
+                child = middle
+            node = child
+            key = key[common:]
+        if value not in node.values:
+            self.size += 1
+        node.values[value] = node.values.get(value, 0) + 1
+    def remove(self, key, value):
+        path = [self.root]
+        while key:
+            child = path[-1].children.get(key[0])
+            if child is None or not key.startswith(child.label):
+                return False
+            key = key[len(child.label):]
+            path.append(child)
+        node = path[-1]
+        count = node.values.get(value)
+        if count is None:
+            return False
+        if count > 1:
+            node.values[value] = count - 1
+            return True
+        del node.values[value]
+        self.size -= 1
+        while len(path) > 1:
+            node = path.pop()
+            parent = path[-1]
+            if node.values:
+                break
+            if not node.children:
+                del parent.children[node.label[0]]
+                continue
+            if len(node.children) == 1:
+                child = next(iter(node.children.values()))
+                child.label = node.label + child.label
+                parent.children[child.label[0]] = child
+            break
+        return True
+    def complete(self, prefix, limit=50):
+        node = self.root
+        while prefix:
+            child = node.children.get(prefix[0])
+            if child is None:
+                return []
+            if child.label.startswith(prefix):
+                node = child
+                break
+            if not prefix.startswith(child.label):
+                return []
+            prefix = prefix[len(child.label):]
+            node = child
+        results = []
+        stack = [node]
+        while stack and len(results) < limit:
+            node = stack.pop()
+            results.extend(sorted(node.values)[:limit - len(results)])
+            stack.extend(node.children[key] for key in sorted(node.children, reverse=True))
+        return results
+class CompletionIndex:
+    def __init__(self, index):
+        self.index = index
+        self.paths = PrefixTrie()
+        self.headings = PrefixTrie()
+        self.tags = PrefixTrie()
+        self.file_headings = {}
+        self.file_tags = {}
+        self.assets = set()
+        self.built = False
+        self.tags_built = False
+    def add_path(self, rel):
+        self.paths.add(rel.lower(), rel)
+        if '/' in rel:
+            self.paths.add(rel.rsplit('/', 1)[1].lower(), rel)
+    def remove_path(self, rel):
+        self.paths.remove(rel.lower(), rel)
+        if '/' in rel:
+            self.paths.remove(rel.rsplit('/', 1)[1].lower(), rel)
+    def set_headings(self, rel, anchors):
+        for anchor in self.file_headings.pop(rel, ()):
+            self.headings.remove(f"{rel}#{anchor}".lower(), f"{rel}#{anchor}")
+        if anchors is not None:
+            for anchor in anchors:
+                self.headings.add(f"{rel}#{anchor}".lower(), f"{rel}#{anchor}")
+            self.file_headings[rel] = anchors
+    def update(self, changed, removed):
+        if not self.built:
+            changed, removed = set(self.index.files), ()
+            self.built = True
+        for rel in removed:
+            if rel in self.file_headings:
+                self.remove_path(rel)
+                self.set_headings(rel, None)
+        for rel in changed:
+            if rel not in self.file_headings:
+                self.add_path(rel)
+            self.set_headings(rel, [heading[2] for heading in self.index.files[rel]["headings"]])
+        for rel in self.assets - self.index.assets:
+            self.remove_path(rel)
+        for rel in self.index.assets - self.assets:
+            self.add_path(rel)
+        self.assets = set(self.index.assets)
+    def update_tags(self, rows, changed, removed):
+        if self.tags_built:
+            stale = list(changed) + list(removed)
+        else:
+            stale = list(self.file_tags)
+            self.tags_built = True
+        for rel in stale:
+            for tag in self.file_tags.pop(rel, ()):
+                self.tags.remove(tag, tag)
+        for rel, tag in rows:
+            self.file_tags.setdefault(rel, []).append(tag)
+            self.tags.add(tag, tag)
+    @staticmethod
+    def has_context(line):
+        return any(pattern.search(line) for pattern in (WIKI_COMPLETION_PATTERN, LINK_COMPLETION_PATTERN, TAG_COMPLETION_PATTERN))
+    def complete(self, line, current, graph=None, limit=50):
+        match = WIKI_COMPLETION_PATTERN.search(line)
+        if match:
+            name, anchor = match.groups()
+            if anchor is None:
+                return name, self.complete_names(name, limit)
+            target = graph.resolve_wiki(name.strip()) if graph is not None and name.strip() else current
+            return anchor, self.complete_anchors(target, anchor, limit)
+        match = LINK_COMPLETION_PATTERN.search(line)
+        if match:
+            image, target = match.groups()
+            path, separator, anchor = target.partition('#')
+            if separator:
+                rel = self.index.resolve(current, path)[0] if path else current
+                return anchor, self.complete_anchors(rel, anchor, limit)
+            return target, self.complete_paths(target, current, bool(image), limit)
+        match = TAG_COMPLETION_PATTERN.search(line)
+        if match:
+            return match.group(1), self.tags.complete(match.group(1).lower(), limit)
+        return None
+    def complete_names(self, prefix, limit):
+        names = []
+        for rel in self.paths.complete(prefix.strip().lower(), limit * 2):
+            name = os.path.splitext(rel.rsplit('/', 1)[-1])[0]
+            if rel.lower().endswith(MARKDOWN_EXTENSIONS) and name not in names:
+                names.append(name)
+        return names[:limit]
+    def complete_anchors(self, rel, prefix, limit):
+        if not rel:
+            return []
+        return [value.partition('#')[2] for value in self.headings.complete(f"{rel}#{prefix}".lower(), limit)]
+    def complete_paths(self, typed, current, image, limit):
+        typed = unquote(typed)
+        base = posixpath.dirname(current)
+        if typed.startswith('/'):
+            key = typed.lstrip('/')
+        else:
+            key = posixpath.normpath(posixpath.join(base, typed)) if typed else base
+            if key == '.':
+                key = ''
+            elif key.startswith('..'):
+                return []
+            elif key and (typed.endswith('/') or not typed):
+                key += '/'
+        rels = self.paths.complete(key.lower(), limit * 2)
+        if typed and '/' not in typed:
+            rels += self.paths.complete(typed.lower(), limit * 2)
+        results = []
+        for rel in rels:
+            if image and not rel.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            target = '/' + rel if typed.startswith('/') else posixpath.relpath(rel, base or '.')
+            target = target.replace(' ', '%20')
+            if target not in results:
+                results.append(target)
+        return results[:limit]
+def read_front_matter(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        if file.readline().strip() != '---':
+            return ""
+        lines = []
+        size = 0
+        for line in file:
+            if line.rstrip() in ('---', '...'):
+                return ''.join(lines)
+            lines.append(line)
+            size += len(line)
+            if size > FRONT_MATTER_LIMIT:
+                break
+    return ""
+def parse_front_matter_fallback(text):
+    data = {}
+    key = None
+    for line in text.split('\n'):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        item = re.match(r'^\s+-\s*(.*)$', line)
+        if item and key is not None:
+            if not isinstance(data[key], list):
+                data[key] = []
+            data[key].append(item.group(1).strip().strip('"\''))
+            continue
+        pair = re.match(r'^([\w-]+)\s*:\s*(.*)$', line)
+        if not pair:
+            key = None
+            continue
+        key, value = pair.group(1), pair.group(2).strip()
+        if value.startswith('[') and value.endswith(']'):
+            data[key] = [part.strip().strip('"\'') for part in value[1:-1].split(',') if part.strip()]
+        else:
+            data[key] = value.strip('"\'') if value else ""
+    return data
+def parse_front_matter(text):
+    if not text:
+        return {}
+    if YAML_AVAILABLE:
+        try:
+            data = yaml.load(text, Loader=YAML_LOADER)
+        except yaml.YAMLError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return parse_front_matter_fallback(text)
+def metadata_pairs(data):
+    pairs = set()
+    for key, value in data.items():
+        key = str(key).strip().lower()
+        key = METADATA_KEY_ALIASES.get(key, key)
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        for value in values:
+            if value is None or isinstance(value, (dict, list)):
+                continue
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            for part in (str(value).split(',') if key == "tag" else [str(value)]):
+                part = part.strip().lower()
+                if part:
+                    pairs.add((key, part))
+    return pairs
+def parse_metadata_query(query):
+    terms = []
+    for word in query.split():
+        negate = word.startswith('-') and len(word) > 1
+        if negate:
+            word = word[1:]
+        key, sep, value = word.partition(':')
+        if sep and key and value:
+            key = key.lower()
+            terms.append((negate, METADATA_KEY_ALIASES.get(key, key), value.lower()))
+        else:
+            terms.append((negate, None, word.lower()))
+    return terms
+class MetadataIndex:
+    def __init__(self, root, cache_dir=CACHE_DIR):
+        self.root = os.path.abspath(root)
+        key = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:16]
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, f"metadata-{key}.sqlite")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != METADATA_INDEX_VERSION:
+            self.connection.executescript(
+                "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS meta;"
+                f"PRAGMA user_version = {METADATA_INDEX_VERSION};"
+            )
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS files (rel TEXT PRIMARY KEY, mtime INTEGER, size INTEGER) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT, value TEXT, rel TEXT, PRIMARY KEY (key, value, rel)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS meta_rel ON meta (rel);"
+        )
+    def close(self):
+        with self.lock:
+            self.connection.close()
+    def refresh(self):
+        stats = {}
+        for path in iter_markdown_files(self.root):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            rel = os.path.relpath(path, self.root).replace(os.sep, '/')
+            stats[rel] = (stat.st_mtime_ns, stat.st_size)
+        return self.sync(stats)
+    def sync(self, stats):
+        with self.lock:
+            known = {rel: (mtime, size) for rel, mtime, size in self.connection.execute("SELECT rel, mtime, size FROM files")}
+        changed = [rel for rel, stat in stats.items() if known.get(rel) != stat]
+        removed = [rel for rel in known if rel not in stats]
+        if not changed and not removed:
+            return changed, removed
+        rows = []
+        for rel in changed:
+            try:
+                text = read_front_matter(os.path.join(self.root, rel))
+            except OSError:
+                text = ""
+            rows.extend((key, value, rel) for key, value in metadata_pairs(parse_front_matter(text)))
+        with self.lock, self.connection:
+            for rel in removed + changed:
+                self.connection.execute("DELETE FROM meta WHERE rel = ?", (rel,))
+            self.connection.executemany("DELETE FROM files WHERE rel = ?", [(rel,) for rel in removed])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                [(rel, stats[rel][0], stats[rel][1]) for rel in changed]
+            )
+            self.connection.executemany("INSERT OR IGNORE INTO meta VALUES (?, ?, ?)", rows)
+        return changed, removed
+    def query(self, query, limit=None):
+        parts = []
+        params = []
+        excluded = []
+        for negate, key, value in parse_metadata_query(query):
+            if key is None:
+                clause = "SELECT rel FROM files WHERE rel LIKE ? ESCAPE '\\'"
+                escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                term_params = [f"%{escaped}%"]
+            elif value == '*':
+                clause = "SELECT rel FROM meta WHERE key = ?"
+                term_params = [key]
+            elif '*' in value or '?' in value:
+                clause = "SELECT rel FROM meta WHERE key = ? AND value GLOB ?"
+                term_params = [key, value]
+            else:
+                clause = "SELECT rel FROM meta WHERE key = ? AND value = ?"
+                term_params = [key, value]
+            if negate:
+                excluded.append((clause, term_params))
+            else:
+                parts.append(clause)
+                params.extend(term_params)
+        sql = " INTERSECT ".join(parts) if parts else "SELECT rel FROM files"
+        for clause, term_params in excluded:
+            sql += " EXCEPT " + clause
+            params.extend(term_params)
+        sql += " ORDER BY rel"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            return [row[0] for row in self.connection.execute(sql, params)]
+    def values(self, key, rels=None):
+        with self.lock:
+            if rels is None:
+                return self.connection.execute("SELECT rel, value FROM meta WHERE key = ?", (key,)).fetchall()
+            rows = []
+            for start in range(0, len(rels), 500):
+                chunk = rels[start:start + 500]
+                rows.extend(self.connection.execute(
+                    f"SELECT rel, value FROM meta WHERE key = ? AND rel IN ({','.join('?' * len(chunk))})", [key] + chunk
+                ))
+            return rows
+    def metadata(self, rels):
+        result = {rel: {} for rel in rels}
+        with self.lock:
+            for start in range(0, len(rels), 500):
+                chunk = rels[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT rel, key, value FROM meta WHERE rel IN ({','.join('?' * len(chunk))}) ORDER BY key, value", chunk
+                )
+                for rel, key, value in rows:
+                    result[rel].setdefault(key, []).append(value)
+        return result
+class WorkspaceThread(QThread):
+    updated = Signal(object, object)
+    problems_ready = Signal(str, object)
+    def __init__(self, parent=None, cache_dir=CACHE_DIR):
+        super().__init__(parent)
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.index = None
+        self.checker = None
+        self.graph = None
+        self.completion = None
+        self.metadata = None
+        self.pending_root = None
+        self.check_requested = False
+        self.rerun = False
+        self.active = False
+        self.state_lock = threading.Lock()
+        self.unchecked = (set(), set())
+    def set_root(self, root):
+        self.pending_root = os.path.abspath(root)
+    def refresh(self, check_links=False):
+        self.check_requested = self.check_requested or check_links
+        with self.state_lock:
+            self.rerun = True
+            start = not self.active
+            self.active = True
+        if start:
+            self.wait()
+            self.start()
+    def run(self):
+        while True:
+            with self.state_lock:
+                if not self.rerun:
+                    self.active = False
+                    return
+                self.rerun = False
+            if self.pending_root:
+                with self.lock:
+                    self.index = WorkspaceIndex(self.pending_root, self.cache_dir)
+                    self.checker = LinkChecker(self.index)
+                    self.graph = LinkGraph(self.index)
+                    self.completion = CompletionIndex(self.index)
+                    self.unchecked = (set(), set())
+                    if self.metadata is not None:
+                        self.metadata.close()
+                    try:
+                        self.metadata = MetadataIndex(self.pending_root, self.cache_dir)
+                    except sqlite3.Error:
+                        self.metadata = None
+                self.pending_root = None
+            if self.index is None:
+                continue
+            changed, removed = self.index.refresh()
+            with self.lock:
+                self.graph.update(changed, removed)
+                self.completion.update(changed, removed)
+            if self.metadata is not None:
+                try:
+                    meta_changed, meta_removed = self.metadata.sync(
+                        {rel: (entry["mtime"], entry["size"]) for rel, entry in self.index.files.items()}
+                    )
+                    tags = self.metadata.values("tag", meta_changed if self.completion.tags_built else None)
+                    with self.lock:
+                        self.completion.update_tags(tags, meta_changed, meta_removed)
+                except (sqlite3.Error, OSError):
+                    pass
+            self.unchecked[0].update(changed)
+            self.unchecked[1].update(removed)
+            if self.check_requested:
+                self.check_requested = False
+                problems = self.checker.check(*self.unchecked)
+                self.unchecked = (set(), set())
+                self.problems_ready.emit(self.index.root, problems)
+            if changed or removed:
+                try:
+                    self.index.save()
+                except OSError:
+                    pass
+            self.updated.emit(changed, removed)
+    def relative_path(self, path):
+        if self.index is None or not path:
+            return None
+        rel = os.path.relpath(os.path.abspath(path), self.index.root)
+        if rel.startswith('..'):
+            return None
+        return rel.replace(os.sep, '/')
+class WorkspaceWatcher(QObject):
+    changed = Signal()
+    def __init__(self, parent=None, max_directories=4096):
+        super().__init__(parent)
+        self.root = None
+        self.max_directories = max_directories
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.on_timeout)
+    def set_root(self, root):
+        watched = self.watcher.directories()
+        if watched:
+            self.watcher.removePaths(watched)
+        self.root = root
+        self.watch_directories()
+    def watch_directories(self):
+        if not self.root:
+            return
+        wanted = []
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            wanted.append(directory)
+            if len(wanted) >= self.max_directories:
+                break
+        watched = set(self.watcher.directories())
+        stale = [path for path in watched if not os.path.isdir(path)]
+        if stale:
+            self.watcher.removePaths(stale)
+        missing = [path for path in wanted if path not in watched]
+        if missing:
+            self.watcher.addPaths(missing)
+    def on_directory_changed(self, path):
+        self.timer.start()
+    def on_timeout(self):
+        self.watch_directories()
+        self.changed.emit()
+def run_metadata_query(root, query):
+    index = MetadataIndex(root)
+    index.refresh()
+    started = time.perf_counter()
+    results = index.query(query)
+    elapsed = (time.perf_counter() - started) * 1000
+    index.close()
+    for rel in results:
+        print(rel)
+    print(f"Найдено файлов: {len(results)} ({elapsed:.1f} мс)", file=sys.stderr)
+    return 0
+def run_link_check(root):
+    index = WorkspaceIndex(root)
+    changed, removed = index.refresh()
+    problems = LinkChecker(index).check(changed, removed)
+    try:
+        index.save()
+    except OSError:
+        pass
+    for rel, line, message in problems:
+        print(f"{rel}:{line}: {message}")
+    print(f"Проверено файлов: {len(index.files)}, проблем: {len(problems)}")
+    return 1 if problems else 0
 class LineNumberArea(QWidget):
     def __init__(self, editor):
         super().__init__(editor)
@@ -37,6 +925,15 @@ class LineNumberArea(QWidget):
         return QSize(self.editor.line_number_area_width(), 0)
     def paintEvent(self, event):
         self.editor.line_number_area_paint_event(event)
+    def mousePressEvent(self, event):
+        if event.position().x() >= self.width() - self.editor.fold_marker_width:
+            block = self.editor.cursorForPosition(QPoint(0, int(event.position().y()))).block()
+            if self.editor.folds.is_foldable(block):
+                self.editor.folds.toggle(block)
+    def mouseDoubleClickEvent(self, event):
+        block = self.editor.cursorForPosition(QPoint(0, int(event.position().y()))).block()
+        for hidden in self.editor.hidden_long_lines_before(block):
+            self.editor.show_long_lines(hidden)
 class MarkdownHighlighter(QSyntaxHighlighter):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -105,31 +1002,1459 @@ class MarkdownHighlighter(QSyntaxHighlighter):
         quote_format.setForeground(color_quote)
         quote_format.setFontItalic(True)
         self.highlighting_rules.append((QRegularExpression(r"^> .+$"), quote_format))
+        self.long_line_format = QTextCharFormat()
+        self.long_line_format.setForeground(QColor("#808080"))
+        self.long_line_limit = 10000
+        self.deferred = False
+        self.languages = [""]
+        self.language_ids = {"": 0}
+        self.code_style = get_style_by_name("monokai") if MARKDOWN_IT_AVAILABLE else None
+        self.token_formats = {}
+        self.restored_states = None
+    def language_id(self, name):
+        name = name.lower()
+        if name not in self.language_ids:
+            self.language_ids[name] = len(self.languages)
+            self.languages.append(name)
+        return self.language_ids[name]
+    def token_format(self, token_type):
+        format = self.token_formats.get(token_type)
+        if format is None:
+            style = self.code_style.style_for_token(token_type)
+            format = QTextCharFormat(self.code_block_format)
+            if style["color"]:
+                format.setForeground(QColor("#" + style["color"]))
+            if style["bold"]:
+                format.setFontWeight(QFont.Weight.Bold)
+            if style["italic"]:
+                format.setFontItalic(True)
+            self.token_formats[token_type] = format
+        return format
+    def encode_states(self):
+        runs = []
+        block = self.document().begin()
+        while block.isValid():
+            state = block.userState()
+            if runs and runs[-1][0] == state:
+                runs[-1][1] += 1
+            else:
+                runs.append([state, 1])
+            block = block.next()
+        return {"languages": self.languages, "runs": runs}
+    def decode_states(self, data):
+        languages = data.get("languages", [""])
+        states = []
+        for state, count in data.get("runs", []):
+            if state > 0 and state & 1:
+                state = 1 | self.language_id(languages[state >> 1]) << 1
+            states.extend([state] * count)
+        return states
     def highlightBlock(self, text):
+        if self.restored_states is not None:
+            number = self.currentBlock().blockNumber()
+            if number < len(self.restored_states):
+                self.setCurrentBlockState(self.restored_states[number])
+                return
         previous_block_state = self.previousBlockState()
         if previous_block_state == -1:
             previous_block_state = 0
-        if previous_block_state == 1:
-            self.setFormat(0, len(text), self.code_block_format)
+        if previous_block_state & 1:
             match = self.code_block_end_pattern.match(text)
+            if not self.deferred:
+                self.setFormat(0, len(text), self.code_block_format)
+                data = self.currentBlockUserData()
+                if isinstance(data, CodeBlockData) and not match.hasMatch() and len(text) <= self.long_line_limit:
+                    length = utf16_length(text)
+                    for start, count, token_type in data.spans:
+                        if start >= length:
+                            break
+                        self.setFormat(start, min(count, length - start), self.token_format(token_type))
             if match.hasMatch():
                 self.setCurrentBlockState(0)
             else:
-                self.setCurrentBlockState(1)
+                self.setCurrentBlockState(previous_block_state)
             return
         match = self.code_block_pattern.match(text)
         if match.hasMatch():
-            self.setFormat(0, len(text), self.code_block_format)
-            self.setCurrentBlockState(1)
+            if not self.deferred:
+                self.setFormat(0, len(text), self.code_block_format)
+            language = FENCE_LANGUAGE_PATTERN.search(text)
+            self.setCurrentBlockState(1 | self.language_id(language.group(1) if language else "") << 1)
+            return
+        if self.deferred:
+            return
+        if len(text) > self.long_line_limit:
+            self.setFormat(0, len(text), self.long_line_format)
             return
         for pattern, format in self.highlighting_rules:
             match_iterator = pattern.globalMatch(text)
             while match_iterator.hasNext():
                 match = match_iterator.next()
                 self.setFormat(match.capturedStart(), match.capturedLength(), format)
-class MarkdownRenderer:
+class CodeBlockData(QTextBlockUserData):
+    def __init__(self, language, text, spans):
+        super().__init__()
+        self.language = language
+        self.text = text
+        self.spans = spans
+@functools.lru_cache(maxsize=64)
+def get_code_lexer(language):
+    if not MARKDOWN_IT_AVAILABLE or not language:
+        return None
+    try:
+        return get_lexer_by_name(language, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return None
+def tokenize_code(lexer, lines):
+    spans = [[] for _ in lines]
+    line = 0
+    column = 0
+    for token_type, value in lexer.get_tokens('\n'.join(lines)):
+        for index, part in enumerate(value.split('\n')):
+            if index:
+                line += 1
+                column = 0
+            if line >= len(lines):
+                return spans
+            if part:
+                length = utf16_length(part)
+                if token_type not in Token.Text:
+                    spans[line].append((column, length, token_type))
+                column += length
+    return spans
+class FenceHighlighter(QObject):
+    def __init__(self, editor, margin=50, max_lines=5000, cache_size=64):
+        super().__init__(editor)
+        self.editor = editor
+        self.highlighter = editor.highlighter
+        self.margin = margin
+        self.max_lines = max_lines
+        self.cache_size = cache_size
+        self.cache = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(30)
+        self.timer.timeout.connect(self.highlight_visible)
+        editor.document().contentsChange.connect(self.schedule)
+        editor.verticalScrollBar().valueChanged.connect(self.schedule)
+    def schedule(self, *args):
+        self.timer.start()
+    def cache_bytes(self):
+        return sum(len(line) for spans in self.cache.values() for line in spans) * 80 + len(self.cache) * 200
+    def evict(self, amount):
+        freed = 0
+        while freed < amount and self.cache:
+            spans = self.cache.pop(next(iter(self.cache)))
+            freed += sum(len(line) for line in spans) * 80 + 200
+        return freed
+    def in_fence(self, block):
+        previous = block.previous()
+        return previous.isValid() and previous.userState() > 0 and previous.userState() & 1
+    def is_opening(self, block):
+        return block.userState() > 0 and block.userState() & 1 and not self.in_fence(block)
+    def highlight_visible(self):
+        if not MARKDOWN_IT_AVAILABLE or self.highlighter.deferred:
+            return
+        doc = self.editor.document()
+        first = self.editor.firstVisibleBlock().blockNumber()
+        visible = self.editor.viewport().height() // max(1, self.editor.fontMetrics().height())
+        last = first + visible + self.margin
+        block = doc.findBlockByNumber(max(0, first - self.margin))
+        while block.isValid() and block.blockNumber() <= last:
+            if self.in_fence(block) or self.is_opening(block):
+                opening = block
+                steps = 0
+                while self.in_fence(opening) and steps < self.max_lines:
+                    opening = opening.previous()
+                    steps += 1
+                end = self.highlight_fence(opening)
+                block = end if not end.isValid() or end.blockNumber() > block.blockNumber() else block.next()
+            else:
+                block = block.next()
+    def highlight_fence(self, opening):
+        body = []
+        block = opening.next()
+        while block.isValid() and self.in_fence(block) and block.userState() != 0:
+            body.append(block)
+            block = block.next()
+            if len(body) >= self.max_lines:
+                return block
+        if block.isValid() and self.in_fence(block):
+            block = block.next()
+        if not self.is_opening(opening) or not body:
+            return block
+        language = self.highlighter.languages[opening.userState() >> 1]
+        lexer = get_code_lexer(language)
+        if lexer is None:
+            return block
+        lines = [line.text() for line in body]
+        if any(len(text) > self.highlighter.long_line_limit for text in lines):
+            return block
+        current = [line.userData() for line in body]
+        if all(isinstance(data, CodeBlockData) and data.language == language and data.text == text
+               for data, text in zip(current, lines)):
+            return block
+        key = (language, hashlib.sha1('\n'.join(lines).encode('utf-8', errors='surrogatepass')).digest())
+        spans = self.cache.pop(key, None)
+        if spans is None:
+            spans = tokenize_code(lexer, lines)
+        self.cache[key] = spans
+        while len(self.cache) > self.cache_size:
+            del self.cache[next(iter(self.cache))]
+        blocked = self.editor.blockSignals(True)
+        try:
+            for line, data, text, line_spans in zip(body, current, lines, spans):
+                if isinstance(data, CodeBlockData) and data.language == language and data.spans == line_spans:
+                    data.text = text
+                    continue
+                line.setUserData(CodeBlockData(language, text, line_spans))
+                self.highlighter.rehighlightBlock(line)
+        finally:
+            self.editor.blockSignals(blocked)
+        return block
+def utf16_length(text):
+    return len(text) if text.isascii() else len(text.encode('utf-16-le', 'surrogatepass')) // 2
+def utf16_index(text, units):
+    if units <= 0 or text.isascii():
+        return max(0, min(units, len(text)))
+    count = 0
+    for index, char in enumerate(text):
+        if count >= units:
+            return index
+        count += 2 if ord(char) > 0xFFFF else 1
+    return len(text)
+def format_size(size):
+    if size < 1024:
+        return f"{size} Б"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} КБ"
+    return f"{size / (1024 * 1024):.1f} МБ"
+class UndoStep:
+    def __init__(self, position, removed, added, timestamp):
+        self.position = position
+        self.removed = removed
+        self.added = added
+        self.timestamp = timestamp
+        self.size = sys.getsizeof(removed) + sys.getsizeof(added) + 120
+    def kind(self):
+        if not self.removed:
+            return "insert"
+        if not self.added:
+            return "delete"
+        return "replace"
+def merge_undo_steps(first, second):
+    first_end = first.position + utf16_length(first.added)
+    second_length = utf16_length(second.removed)
+    second_end = second.position + second_length
+    if second.position > first_end or second_end < first.position:
+        return None
+    start = min(first.position, second.position)
+    prefix = second.removed[:utf16_index(second.removed, first.position - start)] if second.position < first.position else ""
+    suffix = second.removed[utf16_index(second.removed, first_end - second.position):] if second_end > first_end else ""
+    region = prefix + first.added + suffix
+    head = utf16_index(region, second.position - start)
+    tail = utf16_index(region, second.position - start + second_length)
+    return UndoStep(start, prefix + first.removed + suffix, region[:head] + second.added + region[tail:], second.timestamp)
+class UndoHistory(QObject):
+    changed = Signal()
+    def __init__(self, editor, max_steps=1000, max_bytes=64 * 1024 * 1024):
+        super().__init__(editor)
+        self.editor = editor
+        self.document = editor.document()
+        self.max_steps = max_steps
+        self.max_bytes = max_bytes
+        self.merge_interval = 2.0
+        self.merge_limit = 64 * 1024
+        self.undo_steps = []
+        self.redo_steps = []
+        self.bytes = 0
+        self.applying = False
+        self.document.setUndoRedoEnabled(False)
+        self.reset_shadow()
+        self.document.contentsChange.connect(self.on_contents_change)
+    def set_limits(self, max_steps, max_bytes):
+        self.max_steps = max_steps
+        self.max_bytes = max_bytes
+        self.enforce_limits()
+        self.changed.emit()
+    def trim(self, amount):
+        freed = 0
+        while freed < amount and len(self.undo_steps) > UNDO_TRIM_FLOOR:
+            step = self.undo_steps.pop(0)
+            self.bytes -= step.size
+            freed += step.size
+        if freed:
+            self.changed.emit()
+        return freed
+    def reset_shadow(self):
+        self.lines = self.document.toRawText().split('\u2029')
+        self.length = self.document.characterCount() - 1
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.bytes = 0
+        self.changed.emit()
+    def shadow_bytes(self):
+        return sum(sys.getsizeof(line) for line in self.lines) + sys.getsizeof(self.lines)
+    def advance(self, line, column, units):
+        while units > 0:
+            text = self.lines[line]
+            remaining = utf16_length(text) - column
+            if units <= remaining:
+                return line, column + units
+            if line + 1 >= len(self.lines):
+                return line, column + remaining
+            units -= remaining + 1
+            line += 1
+            column = 0
+        return line, column
+    def on_contents_change(self, position, removed, added):
+        count = self.document.characterCount()
+        if position == 0 and (added >= count or removed > self.length):
+            self.reset_shadow()
+            self.clear()
+            return
+        first_block = self.document.findBlock(position)
+        first = first_block.blockNumber()
+        column = position - first_block.position()
+        end_line, end_column = self.advance(first, column, removed)
+        first_text = self.lines[first]
+        start_index = utf16_index(first_text, column)
+        if end_line == first:
+            removed_text = first_text[start_index:utf16_index(first_text, end_column)]
+        else:
+            end_text = self.lines[end_line]
+            removed_text = '\n'.join(
+                [first_text[start_index:]] + self.lines[first + 1:end_line] + [end_text[:utf16_index(end_text, end_column)]]
+            )
+        last_block = self.document.findBlock(min(position + added, count - 1))
+        new_lines = []
+        block = first_block
+        while block.isValid():
+            new_lines.append(block.text())
+            if block == last_block:
+                break
+            block = block.next()
+        self.lines[first:end_line + 1] = new_lines
+        self.length = count - 1
+        region = '\n'.join(new_lines)
+        added_text = region[start_index:utf16_index(region, column + added)]
+        if removed_text == added_text or self.applying:
+            return
+        self.record(UndoStep(position, removed_text, added_text, time.monotonic()))
+    def record(self, step):
+        for redo_step in self.redo_steps:
+            self.bytes -= redo_step.size
+        self.redo_steps.clear()
+        last = self.undo_steps[-1] if self.undo_steps else None
+        if (last is not None and step.timestamp - last.timestamp < self.merge_interval
+                and step.kind() == last.kind() != "replace" and '\n' not in step.added
+                and last.size + step.size < 1024):
+            merged = merge_undo_steps(last, step)
+            if merged is not None:
+                self.undo_steps[-1] = merged
+                self.bytes += merged.size - last.size
+                self.changed.emit()
+                return
+        self.undo_steps.append(step)
+        self.bytes += step.size
+        self.enforce_limits()
+        self.changed.emit()
+    def over_limits(self):
+        return len(self.undo_steps) > self.max_steps or self.bytes > self.max_bytes
+    def compact(self):
+        half = len(self.undo_steps) // 2
+        merged = []
+        for step in self.undo_steps[:half]:
+            if merged and merged[-1].size + step.size <= self.merge_limit:
+                combined = merge_undo_steps(merged[-1], step)
+                if combined is not None:
+                    merged[-1] = combined
+                    continue
+            merged.append(step)
+        self.undo_steps[:half] = merged
+        self.bytes = sum(step.size for step in self.undo_steps) + sum(step.size for step in self.redo_steps)
+    def enforce_limits(self):
+        if not self.over_limits():
+            return
+        self.compact()
+        while self.over_limits() and self.undo_steps:
+            self.bytes -= self.undo_steps.pop(0).size
+    def apply(self, position, length, text):
+        cursor = QTextCursor(self.document)
+        self.applying = True
+        try:
+            cursor.beginEditBlock()
+            cursor.setPosition(position)
+            cursor.setPosition(position + length, QTextCursor.MoveMode.KeepAnchor)
+            cursor.insertText(text)
+            cursor.endEditBlock()
+        finally:
+            self.applying = False
+        editor_cursor = self.editor.textCursor()
+        editor_cursor.setPosition(min(position + utf16_length(text), self.document.characterCount() - 1))
+        self.editor.setTextCursor(editor_cursor)
+    def undo(self):
+        if not self.undo_steps:
+            return
+        step = self.undo_steps.pop()
+        self.apply(step.position, utf16_length(step.added), step.removed)
+        step.timestamp = 0
+        self.redo_steps.append(step)
+        self.changed.emit()
+    def redo(self):
+        if not self.redo_steps:
+            return
+        step = self.redo_steps.pop()
+        self.apply(step.position, utf16_length(step.removed), step.added)
+        self.undo_steps.append(step)
+        self.changed.emit()
+def myers_hunks(old, new, max_edits=None):
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]:
+        suffix += 1
+    a = old[prefix:len(old) - suffix]
+    b = new[prefix:len(new) - suffix]
+    n, m = len(a), len(b)
+    if not n or not m:
+        return [[prefix, prefix + m, prefix, prefix + n]] if n or m else []
+    max_d = n + m if max_edits is None else min(n + m, max_edits)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+    for d in range(max_d + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return backtrack_hunks(trace, d, n, m, prefix)
+    return None
+def backtrack_hunks(trace, depth, x, y, shift):
+    deleted = []
+    inserted = []
+    for d in range(depth, 0, -1):
+        row = trace[d]
+        k = x - y
+        def at(index):
+            return row[index + d + 1]
+        if k == -d or (k != d and at(k - 1) < at(k + 1)):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = at(previous_k)
+        previous_y = previous_x - previous_k
+        x, y = previous_x, previous_y
+        if previous_k == k + 1:
+            inserted.append(previous_y)
+        else:
+            deleted.append(previous_x)
+    deleted.reverse()
+    inserted.reverse()
+    hunks = []
+    deleted_index = inserted_index = 0
+    old_position = new_position = 0
+    while deleted_index < len(deleted) or inserted_index < len(inserted):
+        next_deleted = deleted[deleted_index] if deleted_index < len(deleted) else None
+        next_inserted = inserted[inserted_index] if inserted_index < len(inserted) else None
+        gap = min(
+            next_deleted - old_position if next_deleted is not None else float('inf'),
+            next_inserted - new_position if next_inserted is not None else float('inf')
+        )
+        old_position += gap
+        new_position += gap
+        old_start, new_start = old_position, new_position
+        while deleted_index < len(deleted) and deleted[deleted_index] == old_position:
+            deleted_index += 1
+            old_position += 1
+        while inserted_index < len(inserted) and inserted[inserted_index] == new_position:
+            inserted_index += 1
+            new_position += 1
+        hunks.append([new_start + shift, new_position + shift, old_start + shift, old_position + shift])
+    return hunks
+def opcode_hunks(old, new, old_offset=0, new_offset=0):
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [
+        [new_offset + j1, new_offset + j2, old_offset + i1, old_offset + i2]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal'
+    ]
+class DiffThread(QThread):
+    finished_diff = Signal(int, object)
+    def __init__(self, parent=None, max_edits=20000):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self.pending = None
+        self.active = False
+        self.max_edits = max_edits
+    def request(self, generation, base, current):
+        with self.lock:
+            self.pending = (generation, base, current)
+            start = not self.active
+            self.active = True
+        if start:
+            self.wait()
+            self.start()
+    def run(self):
+        while True:
+            with self.lock:
+                job = self.pending
+                self.pending = None
+                if job is None:
+                    self.active = False
+                    return
+            generation, base, current = job
+            hunks = myers_hunks(base, current, self.max_edits)
+            if hunks is None:
+                hunks = opcode_hunks(base, current)
+            self.finished_diff.emit(generation, hunks)
+class SavedDiff(QObject):
+    changed = Signal()
+    def __init__(self, editor, incremental_limit=4000):
+        super().__init__(editor)
+        self.editor = editor
+        self.document = editor.document()
+        self.incremental_limit = incremental_limit
+        self.base = None
+        self.current = self.block_hashes()
+        self.hunks = []
+        self.generation = 0
+        self.pending = False
+        self.thread = DiffThread(self)
+        self.thread.finished_diff.connect(self.on_full_diff)
+        self.document.contentsChange.connect(self.on_contents_change)
+    def block_hashes(self, first=0, last=None):
+        hashes = []
+        block = self.document.findBlockByNumber(first)
+        while block.isValid() and (last is None or block.blockNumber() <= last):
+            hashes.append(hash(block.text()))
+            block = block.next()
+        return hashes
+    def set_base(self, text):
+        self.base = None if text is None else [hash(line) for line in text.split('\n')]
+        self.current = list(self.base) if text is not None and text == self.editor.snapshot().text else self.block_hashes()
+        self.hunks = []
+        if self.base is not None and self.base != self.current:
+            self.request_full_diff()
+        else:
+            self.pending = False
+            self.changed.emit()
+    def request_full_diff(self):
+        self.generation += 1
+        self.pending = True
+        self.thread.request(self.generation, self.base, list(self.current))
+    def on_full_diff(self, generation, hunks):
+        if generation != self.generation:
+            return
+        self.hunks = hunks
+        self.pending = False
+        self.changed.emit()
+    def on_contents_change(self, position, removed, added):
+        count = self.document.blockCount()
+        delta = count - len(self.current)
+        first = self.document.findBlock(position).blockNumber()
+        last = self.document.findBlock(min(position + added, self.document.characterCount() - 1)).blockNumber()
+        old_last = last - delta
+        self.current[first:old_last + 1] = self.block_hashes(first, last)
+        if self.base is None:
+            return
+        if self.pending:
+            self.request_full_diff()
+            return
+        before = []
+        overlapping = []
+        after = []
+        for hunk in self.hunks:
+            if hunk[1] < first:
+                before.append(hunk)
+            elif hunk[0] > old_last + 1:
+                after.append(hunk)
+            else:
+                overlapping.append(hunk)
+        offset = sum((hunk[3] - hunk[2]) - (hunk[1] - hunk[0]) for hunk in before)
+        low = min([first] + [hunk[0] for hunk in overlapping])
+        high = max([old_last + 1] + [hunk[1] for hunk in overlapping])
+        base_low = overlapping[0][2] if overlapping and overlapping[0][0] == low else low + offset
+        offset += sum((hunk[3] - hunk[2]) - (hunk[1] - hunk[0]) for hunk in overlapping)
+        base_high = overlapping[-1][3] if overlapping and overlapping[-1][1] == high else high + offset
+        if (high + delta - low) + (base_high - base_low) > self.incremental_limit:
+            self.request_full_diff()
+            return
+        region = opcode_hunks(self.base[base_low:base_high], self.current[low:high + delta], base_low, low)
+        self.hunks = before + region + [[hunk[0] + delta, hunk[1] + delta, hunk[2], hunk[3]] for hunk in after]
+        self.changed.emit()
+    def markers(self, first, last):
+        markers = {}
+        index = max(0, bisect.bisect_right(self.hunks, [first]) - 1)
+        while index < len(self.hunks) and self.hunks[index][0] <= last:
+            cur_start, cur_end, base_start, base_end = self.hunks[index]
+            if cur_start == cur_end:
+                markers.setdefault(cur_start, "deleted")
+            else:
+                kind = "added" if base_start == base_end else "modified"
+                for line in range(max(first, cur_start), min(last + 1, cur_end)):
+                    markers[line] = kind
+            index += 1
+        return markers
+class FoldManager(QObject):
+    changed = Signal()
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        self.folds = {}
+        self.block_count = editor.document().blockCount()
+        editor.document().contentsChange.connect(self.on_contents_change)
+    def in_fence(self, block):
+        previous = block.previous()
+        return previous.isValid() and previous.userState() > 0 and previous.userState() & 1
+    def heading_level(self, block):
+        text = block.text()
+        if not text.startswith('#') or self.in_fence(block):
+            return 0
+        match = HEADING_PATTERN.match(text)
+        return len(match.group(1)) if match else 0
+    def is_foldable(self, block):
+        if self.in_fence(block):
+            return False
+        state = block.userState()
+        return bool(state > 0 and state & 1) or self.heading_level(block) > 0
+    def fold_end(self, block):
+        if self.in_fence(block):
+            return None
+        state = block.userState()
+        if state > 0 and state & 1:
+            end = block.next()
+            while end.isValid() and end.userState() > 0 and end.userState() & 1:
+                end = end.next()
+            last = end if end.isValid() else self.editor.document().lastBlock()
+        else:
+            level = self.heading_level(block)
+            if not level:
+                return None
+            last = block
+            end = block.next()
+            while end.isValid():
+                end_level = self.heading_level(end)
+                if end_level and end_level <= level:
+                    break
+                last = end
+                end = end.next()
+        return last.blockNumber() if last.blockNumber() > block.blockNumber() else None
+    def hides(self, number):
+        return any(header < number <= end for header, end in self.folds.items())
+    def fold(self, block):
+        number = block.blockNumber()
+        if number in self.folds:
+            return False
+        end = self.fold_end(block)
+        if end is None:
+            return False
+        cursor = self.editor.textCursor()
+        if number < cursor.blockNumber() <= end:
+            cursor.setPosition(block.position())
+            self.editor.setTextCursor(cursor)
+        self.folds[number] = end
+        self.editor.set_blocks_visible(number + 1, end, False)
+        self.changed.emit()
+        return True
+    def unfold(self, number):
+        end = self.folds.pop(number, None)
+        if end is None:
+            return False
+        self.show_range(number + 1, end)
+        self.changed.emit()
+        return True
+    def toggle(self, block):
+        return self.unfold(block.blockNumber()) or self.fold(block)
+    def show_range(self, first, last):
+        start = first
+        for header, end in sorted(self.folds.items()):
+            if header < start or header > last:
+                continue
+            self.editor.set_blocks_visible(start, header, True)
+            start = end + 1
+        if start <= last:
+            self.editor.set_blocks_visible(start, last, True)
+    def reveal(self, number):
+        headers = sorted(header for header, end in self.folds.items() if header < number <= end)
+        for header in headers:
+            self.unfold(header)
+        return bool(headers)
+    def fold_all(self):
+        block = self.editor.document().begin()
+        while block.isValid():
+            if self.is_foldable(block):
+                self.fold(block)
+            block = self.editor.next_visible_block(block)
+    def unfold_all(self):
+        if not self.folds:
+            return
+        self.folds.clear()
+        self.editor.set_blocks_visible(0, self.editor.document().blockCount() - 1, True)
+        self.changed.emit()
+    def on_contents_change(self, position, removed, added):
+        doc = self.editor.document()
+        count = doc.blockCount()
+        delta = count - self.block_count
+        self.block_count = count
+        if not self.folds:
+            return
+        first = doc.findBlock(position).blockNumber()
+        last = doc.findBlock(position + added).blockNumber()
+        old_last = last - delta
+        folds = {}
+        touched = []
+        for header, end in self.folds.items():
+            if end < first:
+                folds[header] = end
+            elif header > old_last:
+                folds[header + delta] = end + delta
+            elif header == first == old_last and not delta and self.is_foldable(doc.findBlockByNumber(header)):
+                folds[header] = end
+            else:
+                touched.append((header, min(end + delta, count - 1)))
+        self.folds = folds
+        for header, end in touched:
+            self.show_range(min(header + 1, first), end)
+        if touched:
+            self.changed.emit()
+class TextSnapshot:
+    def __init__(self, revision, text):
+        self.revision = revision
+        self.text = text
+        self.line_starts = None
+    def block_range(self, first, last):
+        if self.line_starts is None:
+            self.line_starts = [0] + [match.end() for match in re.finditer('\n', self.text)]
+        if first >= len(self.line_starts):
+            return ""
+        start = self.line_starts[first]
+        end = self.line_starts[last] - 1 if last < len(self.line_starts) else len(self.text)
+        return self.text[start:max(start, end)]
+class DocumentSnapshots(QObject):
+    def __init__(self, document):
+        super().__init__(document)
+        self.document = document
+        self.revision = 0
+        self.current = None
+        document.contentsChange.connect(self.on_contents_change)
+    def on_contents_change(self, position, removed, added):
+        self.revision += 1
+        self.current = None
+    def snapshot(self):
+        if self.current is None:
+            self.current = TextSnapshot(self.revision, self.document.toPlainText())
+        return self.current
+    def block_range(self, first, last):
+        if self.current is not None:
+            return self.current.block_range(first, last)
+        lines = []
+        block = self.document.findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() < last:
+            lines.append(block.text())
+            block = block.next()
+        return '\n'.join(lines)
+class HighlightScheduler(QObject):
+    def __init__(self, editor, batch_ms=8):
+        super().__init__(editor)
+        self.editor = editor
+        self.highlighter = editor.highlighter
+        self.batch_ms = batch_ms
+        self.pending = bytearray()
+        self.next_block = 0
+        self.remaining = 0
+        self.block_count = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.process_batch)
+        editor.document().contentsChange.connect(self.on_contents_change)
+        editor.verticalScrollBar().valueChanged.connect(self.reprioritize)
+        editor.updateRequest.connect(self.on_update_request)
+    def load_text(self, text, states=None):
+        self.timer.stop()
+        self.highlighter.deferred = True
+        self.highlighter.restored_states = states
+        try:
+            self.editor.setPlainText(text)
+        finally:
+            self.highlighter.deferred = False
+            self.highlighter.restored_states = None
+        self.block_count = self.editor.document().blockCount()
+        self.pending = bytearray(b'\x01') * self.block_count
+        self.remaining = self.block_count
+        self.next_block = 0
+        self.highlight_visible()
+        if states is None:
+            self.timer.start()
+    def on_update_request(self, rect, dy):
+        if self.remaining and not self.highlighter.deferred:
+            self.highlight_visible()
+    def on_contents_change(self, position, removed, added):
+        doc = self.editor.document()
+        count = doc.blockCount()
+        delta = count - self.block_count
+        self.block_count = count
+        if self.highlighter.deferred or not self.remaining:
+            return
+        first = doc.findBlock(position).blockNumber()
+        last = doc.findBlock(position + added).blockNumber()
+        if delta > 0:
+            self.pending[first + 1:first + 1] = bytes(delta)
+        elif delta < 0:
+            del self.pending[first + 1:first + 1 - delta]
+        for number in range(first, min(last, count - 1) + 1):
+            self.pending[number] = 0
+        self.remaining = self.pending.count(1)
+        if not self.remaining:
+            self.timer.stop()
+    def reprioritize(self):
+        if self.remaining:
+            self.next_block = self.editor.firstVisibleBlock().blockNumber()
+            self.highlight_visible()
+    def highlight_visible(self):
+        block = self.editor.firstVisibleBlock()
+        offset = self.editor.contentOffset()
+        bottom = self.editor.viewport().rect().bottom()
+        blocked = self.editor.blockSignals(True)
+        try:
+            while block.isValid():
+                if self.editor.blockBoundingGeometry(block).translated(offset).top() > bottom:
+                    break
+                self.highlight_block(block)
+                block = self.editor.next_visible_block(block)
+        finally:
+            self.editor.blockSignals(blocked)
+        self.remaining = self.pending.count(1)
+    def highlight_block(self, block):
+        number = block.blockNumber()
+        if number < len(self.pending) and self.pending[number]:
+            self.pending[number] = 0
+            self.highlighter.rehighlightBlock(block)
+    def process_batch(self):
+        doc = self.editor.document()
+        deadline = time.perf_counter() + self.batch_ms / 1000
+        blocked = self.editor.blockSignals(True)
+        try:
+            while time.perf_counter() < deadline:
+                number = self.pending.find(1, self.next_block)
+                if number < 0:
+                    number = self.pending.find(1)
+                    if number < 0:
+                        break
+                self.next_block = number + 1
+                self.highlight_block(doc.findBlockByNumber(number))
+        finally:
+            self.editor.blockSignals(blocked)
+        self.remaining = self.pending.count(1)
+        if not self.remaining:
+            self.timer.stop()
+class SessionStore:
+    def __init__(self, path=os.path.join(CACHE_DIR, "session.json"), max_files=20):
+        self.path = path
+        self.max_files = max_files
+        self.current = None
+        self.files = {}
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("version") == SESSION_VERSION:
+                self.current = data.get("current")
+                self.files = data.get("files", {})
+        except (OSError, ValueError):
+            self.current = None
+            self.files = {}
+    def save(self):
+        atomic_write(self.path, json.dumps({"version": SESSION_VERSION, "current": self.current, "files": self.files}))
+    def get(self, path):
+        return self.files.get(os.path.abspath(path))
+    def put(self, path, entry):
+        path = os.path.abspath(path)
+        self.files.pop(path, None)
+        self.files[path] = entry
+        while len(self.files) > self.max_files:
+            del self.files[next(iter(self.files))]
+def text_digest(text):
+    return hashlib.sha1(text.encode('utf-8', errors='surrogatepass')).hexdigest()
+class MemoryBudget(QObject):
+    evicted = Signal(object)
+    def __init__(self, parent=None, budget=512 * 1024 * 1024, interval=15000):
+        super().__init__(parent)
+        self.budget = budget
+        self.consumers = {}
+        self.evictions = []
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.enforce)
+        self.timer.start()
+    def register(self, name, size, evict=None, priority=0):
+        self.consumers[name] = (size, evict, priority)
+    def unregister(self, name):
+        self.consumers.pop(name, None)
+    def set_budget(self, budget):
+        self.budget = budget
+        self.enforce()
+    def usage(self):
+        rows = []
+        for name, (size, evict, priority) in self.consumers.items():
+            try:
+                value = int(size())
+            except RuntimeError:
+                value = 0
+            rows.append((name, value, priority, evict is not None))
+        return rows
+    def total(self):
+        return sum(row[1] for row in self.usage())
+    def cache_budget(self, rows, budget=None):
+        budget = self.budget if budget is None else budget
+        fixed = sum(row[1] for row in rows if not row[3])
+        return max(budget - fixed, int(budget * MEMORY_CACHE_SHARE))
+    def enforce(self, budget=None, max_priority=None):
+        rows = self.usage()
+        cache_budget = self.cache_budget(rows, budget)
+        caches = sum(row[1] for row in rows if row[3])
+        if caches <= cache_budget:
+            return []
+        target = caches - int(cache_budget * 0.9)
+        evicted = []
+        for name, value, priority, evictable in sorted(rows, key=lambda row: row[2]):
+            if target <= 0:
+                break
+            if not evictable or not value or (max_priority is not None and priority > max_priority):
+                continue
+            freed = self.consumers[name][1](target) or 0
+            if freed:
+                target -= freed
+                evicted.append((name, freed))
+        if evicted:
+            self.evictions = (self.evictions + [(time.time(), evicted)])[-20:]
+            self.evicted.emit(evicted)
+        return evicted
+    def report(self, top=15):
+        rows = sorted(self.usage(), key=lambda row: -row[1])
+        lines = [f"Бюджет: {format_size(self.budget)}, учтено: {format_size(sum(row[1] for row in rows))}, "
+                 f"доступно кэшам: {format_size(self.cache_budget(rows))}", ""]
+        for name, value, priority, evictable in rows:
+            lines.append(f"{name}: {format_size(value)}" + (f" (вытесняется, приоритет {priority})" if evictable else ""))
+        lines.append("")
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"tracemalloc: выделено {format_size(current)}, пик {format_size(peak)}")
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:top]:
+                frame = stat.traceback[0]
+                lines.append(f"  {frame.filename}:{frame.lineno}: {format_size(stat.size)} в {stat.count} объектах")
+        else:
+            lines.append("tracemalloc выключен: размеры выше — оценки")
+        if self.evictions:
+            lines.append("")
+            lines.append("Последние вытеснения:")
+            for moment, evicted in self.evictions[-5:]:
+                freed = ", ".join(f"{name} {format_size(size)}" for name, size in evicted)
+                lines.append(f"  {time.strftime('%H:%M:%S', time.localtime(moment))}: {freed}")
+        return "\n".join(lines)
+class MemoryReportDialog(QDialog):
+    def __init__(self, budget, parent=None):
+        super().__init__(parent)
+        self.budget = budget
+        self.setWindowTitle("Использование памяти")
+        self.setWindowIcon(QIcon("Markdown_Editor.ico"))
+        self.resize(700, 450)
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        layout.addWidget(self.text)
+        self.tracing = QCheckBox("Трассировка tracemalloc (замедляет работу)")
+        self.tracing.setChecked(tracemalloc.is_tracing())
+        self.tracing.toggled.connect(self.toggle_tracing)
+        layout.addWidget(self.tracing)
+        button_layout = QHBoxLayout()
+        refresh_button = QPushButton("Обновить")
+        refresh_button.clicked.connect(self.refresh)
+        button_layout.addWidget(refresh_button)
+        release_button = QPushButton("Освободить кэши")
+        release_button.clicked.connect(self.release)
+        button_layout.addWidget(release_button)
+        close_button = QPushButton("Закрыть")
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+        self.refresh()
+    def toggle_tracing(self, checked):
+        if checked:
+            tracemalloc.start(1)
+        else:
+            tracemalloc.stop()
+        self.refresh()
+    def release(self):
+        self.budget.enforce(0, max_priority=MEMORY_CACHE_PRIORITY)
+        self.refresh()
+    def refresh(self):
+        self.text.setPlainText(self.budget.report())
+class RenderCache:
+    def __init__(self, directory=os.path.join(CACHE_DIR, "render"), max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = None
+        self.lock = threading.Lock()
+    def key(self, text, options):
+        digest = hashlib.sha256(f"{RENDERER_VERSION}\0{options}\0".encode('utf-8'))
+        digest.update(text.encode('utf-8', errors='surrogatepass'))
+        return digest.hexdigest()
+    def _load_entries(self):
+        self.entries = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.html'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                self.entries[name[:-5]] = [stat.st_size, stat.st_mtime]
+    def get(self, key):
+        path = os.path.join(self.directory, f"{key}.html")
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                html = file.read()
+            os.utime(path)
+        except (OSError, UnicodeDecodeError):
+            return None
+        with self.lock:
+            if self.entries is not None and key in self.entries:
+                self.entries[key][1] = time.time()
+        return html
+    def put(self, key, html):
+        path = os.path.join(self.directory, f"{key}.html")
+        data = html.encode('utf-8', errors='surrogatepass')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        with self.lock:
+            if self.entries is None:
+                self._load_entries()
+            self.entries[key] = [len(data), time.time()]
+            self.evict()
+    def evict(self):
+        total = sum(size for size, used in self.entries.values())
+        if total <= self.max_bytes:
+            return
+        for key, (size, used) in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(os.path.join(self.directory, f"{key}.html"))
+            except OSError:
+                pass
+            total -= size
+            del self.entries[key]
+def render_formula_png(tex, display, dpi):
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import mathtext
+    from matplotlib.font_manager import FontProperties
+    buffer = io.BytesIO()
+    try:
+        mathtext.math_to_image(f"${tex}$", buffer, prop=FontProperties(size=14 if display else 12), dpi=dpi, format='png')
+    except Exception:
+        return None
+    return buffer.getvalue()
+def math_inline_rule(state, silent):
+    src = state.src
+    pos = state.pos
+    if src[pos] != '$':
+        return False
+    delimiter = '$$' if src.startswith('$$', pos) else '$'
+    start = pos + len(delimiter)
+    end = src.find(delimiter, start)
+    while end != -1 and src[end - 1] == '\\':
+        end = src.find(delimiter, end + 1)
+    if end == -1 or end == start:
+        return False
+    content = src[start:end]
+    if delimiter == '$' and (content[0].isspace() or content[-1].isspace() or src[end + 1:end + 2].isdigit()):
+        return False
+    if not silent:
+        token = state.push('math_inline', 'math', 0)
+        token.content = content
+        token.markup = delimiter
+    state.pos = end + len(delimiter)
+    return True
+def math_block_rule(state, start_line, end_line, silent):
+    if state.sCount[start_line] - state.blkIndent >= 4:
+        return False
+    line = state.src[state.bMarks[start_line] + state.tShift[start_line]:state.eMarks[start_line]]
+    if not line.startswith('$$'):
+        return False
+    rest = line[2:].rstrip()
+    next_line = start_line + 1
+    if rest.endswith('$$'):
+        content = rest[:-2]
+    else:
+        lines = [rest]
+        while True:
+            if next_line >= end_line:
+                return False
+            text = state.src[state.bMarks[next_line] + state.tShift[next_line]:state.eMarks[next_line]].rstrip()
+            next_line += 1
+            if text.endswith('$$'):
+                lines.append(text[:-2])
+                break
+            lines.append(text)
+        content = '\n'.join(lines)
+    if not content.strip():
+        return False
+    if silent:
+        return True
+    state.line = next_line
+    token = state.push('math_block', 'math', 0)
+    token.block = True
+    token.content = content.strip()
+    token.markup = '$$'
+    token.map = [start_line, next_line]
+    return True
+class MathRenderer(QObject):
+    formula_ready = Signal()
+    def __init__(self, parent=None, directory=os.path.join(CACHE_DIR, "math"), dpi=120, max_workers=None, inline=False):
+        super().__init__(parent)
+        self.directory = directory
+        self.dpi = dpi
+        self.max_workers = max_workers
+        self.inline = inline
+        self.memory = {}
+        self.pending = {}
+        self.crashes = {}
+        self.lock = threading.RLock()
+        self.pool = None
+        self.closed = False
+    def key(self, tex, display):
+        return hashlib.sha1(f"{MATH_VERSION}:{int(display)}:{self.dpi}:{tex}".encode('utf-8')).hexdigest()
+    def html(self, tex, display, env=None, wait=False):
+        key = self.key(tex, display)
+        with self.lock:
+            uri = self.memory.get(key)
+        if uri is None:
+            try:
+                with open(os.path.join(self.directory, f"{key}.png"), 'rb') as file:
+                    uri = "data:image/png;base64," + base64.b64encode(file.read()).decode('ascii')
+                with self.lock:
+                    self.memory[key] = uri
+            except OSError:
+                pass
+        if uri is None and wait:
+            uri = self.wait_for(key, tex, display)
+        if uri:
+            image = f'<img class="math" src="{uri}" alt="{escape_html(tex)}">'
+            return f'<div class="math-display">{image}</div>\n' if display else image
+        if uri is None:
+            if env is not None:
+                env["math_incomplete"] = True
+            self.submit(key, tex, display)
+        code = f'<code class="math">{escape_html(tex)}</code>'
+        return f'<div class="math-display">{code}</div>\n' if display else code
+    def submit(self, key, tex, display):
+        if self.closed or not MATPLOTLIB_AVAILABLE:
+            return None
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            for attempt in range(2):
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                pool = self.pool
+                try:
+                    future = pool.submit(render_formula_png, tex, display, self.dpi)
+                    break
+                except BrokenProcessPool:
+                    self.drop_pool(pool)
+            else:
+                return None
+            self.pending[key] = future
+        future.add_done_callback(lambda future: self.on_done(key, future, pool))
+        return future
+    def drop_pool(self, pool=None):
+        with self.lock:
+            if self.pool is not None and pool in (None, self.pool):
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
+    def wait_for(self, key, tex, display, timeout=60):
+        if self.inline:
+            if not MATPLOTLIB_AVAILABLE:
+                return None
+            return self.store(key, render_formula_png(tex, display, self.dpi))
+        future = self.submit(key, tex, display)
+        if future is None:
+            return None
+        try:
+            data = future.result(timeout)
+        except Exception:
+            return None
+        return "data:image/png;base64," + base64.b64encode(data).decode('ascii') if data else ""
+    def on_done(self, key, future, pool=None):
+        if self.closed:
+            return
+        try:
+            data = future.result()
+        except BrokenProcessPool:
+            self.drop_pool(pool)
+            with self.lock:
+                self.pending.pop(key, None)
+                self.crashes[key] = self.crashes.get(key, 0) + 1
+                retry = self.crashes[key] < 2
+            if retry and not self.closed:
+                self.formula_ready.emit()
+            if retry:
+                return
+            data = None
+        except Exception:
+            data = None
+        self.store(key, data)
+        if not self.closed:
+            self.formula_ready.emit()
+    def store(self, key, data):
+        if data:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"{key}.png")
+                with open(f"{path}.{os.getpid()}.tmp", 'wb') as file:
+                    file.write(data)
+                os.replace(f"{path}.{os.getpid()}.tmp", path)
+            except OSError:
+                pass
+        uri = "data:image/png;base64," + base64.b64encode(data).decode('ascii') if data else ""
+        with self.lock:
+            self.pending.pop(key, None)
+            self.memory[key] = uri
+        return uri
+    def memory_bytes(self):
+        with self.lock:
+            return sum(len(uri) + 100 for uri in self.memory.values())
+    def evict_memory(self, amount):
+        freed = 0
+        with self.lock:
+            while freed < amount and self.memory:
+                freed += len(self.memory.pop(next(iter(self.memory)))) + 100
+        return freed
+    def shutdown(self):
+        self.closed = True
+        self.drop_pool()
+PLUGIN_DIR = os.path.join(os.path.expanduser("~"), ".config", "markdown-editor", "plugins")
+PLUGIN_RULE_SAMPLE = 16
+class RenderPlugin:
+    name = "plugin"
+    fences = ()
+    budget_ms = 20.0
+    deferrable = True
     def __init__(self):
+        self.state = "active"
+        self.overrun_size = 0
+        self.renders = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+    def setup(self, renderer):
+        pass
+    def render_fence(self, code, info):
+        return None
+    def process_tokens(self, tokens, env):
+        pass
+    def record(self, elapsed_ms):
+        self.renders += 1
+        self.last_ms = elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.total_ms += elapsed_ms
+class MathPlugin(RenderPlugin):
+    name = "math"
+    budget_ms = 50.0
+    def __init__(self, math):
+        super().__init__()
+        self.math = math
+    def setup(self, renderer):
+        wait = renderer.export
+        renderer.add_block_rule(self, 'math_block', math_block_rule, before='fence')
+        renderer.add_inline_rule(self, 'math_inline', math_inline_rule, after='escape')
+        renderer.add_render_rule(self, 'math_inline', lambda render, tokens, idx, options, env: self.math.html(tokens[idx].content, False, env, wait))
+        renderer.add_render_rule(self, 'math_block', lambda render, tokens, idx, options, env: self.math.html(tokens[idx].content, True, env, wait))
+def load_render_plugins(directory=PLUGIN_DIR):
+    plugins = []
+    if not os.path.isdir(directory):
+        return plugins
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.py') or name.startswith('_'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            spec = importlib.util.spec_from_file_location(f"markdown_editor_plugin_{name[:-3]}", path)
+            module = importlib.util.module_from_spec(spec)
+            module.RenderPlugin = RenderPlugin
+            spec.loader.exec_module(module)
+            for plugin in getattr(module, "PLUGINS", []):
+                plugins.append(plugin() if isinstance(plugin, type) else plugin)
+        except Exception as error:
+            print(f"Warning: failed to load render plugin {path}: {error}")
+    return plugins
+class BackgroundRenderThread(QThread):
+    rendered = Signal(str, object, bool)
+    def __init__(self, renderer_factory, parent=None):
+        super().__init__(parent)
+        self.renderer_factory = renderer_factory
+        self.renderer = None
+        self.lock = threading.Lock()
+        self.pending = None
+        self.active = False
+    def request(self, text):
+        with self.lock:
+            self.pending = text
+            start = not self.active
+            self.active = True
+        if start:
+            self.wait()
+            self.start()
+    def run(self):
+        if self.renderer is None:
+            self.renderer = self.renderer_factory()
+        while True:
+            with self.lock:
+                text = self.pending
+                self.pending = None
+                if text is None:
+                    self.active = False
+                    return
+            blocks = self.renderer.render_blocks(text)
+            with self.lock:
+                stale = self.pending is not None
+            if not stale:
+                self.rendered.emit(text, blocks, self.renderer.complete)
+PREVIEW_CSS = """
+body {
+    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Helvetica, Arial, sans-serif;
+    line-height: 1.6;
+    padding: 20px;
+    max-width: 800px;
+    margin: 0 auto;
+}
+h1, h2, h3, h4, h5, h6 {
+    margin-top: 24px;
+    margin-bottom: 16px;
+    font-weight: 600;
+    color: #0366d6;
+}
+h1 { font-size: 2em; padding-bottom: .3em; border-bottom: 1px solid #eaecef; }
+h2 { font-size: 1.5em; padding-bottom: .3em; border-bottom: 1px solid #eaecef; }
+h3 { font-size: 1.25em; }
+h4 { font-size: 1em; }
+p, blockquote, ul, ol, table {
+    margin-bottom: 16px;
+}
+code {
+    font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, Courier, monospace;
+    padding: 0.2em 0.4em;
+    margin: 0;
+    font-size: 85%;
+    background-color: rgba(27, 31, 35, 0.05);
+    border-radius: 3px;
+}
+pre {
+    font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, Courier, monospace;
+    padding: 16px;
+    overflow: auto;
+    font-size: 85%;
+    line-height: 1.45;
+    background-color: #f6f8fa;
+    border-radius: 3px;
+}
+pre code {
+    background-color: transparent;
+    padding: 0;
+    margin: 0;
+    font-size: 100%;
+    word-break: normal;
+    white-space: pre;
+    border: 0;
+}
+blockquote {
+    padding: 0 1em;
+    color: #6a737d;
+    border-left: 0.25em solid #dfe2e5;
+}
+ul, ol {
+    padding-left: 2em;
+}
+a {
+    color: #0366d6;
+    text-decoration: none;
+}
+a:hover {
+    text-decoration: underline;
+}
+table {
+    border-spacing: 0;
+    border-collapse: collapse;
+    width: 100%;
+    overflow: auto;
+}
+table th, table td {
+    padding: 6px 13px;
+    border: 1px solid #dfe2e5;
+}
+table tr {
+    background-color: #fff;
+    border-top: 1px solid #c6cbd1;
+}
+table tr:nth-child(2n) {
+    background-color: #f6f8fa;
+}
+img {
+    max-width: 100%;
+}
+.code-block {
+    margin-bottom: 16px;
+}
+img.math {
+    vertical-align: middle;
+}
+.math-display {
+    text-align: center;
+    margin: 16px 0;
+}
+"""
+class MarkdownRenderer:
+    def __init__(self, cache=None, math=None, plugins=(), background=False, background_factor=20, export=False):
         self.md = None
+        self.cache = cache
+        self.math = math
+        self.complete = True
+        self.background = background or export
+        self.export = export
+        self.background_factor = background_factor
+        self.needs_background = False
+        self.last_blocks = None
+        self.plugins = []
+        self.plugin_rules = {}
+        self.plugin_fences = {}
+        self.plugin_time = {}
+        self.applied_states = {}
+        self.last_render_ms = 0.0
+        self.data_uri_token = f"data-uri-{os.urandom(4).hex()}-"
+        self.data_uri_placeholder = re.compile(re.escape(self.data_uri_token) + r'(\d+)')
+        self.options_key = "markdown-it:commonmark:html,linkify,typographer" if MARKDOWN_IT_AVAILABLE else "basic"
         if MARKDOWN_IT_AVAILABLE:
             self.md = MarkdownIt("commonmark", {"html": True, "linkify": True, "typographer": True})
             def highlight_code(code, lang, attrs):
@@ -142,13 +2467,159 @@ class MarkdownRenderer:
                 except:
                     return f'<pre><code>{code}</code></pre>'
             self.md.options.highlight = highlight_code
+            default_fence = self.md.renderer.rules['fence']
+            def render_fence(renderer, tokens, idx, options, env):
+                token = tokens[idx]
+                language = token.info.strip().split(maxsplit=1)[0].lower() if token.info.strip() else ""
+                plugin = self.plugin_fences.get(language)
+                if plugin is not None and self.plugin_enabled(plugin):
+                    html = self.run_plugin(plugin, plugin.render_fence, token.content, token.info)
+                    if html is not None:
+                        return html
+                return default_fence(tokens, idx, options, env)
+            self.md.add_render_rule('fence', render_fence)
+            if self.math is not None:
+                self.register_plugin(MathPlugin(self.math))
+        for plugin in plugins:
+            self.register_plugin(plugin)
+    def register_plugin(self, plugin):
+        self.plugins.append(plugin)
+        self.plugin_rules[plugin.name] = []
+        for language in plugin.fences:
+            self.plugin_fences[language.lower()] = plugin
+        if self.md is not None:
+            plugin.setup(self)
+        if plugin.name != "math":
+            self.options_key += f"+{plugin.name}"
+    def timed(self, plugin, function, sample=1):
+        calls = 0
+        def wrapper(*args):
+            nonlocal calls
+            calls += 1
+            if calls % sample:
+                return function(*args)
+            started = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self.plugin_time[plugin.name] = self.plugin_time.get(plugin.name, 0.0) + (time.perf_counter() - started) * sample
+        return wrapper
+    def run_plugin(self, plugin, function, *args):
+        try:
+            return self.timed(plugin, function)(*args)
+        except Exception as error:
+            plugin.state = "disabled"
+            print(f"Warning: render plugin {plugin.name} failed and was disabled: {error}")
+            return None
+    def add_inline_rule(self, plugin, name, rule, after='escape'):
+        self.md.inline.ruler.after(after, name, self.timed(plugin, rule, PLUGIN_RULE_SAMPLE))
+        self.plugin_rules[plugin.name].append(name)
+    def add_block_rule(self, plugin, name, rule, before='fence', alt=("paragraph", "reference", "blockquote", "list")):
+        self.md.block.ruler.before(before, name, self.timed(plugin, rule, PLUGIN_RULE_SAMPLE), {"alt": list(alt)})
+        self.plugin_rules[plugin.name].append(name)
+    def add_render_rule(self, plugin, token_type, function):
+        self.md.add_render_rule(token_type, self.timed(plugin, function))
+    def plugin_enabled(self, plugin):
+        if self.export:
+            return plugin.state != "disabled"
+        if plugin.state in ("disabled", "suspended"):
+            return False
+        return self.background or plugin.state == "active"
+    def apply_plugin_states(self):
+        for plugin in self.plugins:
+            enabled = self.plugin_enabled(plugin)
+            if self.applied_states.get(plugin.name) != enabled and self.plugin_rules[plugin.name]:
+                if enabled:
+                    self.md.enable(self.plugin_rules[plugin.name], ignoreInvalid=True)
+                else:
+                    self.md.disable(self.plugin_rules[plugin.name], ignoreInvalid=True)
+            self.applied_states[plugin.name] = enabled
+    def review_plugins(self, size):
+        for plugin in self.plugins:
+            if plugin.state in ("deferred", "suspended") and size * 2 <= plugin.overrun_size:
+                plugin.state = "active"
+    def finish_plugins(self, started, size):
+        self.last_render_ms = (time.perf_counter() - started) * 1000
+        self.needs_background = False
+        if self.export:
+            return
+        for plugin in self.plugins:
+            if not self.plugin_enabled(plugin):
+                self.needs_background = self.needs_background or plugin.state == "deferred"
+                continue
+            elapsed = self.plugin_time.get(plugin.name, 0.0) * 1000
+            plugin.record(elapsed)
+            if self.background:
+                if elapsed > plugin.budget_ms * self.background_factor:
+                    plugin.state = "suspended"
+                    plugin.overrun_size = size
+                elif plugin.state == "deferred" and elapsed <= plugin.budget_ms / 2:
+                    plugin.state = "active"
+            elif elapsed > plugin.budget_ms:
+                plugin.state = "deferred" if plugin.deferrable else "suspended"
+                plugin.overrun_size = size
+                self.needs_background = self.needs_background or plugin.deferrable
+    def plugin_report(self):
+        return [(plugin.name, plugin.state, plugin.last_ms, plugin.max_ms, plugin.budget_ms) for plugin in self.plugins]
     def render(self, text):
+        return self.wrap_blocks(self.render_blocks(text))
+    def wrap_blocks(self, blocks):
+        return self._wrap_html(''.join(blocks))
+    def hide_data_uris(self, text):
+        uris = []
+        if 'data:' not in text:
+            return text, uris
+        def replace(match):
+            uris.append(match.group(0))
+            return f"{self.data_uri_token}{len(uris) - 1}"
+        return DATA_URI_PATTERN.sub(replace, text), uris
+    def restore_data_uris(self, blocks, uris):
+        if not uris:
+            return blocks
+        restore = lambda match: uris[int(match.group(1))] if int(match.group(1)) < len(uris) else match.group(0)
+        return [self.data_uri_placeholder.sub(restore, block) if self.data_uri_token in block else block for block in blocks]
+    def render_blocks(self, text):
+        text, uris = self.hide_data_uris(text)
+        return self.restore_data_uris(self.render_opaque_blocks(text), uris)
+    def render_opaque_blocks(self, text):
         if MARKDOWN_IT_AVAILABLE and self.md:
-            html = self.md.render(text)
-            return self._wrap_html(html)
+            started = time.perf_counter()
+            self.plugin_time = {}
+            self.review_plugins(len(text))
+            self.apply_plugin_states()
+            env = {}
+            tokens = self.md.parse(text, env)
+            for plugin in self.plugins:
+                if type(plugin).process_tokens is not RenderPlugin.process_tokens and self.plugin_enabled(plugin):
+                    self.run_plugin(plugin, plugin.process_tokens, tokens, env)
+            blocks = []
+            start = 0
+            depth = 0
+            for index, token in enumerate(tokens):
+                depth += token.nesting
+                if depth == 0:
+                    blocks.append(self.md.renderer.render(tokens[start:index + 1], self.md.options, env))
+                    start = index + 1
+            self.finish_plugins(started, len(text))
+            self.complete = not env.get("math_incomplete") and not self.needs_background
+            return blocks
+        else:
+            return [self._basic_render(text)]
+    def render_cached(self, text):
+        self.last_blocks = None
+        key = self.cache.key(text, self.options_key) if self.cache is not None else None
+        html = self.cache.get(key) if key is not None else None
+        if html is None:
+            self.last_blocks = self.render_blocks(text)
+            html = self.wrap_blocks(self.last_blocks)
+            if key is not None and self.complete:
+                self.cache.put(key, html)
         else:
-            html = self._basic_render(text)
-            return self._wrap_html(html)
+            self.needs_background = False
+        return html
+    def store(self, text, html):
+        if self.cache is not None and self.complete:
+            self.cache.put(self.cache.key(text, self.options_key), html)
     def _basic_render(self, text):
         text = re.sub(r'^# (.+)$', r'<h1>\1</h1>', text, flags=re.MULTILINE)
         text = re.sub(r'^## (.+)$', r'<h2>\1</h2>', text, flags=re.MULTILINE)
@@ -179,90 +2650,7 @@ class MarkdownRenderer:
         <head>
             <meta charset="UTF-8">
             <style>
-                body {{
-                    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Helvetica, Arial, sans-serif;
-                    line-height: 1.6;
-                    padding: 20px;
-                    max-width: 800px;
-                    margin: 0 auto;
-                }}
-                h1, h2, h3, h4, h5, h6 {{
-                    margin-top: 24px;
-                    margin-bottom: 16px;
-                    font-weight: 600;
-                    color: #0366d6;
-                }}
-                h1 {{ font-size: 2em; padding-bottom: .3em; border-bottom: 1px solid #eaecef; }}
-                h2 {{ font-size: 1.5em; padding-bottom: .3em; border-bottom: 1px solid #eaecef; }}
-                h3 {{ font-size: 1.25em; }}
-                h4 {{ font-size: 1em; }}
-                p, blockquote, ul, ol, table {{
-                    margin-bottom: 16px;
-                }}
-                code {{
-                    font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, Courier, monospace;
-                    padding: 0.2em 0.4em;
-                    margin: 0;
-                    font-size: 85%;
-                    background-color: rgba(27, 31, 35, 0.05);
-                    border-radius: 3px;
-                }}
-                pre {{
-                    font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, Courier, monospace;
-                    padding: 16px;
-                    overflow: auto;
-                    font-size: 85%;
-                    line-height: 1.45;
-                    background-color: #f6f8fa;
-                    border-radius: 3px;
-                }}
-                pre code {{
-                    background-color: transparent;
-                    padding: 0;
-                    margin: 0;
-                    font-size: 100%;
-                    word-break: normal;
-                    white-space: pre;
-                    border: 0;
-                }}
-                blockquote {{
-                    padding: 0 1em;
-                    color: #6a737d;
-                    border-left: 0.25em solid #dfe2e5;
-                }}
-                ul, ol {{
-                    padding-left: 2em;
-                }}
-                a {{
-                    color: #0366d6;
-                    text-decoration: none;
-                }}
-                a:hover {{
-                    text-decoration: underline;
-                }}
-                table {{
-                    border-spacing: 0;
-                    border-collapse: collapse;
-                    width: 100%;
-                    overflow: auto;
-                }}
-                table th, table td {{
-                    padding: 6px 13px;
-                    border: 1px solid #dfe2e5;
-                }}
-                table tr {{
-                    background-color: #fff;
-                    border-top: 1px solid #c6cbd1;
-                }}
-                table tr:nth-child(2n) {{
-                    background-color: #f6f8fa;
-                }}
-                img {{
-                    max-width: 100%;
-                }}
-                .code-block {{
-                    margin-bottom: 16px;
-                }}
+{PREVIEW_CSS}
             </style>
         </head>
         <body>
@@ -270,19 +2658,956 @@ class MarkdownRenderer:
         </body>
         </html>
         """
+PREVIEW_SERVER_SCRIPT = """
+<script>
+(function () {
+    var content = document.getElementById('content');
+    var source = new EventSource('/events?v=__VERSION__');
+    source.onmessage = function (event) {
+        var data = JSON.parse(event.data);
+        document.title = data.title;
+        var existing = {};
+        Array.prototype.forEach.call(content.children, function (node) {
+            existing[node.getAttribute('data-block')] = node;
+        });
+        var fragment = document.createDocumentFragment();
+        data.order.forEach(function (key) {
+            var node = existing[key];
+            if (!node) {
+                node = document.createElement('div');
+                node.setAttribute('data-block', key);
+                node.innerHTML = data.blocks[key] || '';
+            }
+            fragment.appendChild(node);
+        });
+        content.replaceChildren(fragment);
+    };
+})();
+</script>
+"""
+class PreviewServer:
+    def __init__(self, renderer, host="127.0.0.1", port=0):
+        self.renderer = renderer
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.error = None
+        self.clients = set()
+        self.title = "Markdown Editor"
+        self.blocks = []
+        self.version = 0
+        self.etag = '"0"'
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+    def start(self):
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(ready,), name="preview-server", daemon=True)
+        self.thread.start()
+        ready.wait(5)
+        if self.error is not None:
+            raise self.error
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join(2)
+        self.thread = None
+    def _run(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.handle_client, self.host, self.port))
+        except OSError as e:
+            self.error = e
+            ready.set()
+            self.loop.close()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+    def publish(self, title, blocks):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._publish, title, list(blocks))
+    def _publish(self, title, blocks):
+        keyed = []
+        seen = {}
+        for html in blocks:
+            digest = hashlib.sha1(html.encode('utf-8', errors='surrogatepass')).hexdigest()[:16]
+            seen[digest] = seen.get(digest, 0) + 1
+            keyed.append((f"{digest}-{seen[digest]}", html))
+        known = {key for key, html in self.blocks}
+        message = self._message(title, keyed, known)
+        self.title = title
+        self.blocks = keyed
+        self.version += 1
+        self.etag = '"' + hashlib.sha1(f"{self.version}:{title}".encode('utf-8') + b''.join(key.encode('ascii') for key, html in keyed)).hexdigest() + '"'
+        for queue in self.clients:
+            queue.put_nowait(message)
+    def _message(self, title, keyed, known=()):
+        return json.dumps({
+            "title": title,
+            "order": [key for key, html in keyed],
+            "blocks": {key: html for key, html in keyed if key not in known},
+        })
+    def page(self):
+        body = ''.join(f'<div data-block="{key}">{html}</div>' for key, html in self.blocks)
+        page = self.renderer._wrap_html(f'<div id="content">{body}</div>')
+        page = page.replace('<head>', f'<head><title>{escape_html(self.title)}</title>', 1)
+        return page.replace('</body>', PREVIEW_SERVER_SCRIPT.replace('__VERSION__', str(self.version)) + '</body>', 1)
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                path, _, query = target.partition('?')
+                if path == '/events' and method == 'GET':
+                    await self.stream_events(writer, query)
+                    break
+                await self.respond(writer, method, path, headers)
+                if headers.get('connection', '').lower() == 'close' or version.strip() == 'HTTP/1.0':
+                    break
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+    async def respond(self, writer, method, path, headers):
+        if method not in ('GET', 'HEAD'):
+            status, body, content_type = "405 Method Not Allowed", b"", "text/plain"
+        elif path != '/':
+            status, body, content_type = "404 Not Found", b"Not Found", "text/plain"
+        elif headers.get('if-none-match') == self.etag:
+            status, body, content_type = "304 Not Modified", b"", None
+        else:
+            status, body, content_type = "200 OK", self.page().encode('utf-8', errors='surrogatepass'), "text/html; charset=utf-8"
+        lines = [f"HTTP/1.1 {status}", f"ETag: {self.etag}", "Cache-Control: no-cache", f"Content-Length: {len(body)}"]
+        if content_type:
+            lines.append(f"Content-Type: {content_type}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(body)
+        await writer.drain()
+    async def stream_events(self, writer, query):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+        queue = asyncio.Queue()
+        self.clients.add(queue)
+        try:
+            if query != f"v={self.version}":
+                queue.put_nowait(self._message(self.title, self.blocks))
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), 15)
+                    writer.write(f"data: {message}\n\n".encode('utf-8', errors='surrogatepass'))
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+SITE_VERSION = 1
+SITE_MANIFEST_NAME = ".site-manifest.json"
+INCLUDE_PATTERN = re.compile(r'^[ \t]*<!--\s*include:\s*(\S+?)\s*-->[ \t]*$', re.MULTILINE)
+ANCHOR_HREF_PATTERN = re.compile(r'<a href="([^"]*)"')
+HEADING_TAG_PATTERN = re.compile(r'<h([1-6])>(.*?)</h\1>', re.DOTALL)
+SITE_CSS = """
+.site-nav {
+    display: flex;
+    gap: 16px;
+    padding-bottom: 8px;
+    border-bottom: 1px solid #eaecef;
+}
+.site-nav .next {
+    margin-left: auto;
+}
+.toc {
+    font-size: 90%;
+}
+a.broken-link {
+    color: #cb2431;
+    text-decoration: line-through;
+}
+"""
+SITE_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<title>{title}</title>
+<link rel="stylesheet" href="{prefix}style.css">
+</head>
+<body>
+<nav class="site-nav">{navigation}</nav>
+{toc}
+<main>
+{body}
+</main>
+</body>
+</html>
+"""
+site_page_renderer = None
+def init_site_worker(plugin_dir=PLUGIN_DIR, math_dir=os.path.join(CACHE_DIR, "math")):
+    global site_page_renderer
+    site_page_renderer = MarkdownRenderer(math=MathRenderer(directory=math_dir, inline=True),
+                                          plugins=load_render_plugins(plugin_dir), export=True)
+def render_site_page(text):
+    if site_page_renderer is None:
+        init_site_worker()
+    return ''.join(site_page_renderer.render_blocks(text))
+def site_plugins_state(plugin_dir=PLUGIN_DIR):
+    try:
+        names = sorted(name for name in os.listdir(plugin_dir) if name.endswith('.py') and not name.startswith('_'))
+    except OSError:
+        return []
+    state = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(plugin_dir, name))
+        except OSError:
+            continue
+        state.append([name, stat.st_mtime_ns, stat.st_size])
+    return state
+def add_heading_ids(body):
+    headings = []
+    slugs = {}
+    def replace(match):
+        title = re.sub(r'<[^>]+>', '', match.group(2))
+        anchor = slugify_heading(unescape_html(title))
+        if anchor in slugs:
+            slugs[anchor] += 1
+            anchor = f"{anchor}-{slugs[anchor]}"
+        else:
+            slugs[anchor] = 0
+        headings.append((int(match.group(1)), title, anchor))
+        return f'<h{match.group(1)} id="{anchor}">{match.group(2)}</h{match.group(1)}>'
+    return HEADING_TAG_PATTERN.sub(replace, body), headings
+class SiteBuilder:
+    def __init__(self, root, output, workers=None, progress=None, plugin_dir=PLUGIN_DIR, cache_dir=CACHE_DIR):
+        self.root = os.path.abspath(root)
+        self.output = os.path.abspath(output)
+        self.workers = workers
+        self.progress = progress
+        self.plugin_dir = plugin_dir
+        self.math_dir = os.path.join(cache_dir, "math")
+        self.manifest_path = os.path.join(self.output, SITE_MANIFEST_NAME)
+        self.texts = {}
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != SITE_VERSION or manifest.get("renderer") != RENDERER_VERSION:
+            return {}
+        return manifest
+    def collect_sources(self):
+        sources = {}
+        for path in iter_markdown_files(self.root):
+            if path.startswith(self.output + os.sep):
+                continue
+            sources[os.path.relpath(path, self.root).replace(os.sep, '/')] = path
+        return sources
+    def resolve(self, rel, target):
+        return os.path.normpath(os.path.join(os.path.dirname(rel), unquote(target))).replace(os.sep, '/')
+    def read_page(self, rel, path, old):
+        stat = os.stat(path)
+        if old and old["mtime"] == stat.st_mtime_ns and old["size"] == stat.st_size:
+            return dict(old)
+        with open(path, 'rb') as file:
+            data = file.read()
+        digest = hashlib.sha1(data).hexdigest()
+        text = data.decode('utf-8', errors='replace')
+        self.texts[rel] = text
+        if old and old["hash"] == digest:
+            record = dict(old)
+        else:
+            parsed = parse_markdown_document(text)
+            title = next((heading[1] for heading in parsed["headings"] if heading[0] == 1), None)
+            record = {
+                "hash": digest,
+                "title": title or os.path.splitext(os.path.basename(rel))[0],
+                "headings": [heading[:3] for heading in parsed["headings"] if heading[0] <= 2],
+                "includes": [self.resolve(rel, match.group(1)) for match in INCLUDE_PATTERN.finditer(text)],
+                "links": sorted({self.resolve(rel, urlsplit(target).path) for target, line, is_image in parsed["links"]
+                                 if not is_image and not urlsplit(target).scheme and urlsplit(target).path.lower().endswith(MARKDOWN_EXTENSIONS)}),
+                "images": sorted({self.resolve(rel, urlsplit(target).path) for target, line, is_image in parsed["links"]
+                                  if is_image and not urlsplit(target).scheme and urlsplit(target).path and not target.startswith('/')}),
+            }
+        record["mtime"] = stat.st_mtime_ns
+        record["size"] = stat.st_size
+        return record
+    def text(self, rel, sources):
+        if rel not in self.texts:
+            with open(sources[rel], 'r', encoding='utf-8', errors='replace') as file:
+                self.texts[rel] = file.read()
+        return self.texts[rel]
+    def expand_includes(self, rel, sources, stack=()):
+        def replace(match):
+            target = self.resolve(rel, match.group(1))
+            if target in stack or target not in sources:
+                return match.group(0)
+            return self.expand_includes(target, sources, stack + (rel,))
+        return INCLUDE_PATTERN.sub(replace, self.text(rel, sources))
+    def include_closure(self, rel, pages, seen=None):
+        seen = set() if seen is None else seen
+        for target in pages[rel]["includes"]:
+            if target not in seen:
+                seen.add(target)
+                if target in pages:
+                    self.include_closure(target, pages, seen)
+        return seen
+    def output_path(self, rel):
+        return os.path.join(self.output, os.path.splitext(rel)[0] + ".html")
+    def page_link(self, from_rel, to_rel):
+        return os.path.relpath(os.path.splitext(to_rel)[0] + ".html", os.path.dirname(from_rel) or '.').replace(os.sep, '/')
+    def index_name(self, pages):
+        return "contents.html" if "index.md" in pages else "index.html"
+    def page_html(self, rel, body, pages):
+        def replace_link(match):
+            href = unescape_html(match.group(1))
+            parts = urlsplit(href)
+            if parts.scheme or parts.netloc or not parts.path.lower().endswith(MARKDOWN_EXTENSIONS) or parts.path.startswith('/'):
+                return match.group(0)
+            target = self.resolve(rel, parts.path)
+            if target not in pages:
+                return f'<a class="broken-link" href="{match.group(1)}"'
+            fragment = f"#{parts.fragment}" if parts.fragment else ""
+            return f'<a href="{escape_html(self.page_link(rel, target) + fragment)}"'
+        body = ANCHOR_HREF_PATTERN.sub(replace_link, body)
+        body, headings = add_heading_ids(body)
+        prefix = '../' * rel.count('/')
+        navigation = [f'<a href="{prefix}{self.index_name(pages)}">Содержание</a>']
+        previous_rel, next_rel = pages[rel]["nav"]
+        if previous_rel:
+            navigation.append(f'<a class="previous" href="{self.page_link(rel, previous_rel)}">← {escape_html(pages[previous_rel]["title"])}</a>')
+        if next_rel:
+            navigation.append(f'<a class="next" href="{self.page_link(rel, next_rel)}">{escape_html(pages[next_rel]["title"])} →</a>')
+        toc_items = [f'<li><a href="#{anchor}">{title}</a></li>' for level, title, anchor in headings if level in (2, 3)]
+        toc = f'<ul class="toc">{"".join(toc_items)}</ul>' if len(toc_items) > 1 else ""
+        return SITE_PAGE_TEMPLATE.format(title=escape_html(pages[rel]["title"]), prefix=prefix,
+                                         navigation=''.join(navigation), toc=toc, body=body)
+    def index_html(self, pages, order):
+        items = []
+        directory = None
+        for rel in order:
+            current = os.path.dirname(rel)
+            if current != directory:
+                if directory is not None:
+                    items.append('</ul>')
+                directory = current
+                if current:
+                    items.append(f'<h2>{escape_html(current)}</h2>')
+                items.append('<ul>')
+            link = self.page_link("", rel)
+            sections = ''.join(f'<li><a href="{link}#{anchor}">{escape_html(title)}</a></li>'
+                               for level, title, anchor in pages[rel]["headings"] if level == 2)
+            items.append(f'<li><a href="{link}">{escape_html(pages[rel]["title"])}</a>' + (f'<ul>{sections}</ul>' if sections else '') + '</li>')
+        if directory is not None:
+            items.append('</ul>')
+        return SITE_PAGE_TEMPLATE.format(title="Содержание", prefix="", navigation="", toc="",
+                                         body="<h1>Содержание</h1>\n" + '\n'.join(items))
+    def build(self):
+        manifest = self.load_manifest()
+        old_pages = manifest.get("pages", {})
+        css_path = os.path.join(self.root, "style.css")
+        if os.path.isfile(css_path):
+            with open(css_path, 'r', encoding='utf-8', errors='replace') as file:
+                css = file.read()
+        else:
+            css = PREVIEW_CSS + SITE_CSS
+        css_hash = hashlib.sha1(css.encode('utf-8')).hexdigest()
+        plugins_state = site_plugins_state(self.plugin_dir)
+        full = manifest.get("css") != css_hash or manifest.get("plugins") != plugins_state
+        sources = self.collect_sources()
+        pages = {rel: self.read_page(rel, path, old_pages.get(rel)) for rel, path in sources.items()}
+        changed = {rel for rel in pages if rel not in old_pages or pages[rel]["hash"] != old_pages[rel]["hash"]}
+        removed = set(old_pages) - set(pages)
+        membership = set(pages) ^ set(old_pages)
+        order = sorted(pages)
+        for position, rel in enumerate(order):
+            pages[rel]["nav"] = [order[position - 1] if position else None,
+                                 order[position + 1] if position + 1 < len(order) else None]
+        titles_changed = {rel for rel in changed if rel in old_pages and pages[rel]["title"] != old_pages[rel]["title"]}
+        dirty = []
+        for rel in order:
+            record = pages[rel]
+            old = old_pages.get(rel, {})
+            if (full or rel in changed or not os.path.exists(self.output_path(rel))
+                    or self.include_closure(rel, pages) & (changed | membership)
+                    or set(record["links"]) & membership
+                    or record["nav"] != old.get("nav")
+                    or set(n for n in record["nav"] if n) & titles_changed):
+                dirty.append(rel)
+        texts = [self.expand_includes(rel, sources) for rel in dirty]
+        done = 0
+        if len(dirty) > 4 and self.workers != 1:
+            with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=init_site_worker, initargs=(self.plugin_dir, self.math_dir)) as pool:
+                for rel, body in zip(dirty, pool.map(render_site_page, texts, chunksize=max(1, len(dirty) // 64))):
+                    atomic_write(self.output_path(rel), self.page_html(rel, body, pages))
+                    done += 1
+                    if self.progress:
+                        self.progress(done, len(dirty))
+        elif dirty:
+            init_site_worker(self.plugin_dir, self.math_dir)
+            for rel, text in zip(dirty, texts):
+                atomic_write(self.output_path(rel), self.page_html(rel, render_site_page(text), pages))
+                done += 1
+                if self.progress:
+                    self.progress(done, len(dirty))
+        for rel in removed:
+            try:
+                os.remove(self.output_path(rel))
+            except OSError:
+                pass
+        index_path = os.path.join(self.output, self.index_name(pages))
+        index_state = hashlib.sha1(json.dumps([[rel, pages[rel]["title"], pages[rel]["headings"]] for rel in order]).encode('utf-8')).hexdigest()
+        if full or index_state != manifest.get("index") or not os.path.exists(index_path):
+            atomic_write(index_path, self.index_html(pages, order))
+        if full or not os.path.exists(os.path.join(self.output, "style.css")):
+            atomic_write(os.path.join(self.output, "style.css"), css)
+        assets = manifest.get("assets", {})
+        copied = {}
+        for image in sorted({image for record in pages.values() for image in record["images"]}):
+            source = os.path.join(self.root, image)
+            if image.startswith('../') or not os.path.isfile(source):
+                continue
+            stat = os.stat(source)
+            copied[image] = [stat.st_mtime_ns, stat.st_size]
+            target = os.path.join(self.output, image)
+            if assets.get(image) != copied[image] or not os.path.exists(target):
+                with open(source, 'rb') as file:
+                    atomic_write(target, file.read())
+        atomic_write(self.manifest_path, json.dumps({
+            "version": SITE_VERSION, "renderer": RENDERER_VERSION, "css": css_hash, "plugins": plugins_state,
+            "index": index_state, "pages": pages, "assets": copied,
+        }))
+        return {"pages": len(pages), "built": len(dirty), "removed": len(removed)}
+class SiteBuildThread(QThread):
+    progress = Signal(int, int)
+    build_finished = Signal(object)
+    build_failed = Signal(str)
+    def __init__(self, root, output, parent=None, plugin_dir=PLUGIN_DIR, cache_dir=CACHE_DIR):
+        super().__init__(parent)
+        self.builder = SiteBuilder(root, output, progress=self.progress.emit, plugin_dir=plugin_dir, cache_dir=cache_dir)
+    def run(self):
+        try:
+            self.build_finished.emit(self.builder.build())
+        except Exception as e:
+            self.build_failed.emit(str(e))
+def run_site_build(root, output, workers=None):
+    start = time.perf_counter()
+    stats = SiteBuilder(root, output, workers).build()
+    print(f"Страниц: {stats['pages']}, собрано: {stats['built']}, удалено: {stats['removed']}, "
+          f"{time.perf_counter() - start:.2f} с")
+    return 0
+def replace_in_text(text, pattern, replacement, literal, preview_limit=None):
+    pieces = []
+    changes = []
+    count = 0
+    last = 0
+    line_number = 1
+    counted = 0
+    group_start = None
+    group_end = 0
+    group_pieces = []
+    position = 0
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        if start == end:
+            continue
+        value = replacement if literal else match.expand(replacement)
+        pieces.append(text[last:start])
+        pieces.append(value)
+        last = end
+        count += 1
+        if group_start is not None and start <= group_end:
+            group_pieces.extend((text[position:start], value))
+        else:
+            if group_start is not None:
+                changes.append((line_number, text[group_start:group_end], ''.join(group_pieces) + text[position:group_end]))
+                group_start = None
+            if preview_limit is not None and len(changes) >= preview_limit:
+                continue
+            group_start = text.rfind('\n', 0, start) + 1
+            line_number += text.count('\n', counted, group_start)
+            counted = group_start
+            group_pieces = [text[group_start:start], value]
+        group_end = text.find('\n', end)
+        if group_end < 0:
+            group_end = len(text)
+        position = end
+    if group_start is not None:
+        changes.append((line_number, text[group_start:group_end], ''.join(group_pieces) + text[position:group_end]))
+    pieces.append(text[last:])
+    return ''.join(pieces), count, changes
+def read_replace_source(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    return data.decode('utf-8'), hashlib.sha1(data).hexdigest()
+def scan_replace_file(task):
+    path, source, flags, replacement, literal, preview_limit = task
+    try:
+        text, digest = read_replace_source(path)
+        new_text, count, changes = replace_in_text(text, re.compile(source, flags), replacement, literal, preview_limit)
+    except (OSError, UnicodeDecodeError):
+        return None
+    except (re.error, IndexError) as e:
+        return {"path": path, "error": str(e)}
+    if not count:
+        return None
+    return {"path": path, "hash": digest, "count": count, "changes": changes}
+def apply_replace_file(task):
+    path, digest, source, flags, replacement, literal = task
+    try:
+        text, current = read_replace_source(path)
+        if current != digest:
+            return path, "conflict"
+        new_text, count, changes = replace_in_text(text, re.compile(source, flags), replacement, literal, 0)
+        atomic_write(path, new_text, os.stat(path).st_mode & 0o7777)
+    except (OSError, UnicodeDecodeError, re.error, IndexError) as e:
+        return path, str(e)
+    return path, None
+class WorkspaceReplaceThread(QThread):
+    progress = Signal(int, int)
+    finished_job = Signal(str, object)
+    def __init__(self, parent=None, workers=None):
+        super().__init__(parent)
+        self.workers = workers
+        self.mode = None
+        self.tasks = []
+        self.cancelled = False
+    def scan(self, root, pattern, replacement, literal, exclude=(), preview_limit=100):
+        self.mode = "scan"
+        self.root = root
+        self.tasks = (pattern.pattern, pattern.flags, replacement, literal, preview_limit, set(exclude))
+        self.cancelled = False
+        self.start()
+    def apply(self, files, pattern, replacement, literal):
+        self.mode = "apply"
+        self.tasks = [(path, digest, pattern.pattern, pattern.flags, replacement, literal) for path, digest in files]
+        self.cancelled = False
+        self.start()
+    def cancel(self):
+        self.cancelled = True
+    def run(self):
+        if self.mode == "scan":
+            source, flags, replacement, literal, preview_limit, exclude = self.tasks
+            tasks = [
+                (path, source, flags, replacement, literal, preview_limit)
+                for path in iter_markdown_files(self.root) if os.path.abspath(path) not in exclude
+            ]
+            worker = scan_replace_file
+        else:
+            tasks = self.tasks
+            worker = apply_replace_file
+        results = []
+        done = 0
+        if len(tasks) > 16 and self.workers != 1:
+            with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                for result in pool.map(worker, tasks, chunksize=max(1, len(tasks) // 64)):
+                    if self.cancelled:
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        break
+                    results.append(result)
+                    done += 1
+                    if done & 63 == 0:
+                        self.progress.emit(done, len(tasks))
+        else:
+            for task in tasks:
+                if self.cancelled:
+                    break
+                results.append(worker(task))
+                done += 1
+                self.progress.emit(done, len(tasks))
+        if self.mode == "scan":
+            results = sorted((result for result in results if result is not None), key=lambda result: result["path"])
+        self.finished_job.emit(self.mode, results)
+class ExportCancelled(Exception):
+    pass
+class ExportDocument:
+    def __init__(self, path, text=None):
+        self.path = path
+        self.text = text
+        self.lock = threading.Lock()
+        self.rendered = None
+        self.blocks = None
+    def name(self):
+        return os.path.basename(self.path) if self.path else "Без имени"
+    def source(self):
+        with self.lock:
+            if self.text is None:
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    self.text = file.read()
+            return self.text
+    def html(self, renderer):
+        text = self.source()
+        with self.lock:
+            if self.rendered is None:
+                self.rendered = renderer.render_cached(text)
+            return self.rendered
+    def docx_blocks(self):
+        text = self.source()
+        with self.lock:
+            if self.blocks is None:
+                self.blocks = parse_docx_blocks(text)
+            return self.blocks
+def parse_docx_blocks(text):
+    blocks = []
+    for line in text.split('\n'):
+        heading = re.match(r'^(#{1,4}) ', line)
+        if heading:
+            blocks.append(("heading", len(heading.group(1)), line[len(heading.group(0)):]))
+        elif line.startswith('- ') or line.startswith('* '):
+            blocks.append(("paragraph", 'List Bullet', line[2:]))
+        elif re.match(r'^\d+\.\s', line):
+            blocks.append(("paragraph", 'List Number', re.sub(r'^\d+\.\s', '', line)))
+        elif line.strip():
+            line = re.sub(r'\*\*(.*?)\*\*', r'\1', line)
+            line = re.sub(r'\*(.*?)\*', r'\1', line)
+            line = re.sub(r'`(.*?)`', r'\1', line)
+            line = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', line)
+            blocks.append(("paragraph", None, line))
+        else:
+            blocks.append(("paragraph", None, ''))
+    return blocks
+def export_html_file(document, path, renderer, cancelled):
+    html = document.html(renderer)
+    if cancelled():
+        raise ExportCancelled()
+    atomic_write(path, html)
+def export_pdf_file(document, path, renderer, cancelled):
+    html = document.html(renderer)
+    if cancelled():
+        raise ExportCancelled()
+    text_document = QTextDocument()
+    if document.path:
+        text_document.setBaseUrl(QUrl.fromLocalFile(os.path.dirname(os.path.abspath(document.path)) + '/'))
+    text_document.setHtml(html)
+    writer = QPdfWriter(path)
+    writer.setTitle(document.name())
+    text_document.print(writer)
+def export_docx_file(document, path, renderer, cancelled):
+    try:
+        from docx import Document
+    except ImportError:
+        raise RuntimeError("Для экспорта в DOCX требуется библиотека python-docx (pip install python-docx)")
+    blocks = document.docx_blocks()
+    output = Document()
+    output.add_heading("Документ Markdown", 0)
+    for number, (kind, option, text) in enumerate(blocks):
+        if number % 500 == 0 and cancelled():
+            raise ExportCancelled()
+        if kind == "heading":
+            output.add_heading(text, level=option)
+        elif option:
+            output.add_paragraph(text, style=option)
+        else:
+            output.add_paragraph(text)
+    output.save(path)
+EXPORT_FORMATS = {
+    "html": ("HTML", ".html", export_html_file),
+    "pdf": ("PDF", ".pdf", export_pdf_file),
+    "docx": ("DOCX", ".docx", export_docx_file),
+}
+EXPORT_STATUS_LABELS = {
+    "queued": "В очереди",
+    "running": "Выполняется",
+    "done": "Готово",
+    "failed": "Ошибка",
+    "cancelled": "Отменено",
+}
+class ExportJob:
+    def __init__(self, document, format, output):
+        self.document = document
+        self.format = format
+        self.output = output
+        self.status = "queued"
+        self.error = ""
+        self.cancelled = False
+        self.runnable = None
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+class ExportRunnable(QRunnable):
+    def __init__(self, queue, job):
+        super().__init__()
+        self.queue = queue
+        self.job = job
+        self.setAutoDelete(False)
+    def run(self):
+        self.queue.run_job(self.job)
+class ExportQueue(QObject):
+    job_updated = Signal(object)
+    def __init__(self, renderer_factory, parent=None, workers=None):
+        super().__init__(parent)
+        self.renderer_factory = renderer_factory
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(workers or min(4, os.cpu_count() or 1))
+        self.local = threading.local()
+        self.batch = []
+    def renderer(self):
+        renderer = getattr(self.local, "renderer", None)
+        if renderer is None:
+            renderer = self.local.renderer = self.renderer_factory()
+        return renderer
+    def submit(self, jobs):
+        if all(job.finished() for job in self.batch):
+            self.batch = []
+        self.batch.extend(jobs)
+        for job in jobs:
+            self.job_updated.emit(job)
+            job.runnable = ExportRunnable(self, job)
+            self.pool.start(job.runnable)
+    def run_job(self, job):
+        if job.cancelled:
+            return
+        job.status = "running"
+        self.job_updated.emit(job)
+        try:
+            EXPORT_FORMATS[job.format][2](job.document, job.output, self.renderer(), lambda: job.cancelled)
+            job.status = "done"
+        except ExportCancelled:
+            job.status = "cancelled"
+        except Exception as error:
+            job.status = "failed"
+            job.error = str(error)
+        self.job_updated.emit(job)
+    def progress(self):
+        return sum(job.finished() for job in self.batch), len(self.batch)
+    def cancel_all(self):
+        for job in self.batch:
+            if job.finished():
+                continue
+            job.cancelled = True
+            if job.runnable is not None and self.pool.tryTake(job.runnable):
+                job.status = "cancelled"
+                self.job_updated.emit(job)
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.waitForDone()
+class ExportDialog(QDialog):
+    def __init__(self, parent=None, current_name="", output=""):
+        super().__init__(parent)
+        self.parent = parent
+        self.setWindowTitle("Экспорт")
+        self.setWindowIcon(QIcon("Markdown_Editor.ico"))
+        self.setMinimumWidth(450)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Файлы:"))
+        self.files = QListWidget()
+        item = QListWidgetItem(f"{current_name} (текущий документ)")
+        item.setData(Qt.ItemDataRole.UserRole, "")
+        item.setCheckState(Qt.CheckState.Checked)
+        self.files.addItem(item)
+        layout.addWidget(self.files)
+        add_button = QPushButton("Добавить файлы...")
+        add_button.clicked.connect(self.add_files)
+        layout.addWidget(add_button)
+        formats_group = QGroupBox("Форматы")
+        formats_layout = QHBoxLayout()
+        self.format_boxes = {}
+        for format, (label, extension, writer) in EXPORT_FORMATS.items():
+            box = QCheckBox(label)
+            box.setChecked(format == "html")
+            formats_layout.addWidget(box)
+            self.format_boxes[format] = box
+        formats_group.setLayout(formats_layout)
+        layout.addWidget(formats_group)
+        output_layout = QHBoxLayout()
+        output_layout.addWidget(QLabel("Папка:"))
+        self.output_input = QLineEdit(output)
+        output_layout.addWidget(self.output_input)
+        browse_button = QPushButton("Обзор...")
+        browse_button.clicked.connect(self.browse_output)
+        output_layout.addWidget(browse_button)
+        layout.addLayout(output_layout)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+    def add_files(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Добавить файлы", self.output_input.text(), "Markdown Files (*.md *.markdown);;All Files (*)")
+        for path in paths:
+            item = QListWidgetItem(path)
+            item.setData(Qt.ItemDataRole.UserRole, path)
+            item.setCheckState(Qt.CheckState.Checked)
+            self.files.addItem(item)
+    def browse_output(self):
+        directory = QFileDialog.getExistingDirectory(self, "Папка для экспорта", self.output_input.text())
+        if directory:
+            self.output_input.setText(directory)
+    def selected_files(self):
+        return [
+            self.files.item(row).data(Qt.ItemDataRole.UserRole)
+            for row in range(self.files.count())
+            if self.files.item(row).checkState() == Qt.CheckState.Checked
+        ]
+    def selected_formats(self):
+        return [format for format, box in self.format_boxes.items() if box.isChecked()]
+    def output_directory(self):
+        return self.output_input.text().strip()
+class ExportJobsView(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.items = {}
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.jobs = QTreeWidget()
+        self.jobs.setColumnCount(3)
+        self.jobs.setHeaderLabels(["Файл", "Формат", "Статус"])
+        self.jobs.setRootIsDecorated(False)
+        self.jobs.itemDoubleClicked.connect(self.on_double_click)
+        layout.addWidget(self.jobs)
+        buttons = QHBoxLayout()
+        cancel_button = QPushButton("Отменить")
+        cancel_button.clicked.connect(self.parent.export_queue.cancel_all)
+        buttons.addWidget(cancel_button)
+        clear_button = QPushButton("Очистить")
+        clear_button.clicked.connect(self.clear_finished)
+        buttons.addWidget(clear_button)
+        layout.addLayout(buttons)
+    def update_job(self, job):
+        item = self.items.get(id(job))
+        if item is None:
+            item = QTreeWidgetItem([job.output, EXPORT_FORMATS[job.format][0], ""])
+            item.setData(0, Qt.ItemDataRole.UserRole, job)
+            self.items[id(job)] = item
+            self.jobs.addTopLevelItem(item)
+        status = EXPORT_STATUS_LABELS[job.status]
+        if job.error:
+            status = f"{status}: {job.error}"
+            item.setForeground(2, QColor("#E06C75"))
+        item.setText(2, status)
+        item.setToolTip(2, status)
+    def clear_finished(self):
+        for key, item in list(self.items.items()):
+            if item.data(0, Qt.ItemDataRole.UserRole).finished():
+                self.jobs.takeTopLevelItem(self.jobs.indexOfTopLevelItem(item))
+                del self.items[key]
+    def on_double_click(self, item, column):
+        job = item.data(0, Qt.ItemDataRole.UserRole)
+        if job.status == "done":
+            QDesktopServices.openUrl(QUrl.fromLocalFile(job.output))
+def search_pattern(text, case_sensitive=False, whole_words=False):
+    pattern = re.escape(text)
+    if whole_words:
+        pattern = rf'(?<!\w){pattern}(?!\w)'
+    return re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+def find_all_matches(text, pattern, offset=0, cancelled=None, progress=None):
+    starts = []
+    lengths = []
+    is_ascii = text.isascii()
+    units = offset
+    last = 0
+    for count, match in enumerate(pattern.finditer(text)):
+        if count & 255 == 255:
+            if cancelled is not None and cancelled():
+                return None
+            if progress is not None:
+                progress(len(starts))
+        start, end = match.span()
+        if start == end:
+            continue
+        if is_ascii:
+            starts.append(offset + start)
+            lengths.append(end - start)
+        else:
+            units += utf16_length(text[last:start])
+            length = utf16_length(match.group())
+            starts.append(units)
+            lengths.append(length)
+            units += length
+            last = end
+    return starts, lengths
+class SearchThread(QThread):
+    progress = Signal(int, int)
+    finished_scan = Signal(int, object, object)
+    def __init__(self, parent=None, progress_interval=0.05):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self.pending = None
+        self.active = False
+        self.generation = 0
+        self.progress_interval = progress_interval
+    def search(self, text, pattern):
+        with self.lock:
+            self.generation += 1
+            self.pending = (self.generation, text, pattern)
+            generation = self.generation
+            start = not self.active
+            self.active = True
+        if start:
+            self.wait()
+            self.start()
+        return generation
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            self.pending = None
+    def run(self):
+        while True:
+            with self.lock:
+                job = self.pending
+                self.pending = None
+                if job is None:
+                    self.active = False
+                    return
+            generation, text, pattern = job
+            next_report = [time.perf_counter() + self.progress_interval]
+            def report(count):
+                if time.perf_counter() >= next_report[0]:
+                    next_report[0] = time.perf_counter() + self.progress_interval
+                    self.progress.emit(generation, count)
+            result = find_all_matches(text, pattern, cancelled=lambda: generation != self.generation, progress=report)
+            if result is not None and generation == self.generation:
+                self.finished_scan.emit(generation, *result)
 class FindReplaceDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
-        self.last_match = None
+        self.pattern = None
+        self.matches = None
+        self.generation = 0
+        self.max_visible_matches = 2000
+        self.match_format = QTextCharFormat()
+        self.match_format.setBackground(QColor("#5C4B1F"))
+        self.search_thread = SearchThread(self)
+        self.search_thread.progress.connect(self.on_search_progress)
+        self.search_thread.finished_scan.connect(self.on_search_finished)
+        self.restart_timer = QTimer(self)
+        self.restart_timer.setSingleShot(True)
+        self.restart_timer.setInterval(150)
+        self.restart_timer.timeout.connect(self.start_search)
         self.setWindowIcon(QIcon("Markdown_Editor.ico"))
         self.init_ui()
+        editor = self.parent.editor
+        editor.verticalScrollBar().valueChanged.connect(self.update_visible_matches)
+        editor.document().contentsChange.connect(self.on_contents_change)
+        self.find_input.setText(editor.textCursor().selectedText().split('\u2029')[0])
+        self.find_input.selectAll()
     def init_ui(self):
         self.setWindowTitle("Поиск и замена")
         self.setMinimumWidth(400)
         layout = QGridLayout()
         layout.addWidget(QLabel("Найти:"), 0, 0)
         self.find_input = QLineEdit()
+        self.find_input.textChanged.connect(self.start_search)
+        self.find_input.returnPressed.connect(self.find_next)
         layout.addWidget(self.find_input, 0, 1)
         layout.addWidget(QLabel("Заменить на:"), 1, 0)
         self.replace_input = QLineEdit()
@@ -290,8 +3615,10 @@ class FindReplaceDialog(QDialog):
         options_group = QGroupBox("Опции")
         options_layout = QVBoxLayout()
         self.case_sensitive = QCheckBox("Учитывать регистр")
+        self.case_sensitive.toggled.connect(self.start_search)
         options_layout.addWidget(self.case_sensitive)
         self.whole_words = QCheckBox("Только целые слова")
+        self.whole_words.toggled.connect(self.start_search)
         options_layout.addWidget(self.whole_words)
         options_group.setLayout(options_layout)
         layout.addWidget(options_group, 2, 0, 1, 2)
@@ -302,6 +3629,9 @@ class FindReplaceDialog(QDialog):
         find_next_button = QPushButton("Найти далее")
         find_next_button.clicked.connect(self.find_next)
         button_layout.addWidget(find_next_button, 0, 1)
+        find_previous_button = QPushButton("Найти ранее")
+        find_previous_button.clicked.connect(self.find_previous)
+        button_layout.addWidget(find_previous_button, 0, 2)
         replace_button = QPushButton("Заменить")
         replace_button.clicked.connect(self.replace)
         button_layout.addWidget(replace_button, 1, 0)
@@ -310,38 +3640,120 @@ class FindReplaceDialog(QDialog):
         button_layout.addWidget(replace_all_button, 1, 1)
         close_button = QPushButton("Закрыть")
         close_button.clicked.connect(self.close)
-        button_layout.addWidget(close_button, 2, 0, 1, 2)
+        button_layout.addWidget(close_button, 2, 0, 1, 3)
         layout.addLayout(button_layout, 3, 0, 1, 2)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label, 4, 0, 1, 2)
         self.setLayout(layout)
-    def find(self):
-        editor = self.parent.editor
+    def start_search(self):
+        self.restart_timer.stop()
         text = self.find_input.text()
+        self.matches = None
         if not text:
+            self.pattern = None
+            self.search_thread.cancel()
+            self.status_label.clear()
+            self.update_visible_matches()
+            return
+        self.pattern = search_pattern(text, self.case_sensitive.isChecked(), self.whole_words.isChecked())
+        self.generation = self.search_thread.search(self.parent.editor.snapshot().text, self.pattern)
+        self.status_label.setText("Поиск...")
+        self.update_visible_matches()
+    def on_contents_change(self, position, removed, added):
+        if self.pattern is not None:
+            self.matches = None
+            self.search_thread.cancel()
+            self.restart_timer.start()
+    def on_search_progress(self, generation, count):
+        if generation == self.generation and self.matches is None:
+            self.status_label.setText(f"Найдено: {count}...")
+    def on_search_finished(self, generation, starts, lengths):
+        if generation != self.generation or self.pattern is None:
+            return
+        self.matches = (starts, lengths)
+        self.update_visible_matches()
+        self.update_status()
+    def update_status(self, current=None):
+        if self.matches is None:
+            return
+        total = len(self.matches[0])
+        if not total:
+            self.status_label.setText(f"Текст '{self.find_input.text()}' не найден")
+        elif current is None:
+            self.status_label.setText(f"Совпадений: {total}")
+        else:
+            self.status_label.setText(f"{current + 1} из {total}")
+    def update_visible_matches(self):
+        editor = self.parent.editor
+        if self.pattern is None:
+            editor.set_search_selections([])
+            return
+        first = editor.firstVisibleBlock()
+        offset = editor.contentOffset()
+        bottom = editor.viewport().rect().bottom()
+        last = first
+        block = first
+        while block.isValid() and editor.blockBoundingGeometry(block).translated(offset).top() <= bottom:
+            last = block
+            block = block.next()
+        start = first.position()
+        end = last.position() + last.length()
+        spans = []
+        if self.matches is not None:
+            starts, lengths = self.matches
+            low = bisect.bisect_left(starts, start)
+            high = min(bisect.bisect_left(starts, end), low + self.max_visible_matches)
+            spans = list(zip(starts[low:high], lengths[low:high]))
+        else:
+            block = first
+            while block.isValid() and len(spans) < self.max_visible_matches:
+                block_starts, block_lengths = find_all_matches(block.text(), self.pattern, block.position())
+                spans.extend(zip(block_starts, block_lengths))
+                if block == last:
+                    break
+                block = block.next()
+        selections = []
+        for position, length in spans[:self.max_visible_matches]:
+            selection = QTextEdit.ExtraSelection()
+            selection.cursor = QTextCursor(editor.document())
+            selection.cursor.setPosition(position)
+            selection.cursor.setPosition(position + length, QTextCursor.MoveMode.KeepAnchor)
+            selection.format = self.match_format
+            selections.append(selection)
+        editor.set_search_selections(selections)
+    def jump(self, direction):
+        editor = self.parent.editor
+        if self.pattern is None:
+            return
+        if self.matches is None:
+            self.search_thread.cancel()
+            self.matches = find_all_matches(editor.snapshot().text, self.pattern)
+            self.update_visible_matches()
+        starts, lengths = self.matches
+        if not starts:
+            self.update_status()
             return
-        flags = QTextDocument.FindFlag(0)
-        if self.case_sensitive.isChecked():
-            flags |= QTextDocument.FindFlag.FindCaseSensitively
-        if self.whole_words.isChecked():
-            flags |= QTextDocument.FindFlag.FindWholeWords
         cursor = editor.textCursor()
-        if cursor.hasSelection():
-            cursor.setPosition(cursor.selectionStart())
-            editor.setTextCursor(cursor)
-        found = editor.find(text, flags)
-        if not found:
-            cursor.movePosition(QTextCursor.MoveOperation.Start)
-            editor.setTextCursor(cursor)
-            found = editor.find(text, flags)
-        if found:
-            self.last_match = True
+        if direction > 0:
+            if cursor.hasSelection():
+                index = bisect.bisect_right(starts, cursor.selectionStart())
+            else:
+                index = bisect.bisect_left(starts, cursor.position())
+        elif direction < 0:
+            index = bisect.bisect_left(starts, cursor.selectionStart()) - 1
         else:
-            self.last_match = False
-            QMessageBox.information(self, "Поиск", f"Текст '{text}' не найден")
+            index = bisect.bisect_left(starts, cursor.selectionStart())
+        index %= len(starts)
+        cursor.setPosition(starts[index])
+        cursor.setPosition(starts[index] + lengths[index], QTextCursor.MoveMode.KeepAnchor)
+        editor.setTextCursor(cursor)
+        self.update_status(index)
+    def find(self):
+        self.jump(0)
     def find_next(self):
-        if self.last_match:
-            self.find()
-        else:
-            self.find()
+        self.jump(1)
+    def find_previous(self):
+        self.jump(-1)
     def replace(self):
         editor = self.parent.editor
         if editor.textCursor().hasSelection():
@@ -363,13 +3775,203 @@ class FindReplaceDialog(QDialog):
         if self.whole_words.isChecked():
             flags |= QTextDocument.FindFlag.FindWholeWords
         count = 0
+        edit_cursor = QTextCursor(editor.document())
+        edit_cursor.beginEditBlock()
         while editor.find(text, flags):
             cursor = editor.textCursor()
             cursor.insertText(replace_text)
             count += 1
+        edit_cursor.endEditBlock()
         cursor.setPosition(cursor_position)
         editor.setTextCursor(cursor)
-        QMessageBox.information(self, "Замена", f"Заменено {count} вхождений")
+        self.start_search()
+        self.status_label.setText(f"Заменено {count} вхождений")
+    def done(self, result):
+        editor = self.parent.editor
+        editor.verticalScrollBar().valueChanged.disconnect(self.update_visible_matches)
+        editor.document().contentsChange.disconnect(self.on_contents_change)
+        self.restart_timer.stop()
+        self.search_thread.cancel()
+        self.search_thread.wait()
+        editor.set_search_selections([])
+        super().done(result)
+class WorkspaceReplaceDialog(QDialog):
+    def __init__(self, parent=None, root=""):
+        super().__init__(parent)
+        self.parent = parent
+        self.root = root
+        self.pattern = None
+        self.replacement = ""
+        self.literal = True
+        self.buffer_result = None
+        self.replace_thread = WorkspaceReplaceThread(self)
+        self.replace_thread.progress.connect(self.on_progress)
+        self.replace_thread.finished_job.connect(self.on_finished)
+        self.setWindowTitle("Замена в проекте")
+        self.setWindowIcon(QIcon("Markdown_Editor.ico"))
+        self.setMinimumSize(700, 500)
+        layout = QGridLayout(self)
+        layout.addWidget(QLabel("Найти:"), 0, 0)
+        self.find_input = QLineEdit(self.parent.editor.textCursor().selectedText().split('\u2029')[0])
+        self.find_input.returnPressed.connect(self.scan)
+        layout.addWidget(self.find_input, 0, 1)
+        layout.addWidget(QLabel("Заменить на:"), 1, 0)
+        self.replace_input = QLineEdit()
+        layout.addWidget(self.replace_input, 1, 1)
+        options_layout = QHBoxLayout()
+        self.regex = QCheckBox("Регулярное выражение")
+        options_layout.addWidget(self.regex)
+        self.case_sensitive = QCheckBox("Учитывать регистр")
+        options_layout.addWidget(self.case_sensitive)
+        self.whole_words = QCheckBox("Только целые слова")
+        options_layout.addWidget(self.whole_words)
+        layout.addLayout(options_layout, 2, 0, 1, 2)
+        self.results = QTreeWidget()
+        self.results.setHeaderLabels(["Файл / строка", "Замена"])
+        self.results.setColumnWidth(0, 320)
+        self.results.itemDoubleClicked.connect(self.open_item)
+        layout.addWidget(self.results, 3, 0, 1, 2)
+        self.status_label = QLabel(f"Папка: {root}")
+        layout.addWidget(self.status_label, 4, 0, 1, 2)
+        button_layout = QHBoxLayout()
+        self.scan_button = QPushButton("Найти")
+        self.scan_button.clicked.connect(self.scan)
+        button_layout.addWidget(self.scan_button)
+        self.apply_button = QPushButton("Заменить выбранное")
+        self.apply_button.setEnabled(False)
+        self.apply_button.clicked.connect(self.apply)
+        button_layout.addWidget(self.apply_button)
+        close_button = QPushButton("Закрыть")
+        close_button.clicked.connect(self.reject)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout, 5, 0, 1, 2)
+    def compile_pattern(self):
+        text = self.find_input.text()
+        if not text:
+            return None
+        if not self.regex.isChecked():
+            return search_pattern(text, self.case_sensitive.isChecked(), self.whole_words.isChecked())
+        if self.whole_words.isChecked():
+            text = rf'(?<!\w)(?:{text})(?!\w)'
+        return re.compile(text, re.MULTILINE | (0 if self.case_sensitive.isChecked() else re.IGNORECASE))
+    def scan(self):
+        if self.replace_thread.isRunning():
+            return
+        try:
+            self.pattern = self.compile_pattern()
+        except re.error as e:
+            self.status_label.setText(f"Ошибка в выражении: {e}")
+            return
+        if self.pattern is None:
+            return
+        self.replacement = self.replace_input.text()
+        self.literal = not self.regex.isChecked()
+        self.results.clear()
+        self.apply_button.setEnabled(False)
+        self.buffer_result = None
+        current = self.parent.current_file
+        exclude = ()
+        if current and os.path.abspath(current).startswith(os.path.abspath(self.root) + os.sep):
+            exclude = (os.path.abspath(current),)
+            try:
+                new_text, count, changes = replace_in_text(
+                    self.parent.editor.snapshot().text, self.pattern, self.replacement, self.literal, 100
+                )
+            except (re.error, IndexError) as e:
+                self.status_label.setText(f"Ошибка в замене: {e}")
+                return
+            if count:
+                try:
+                    digest = read_replace_source(exclude[0])[1]
+                except (OSError, UnicodeDecodeError):
+                    digest = None
+                self.buffer_result = {"path": exclude[0], "hash": digest, "buffer": True, "count": count, "changes": changes}
+        self.status_label.setText("Поиск...")
+        self.scan_button.setEnabled(False)
+        self.replace_thread.scan(self.root, self.pattern, self.replacement, self.literal, exclude)
+    def apply(self):
+        files = []
+        apply_buffer = False
+        skipped = 0
+        current = os.path.abspath(self.parent.current_file) if self.parent.current_file else None
+        for index in range(self.results.topLevelItemCount()):
+            item = self.results.topLevelItem(index)
+            if item.checkState(0) != Qt.CheckState.Checked:
+                continue
+            result = item.data(0, Qt.ItemDataRole.UserRole)
+            if os.path.abspath(result["path"]) == current:
+                apply_buffer = True
+            elif result["hash"]:
+                files.append((result["path"], result["hash"]))
+            else:
+                skipped += 1
+        if apply_buffer:
+            new_text, count, changes = replace_in_text(
+                self.parent.editor.snapshot().text, self.pattern, self.replacement, self.literal, 0
+            )
+            self.parent.editor.apply_text_diff(new_text)
+        if not files:
+            if apply_buffer:
+                self.status_label.setText("Изменения внесены в открытый документ")
+            else:
+                self.status_label.setText(f"Пропущено файлов: {skipped}" if skipped else "Ничего не выбрано")
+            return
+        self.status_label.setText("Замена...")
+        self.scan_button.setEnabled(False)
+        self.apply_button.setEnabled(False)
+        self.replace_thread.apply(files, self.pattern, self.replacement, self.literal)
+    def on_progress(self, done, total):
+        self.status_label.setText(f"Обработано файлов: {done}/{total}")
+    def on_finished(self, mode, results):
+        self.scan_button.setEnabled(True)
+        if mode == "scan":
+            self.show_results(([self.buffer_result] if self.buffer_result else []) + results)
+            return
+        failed = [(path, error) for path, error in results if error]
+        written = len(results) - len(failed)
+        conflicts = sum(1 for path, error in failed if error == "conflict")
+        self.results.clear()
+        for path, error in failed:
+            item = QTreeWidgetItem([os.path.relpath(path, self.root), "изменен после поиска" if error == "conflict" else error])
+            item.setData(0, Qt.ItemDataRole.UserRole, {"path": path, "hash": "", "changes": []})
+            self.results.addTopLevelItem(item)
+        self.status_label.setText(f"Записано файлов: {written}, конфликтов: {conflicts}, ошибок: {len(failed) - conflicts}")
+        self.parent.refresh_workspace()
+    def show_results(self, results):
+        errors = [result for result in results if "error" in result]
+        results = [result for result in results if "error" not in result]
+        if errors:
+            self.status_label.setText(f"Ошибка в замене: {errors[0]['error']}")
+            return
+        self.results.setUpdatesEnabled(False)
+        for result in results:
+            label = os.path.relpath(result["path"], self.root)
+            if result.get("buffer"):
+                label += " (открытый документ)"
+            item = QTreeWidgetItem([label, f"совпадений: {result['count']}"])
+            item.setData(0, Qt.ItemDataRole.UserRole, result)
+            item.setCheckState(0, Qt.CheckState.Checked)
+            for line, before, after in result["changes"]:
+                child = QTreeWidgetItem([f"{line}: {before.strip()[:200]}", after.strip()[:200]])
+                child.setData(0, Qt.ItemDataRole.UserRole, line)
+                item.addChild(child)
+            self.results.addTopLevelItem(item)
+        self.results.setUpdatesEnabled(True)
+        total = sum(result["count"] for result in results)
+        self.status_label.setText(f"Совпадений: {total} в файлах: {len(results)}")
+        self.apply_button.setEnabled(bool(results))
+    def open_item(self, item, column):
+        parent = item.parent()
+        line = item.data(0, Qt.ItemDataRole.UserRole) if parent is not None else 1
+        path = (parent or item).data(0, Qt.ItemDataRole.UserRole)["path"]
+        if path != self.parent.current_file and not self.parent.maybe_save():
+            return
+        if path == self.parent.current_file or self.parent.load_file(path):
+            self.parent.go_to_line(line)
+    def done(self, result):
+        self.replace_thread.cancel()
+        self.replace_thread.wait()
+        super().done(result)
 class FileTreeView(QTreeView):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -394,6 +3996,8 @@ class FileTreeView(QTreeView):
     def set_root_directory(self, path):
         self.model.setRootPath(path)
         self.setRootIndex(self.model.index(path))
+    def root_directory(self):
+        return self.model.rootPath()
     def on_double_click(self, index):
         path = self.model.filePath(index)
         if QFileInfo(path).isFile():
@@ -447,6 +4051,7 @@ class FileTreeView(QTreeView):
                 if self.parent.current_file == path:
                     self.parent.current_file = new_path
                     self.parent.setWindowTitle(f"Markdown Editor - {new_name}")
+                    self.parent.watch_current_file()
             except Exception as e:
                 QMessageBox.warning(self, "Ошибка", f"Не удалось переименовать: {str(e)}")
     def delete_item(self, index):
@@ -469,6 +4074,121 @@ class FileTreeView(QTreeView):
                         self.parent.new_file()
             except Exception as e:
                 QMessageBox.warning(self, "Ошибка", f"Не удалось удалить: {str(e)}")
+class ProblemsView(QTreeWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.root = None
+        self.init_ui()
+    def init_ui(self):
+        self.setColumnCount(3)
+        self.setHeaderLabels(["Файл", "Строка", "Описание"])
+        self.setRootIsDecorated(False)
+        self.setSortingEnabled(True)
+        self.itemDoubleClicked.connect(self.on_double_click)
+    def set_problems(self, root, problems):
+        self.root = root
+        self.clear()
+        for rel, line, message in problems:
+            item = QTreeWidgetItem([rel, str(line), message])
+            item.setData(1, Qt.ItemDataRole.DisplayRole, line)
+            self.addTopLevelItem(item)
+        self.resizeColumnToContents(0)
+    def on_double_click(self, item, column):
+        path = os.path.join(self.root, item.text(0))
+        if os.path.exists(path) and (path == self.parent.current_file or self.parent.maybe_save()):
+            if path != self.parent.current_file:
+                self.parent.load_file(path)
+            self.parent.go_to_line(int(item.text(1)))
+class BacklinksView(QTreeWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.root = None
+        self.unresolved_key = None
+        self.init_ui()
+    def init_ui(self):
+        self.setHeaderHidden(True)
+        self.itemDoubleClicked.connect(self.on_double_click)
+        self.backlinks_item = QTreeWidgetItem()
+        self.unresolved_item = QTreeWidgetItem()
+        self.addTopLevelItem(self.backlinks_item)
+        self.addTopLevelItem(self.unresolved_item)
+    def set_links(self, root, backlinks, unresolved, unresolved_key=None):
+        self.root = root
+        self.backlinks_item.takeChildren()
+        self.backlinks_item.setText(0, f"Ссылки на этот файл ({len(backlinks)})")
+        for rel, line in backlinks:
+            child = QTreeWidgetItem([f"{rel}:{line}"])
+            child.setData(0, Qt.ItemDataRole.UserRole, (rel, line))
+            self.backlinks_item.addChild(child)
+        self.backlinks_item.setExpanded(True)
+        if unresolved_key is not None and unresolved_key == self.unresolved_key:
+            return
+        self.unresolved_key = unresolved_key
+        self.unresolved_item.takeChildren()
+        self.unresolved_item.setText(0, f"Неразрешенные ссылки ({len(unresolved)})")
+        for target, sources in unresolved:
+            target_item = QTreeWidgetItem([f"{target} ({len(sources)})"])
+            for rel, line in sources:
+                child = QTreeWidgetItem([f"{rel}:{line}"])
+                child.setData(0, Qt.ItemDataRole.UserRole, (rel, line))
+                target_item.addChild(child)
+            self.unresolved_item.addChild(target_item)
+    def on_double_click(self, item, column):
+        data = item.data(0, Qt.ItemDataRole.UserRole)
+        if not data:
+            return
+        rel, line = data
+        path = os.path.join(self.root, rel)
+        if os.path.exists(path) and (path == self.parent.current_file or self.parent.maybe_save()):
+            if path != self.parent.current_file:
+                self.parent.load_file(path)
+            self.parent.go_to_line(line)
+class MetadataView(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.root = None
+        self.max_results = 1000
+        self.init_ui()
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("tag:release status:draft -owner:bob")
+        self.query_edit.setClearButtonEnabled(True)
+        layout.addWidget(self.query_edit)
+        self.results = QTreeWidget()
+        self.results.setColumnCount(2)
+        self.results.setHeaderLabels(["Файл", "Метаданные"])
+        self.results.setRootIsDecorated(False)
+        self.results.itemDoubleClicked.connect(self.on_double_click)
+        layout.addWidget(self.results)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(150)
+        self.timer.timeout.connect(self.parent.update_metadata_results)
+        self.query_edit.textChanged.connect(self.timer.start)
+        self.query_edit.returnPressed.connect(self.parent.update_metadata_results)
+    def query(self):
+        return self.query_edit.text().strip()
+    def set_results(self, root, results, metadata, elapsed):
+        self.root = root
+        self.results.clear()
+        for rel in results[:self.max_results]:
+            summary = "; ".join(f"{key}: {', '.join(values)}" for key, values in metadata.get(rel, {}).items())
+            item = QTreeWidgetItem([rel, summary])
+            item.setToolTip(1, summary)
+            self.results.addTopLevelItem(item)
+        self.results.resizeColumnToContents(0)
+        shown = f", показано {self.max_results}" if len(results) > self.max_results else ""
+        self.parent.metadata_dock.setWindowTitle(f"Метаданные ({len(results)}{shown}, {elapsed:.0f} мс)")
+    def on_double_click(self, item, column):
+        path = os.path.join(self.root, item.text(0))
+        if os.path.exists(path) and (path == self.parent.current_file or self.parent.maybe_save()):
+            if path != self.parent.current_file:
+                self.parent.load_file(path)
 class MarkdownEditorWidget(QPlainTextEdit):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -476,9 +4196,33 @@ class MarkdownEditorWidget(QPlainTextEdit):
         self.setFont(font)
         self.setTabStopDistance(48)
         self.line_number_area = LineNumberArea(self)
+        self.diff_marker_width = 3
+        self.fold_marker_width = 12
+        self.diff_colors = {"added": QColor("#587C0C"), "modified": QColor("#0C7D9D"), "deleted": QColor("#94151B")}
         self.highlighter = MarkdownHighlighter(self.document())
+        self.snapshots = DocumentSnapshots(self.document())
+        self.undo_history = UndoHistory(self)
+        self.highlight_scheduler = HighlightScheduler(self)
+        self.progressive_highlight_threshold = 5000
+        self.fence_highlighter = FenceHighlighter(self)
+        self.folds = FoldManager(self)
+        self.folds.changed.connect(self.line_number_area.update)
+        self.saved_diff = SavedDiff(self)
+        self.saved_diff.changed.connect(self.line_number_area.update)
+        self.undo_history.changed.connect(self.on_undo_history_changed)
         self.blockCountChanged.connect(self.update_line_number_area_width)
         self.updateRequest.connect(self.update_line_number_area)
+        self.search_selections = []
+        self.collapse_long_lines = False
+        self.long_line_placeholders = []
+        self.completion_provider = None
+        self.completion_start = 0
+        self.completer = QCompleter(self)
+        self.completer.setWidget(self)
+        self.completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.completer.setModel(QStringListModel(self.completer))
+        self.completer.activated.connect(self.insert_completion)
+        self.cursorPositionChanged.connect(self.reveal_cursor_block)
         self.cursorPositionChanged.connect(self.highlight_current_line)
         self.cursorPositionChanged.connect(self.highlight_matching_bracket)
         self.update_line_number_area_width(0)
@@ -490,6 +4234,7 @@ class MarkdownEditorWidget(QPlainTextEdit):
         QShortcut(QKeySequence("Ctrl+K"), self, activated=self.shortcut_link)
         QShortcut(QKeySequence("Ctrl+Shift+C"), self, activated=self.shortcut_code)
         QShortcut(QKeySequence("Ctrl+Shift+L"), self, activated=self.shortcut_list)
+        QShortcut(QKeySequence("Ctrl+Shift+["), self, activated=self.toggle_fold_at_cursor)
     def shortcut_bold(self):
         self._wrap_selection("**", "**")
     def shortcut_italic(self):
@@ -512,12 +4257,263 @@ class MarkdownEditorWidget(QPlainTextEdit):
             cursor.insertText(f"{left}{right}")
             cursor.movePosition(QTextCursor.MoveOperation.Left, QTextCursor.MoveMode.MoveAnchor, len(right))
             self.setTextCursor(cursor)
+    def snapshot(self):
+        return self.snapshots.snapshot()
+    def undo(self):
+        self.undo_history.undo()
+    def redo(self):
+        self.undo_history.redo()
+    def on_undo_history_changed(self):
+        self.undoAvailable.emit(bool(self.undo_history.undo_steps))
+        self.redoAvailable.emit(bool(self.undo_history.redo_steps))
+    def contextMenuEvent(self, event):
+        menu = self.createStandardContextMenu(event.pos())
+        for action in menu.actions():
+            if action.objectName() in ("edit-undo", "edit-redo"):
+                undo = action.objectName() == "edit-undo"
+                replacement = QAction(action.text(), menu)
+                replacement.setEnabled(bool(self.undo_history.undo_steps if undo else self.undo_history.redo_steps))
+                replacement.triggered.connect(self.undo if undo else self.redo)
+                menu.insertAction(action, replacement)
+                menu.removeAction(action)
+        menu.exec(event.globalPos())
+        menu.deleteLater()
+    def keyPressEvent(self, event):
+        popup = self.completer.popup()
+        if popup.isVisible() and event.key() in (
+            Qt.Key.Key_Enter, Qt.Key.Key_Return, Qt.Key.Key_Escape, Qt.Key.Key_Tab, Qt.Key.Key_Backtab
+        ):
+            event.ignore()
+            return
+        if event.matches(QKeySequence.StandardKey.Undo):
+            self.undo()
+        elif event.matches(QKeySequence.StandardKey.Redo):
+            self.redo()
+        else:
+            super().keyPressEvent(event)
+            if event.text().isprintable() and event.text() or event.key() == Qt.Key.Key_Backspace:
+                self.update_completion()
+            elif popup.isVisible() and event.key() in (Qt.Key.Key_Left, Qt.Key.Key_Right, Qt.Key.Key_Home, Qt.Key.Key_End):
+                popup.hide()
+    def update_completion(self):
+        popup = self.completer.popup()
+        cursor = self.textCursor()
+        result = None
+        if self.completion_provider is not None and not cursor.hasSelection():
+            text = cursor.block().text()
+            line = text[:utf16_index(text, cursor.positionInBlock())][-500:]
+            result = self.completion_provider(line)
+        if not result or not result[1]:
+            popup.hide()
+            return
+        prefix, items = result
+        self.completion_start = cursor.position() - utf16_length(prefix)
+        model = self.completer.model()
+        model.setStringList(items)
+        rect = self.cursorRect()
+        rect.setWidth(popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width())
+        self.completer.complete(rect)
+        popup.setCurrentIndex(model.index(0, 0))
+    def insert_completion(self, text):
+        cursor = self.textCursor()
+        cursor.setPosition(self.completion_start, QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertText(text)
+        self.setTextCursor(cursor)
+    def set_document_text(self, text, states=None):
+        if states is not None and len(states) != text.count('\n') + 1:
+            states = None
+        if states is not None or text.count('\n') >= self.progressive_highlight_threshold:
+            self.highlight_scheduler.load_text(text, states)
+        else:
+            self.setPlainText(text)
+        if self.collapse_long_lines:
+            self.hide_long_lines()
+    def is_long_block(self, block):
+        return block.length() > self.highlighter.long_line_limit
+    def set_block_visible(self, block, visible):
+        block.setVisible(visible)
+        self.document().markContentsDirty(block.position(), block.length())
+    def set_blocks_visible(self, first, last, visible):
+        doc = self.document()
+        block = doc.findBlockByNumber(first)
+        end = doc.findBlockByNumber(last)
+        if not block.isValid() or first > last:
+            return
+        if not end.isValid():
+            end = doc.lastBlock()
+        start = block.position()
+        while block.isValid():
+            if not (visible and self.collapse_long_lines and self.is_long_block(block)):
+                block.setVisible(visible)
+            if block == end:
+                break
+            block = block.next()
+        doc.markContentsDirty(start, end.position() + end.length() - start)
+        self.viewport().update()
+        self.line_number_area.update()
+    def next_visible_block(self, block):
+        end = self.folds.folds.get(block.blockNumber())
+        return self.document().findBlockByNumber(end + 1) if end is not None else block.next()
+    def toggle_fold_at_cursor(self):
+        block = self.textCursor().block()
+        number = block.blockNumber()
+        while block.isValid():
+            if self.folds.is_foldable(block):
+                end = self.folds.folds.get(block.blockNumber()) or self.folds.fold_end(block)
+                if block.blockNumber() == number or (end is not None and end >= number):
+                    self.folds.toggle(block)
+                    return
+            block = block.previous()
+    def hide_long_lines(self):
+        hidden = 0
+        cursor_block = self.textCursor().blockNumber()
+        block = self.document().begin()
+        while block.isValid():
+            if block.isVisible() and block.blockNumber() != cursor_block and self.is_long_block(block):
+                self.set_block_visible(block, False)
+                hidden += 1
+            block = block.next()
+        if hidden:
+            self.viewport().update()
+            self.line_number_area.update()
+        return hidden
+    def show_long_lines(self, block=None):
+        shown = 0
+        if block is None:
+            block = self.document().begin()
+            last = None
+        else:
+            last = block
+        while block.isValid():
+            if not block.isVisible() and self.is_long_block(block) and not self.folds.hides(block.blockNumber()):
+                self.set_block_visible(block, True)
+                shown += 1
+            if block == last:
+                break
+            block = block.next()
+        if shown:
+            self.viewport().update()
+            self.line_number_area.update()
+        return shown
+    def reveal_cursor_block(self):
+        block = self.textCursor().block()
+        if not block.isVisible():
+            if not self.folds.reveal(block.blockNumber()):
+                self.show_long_lines(block)
+            self.ensureCursorVisible()
+    def hidden_long_lines_before(self, block):
+        hidden = []
+        block = block.previous()
+        while block.isValid() and not block.isVisible() and self.is_long_block(block) and not self.folds.hides(block.blockNumber()):
+            hidden.append(block)
+            block = block.previous()
+        return hidden
+    def hidden_long_lines_after(self, block):
+        hidden = []
+        block = block.next()
+        while block.isValid() and not block.isVisible() and self.is_long_block(block) and not self.folds.hides(block.blockNumber()):
+            hidden.append(block)
+            block = block.next()
+        return hidden
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        self.long_line_placeholders = []
+        if not self.collapse_long_lines:
+            return
+        painter = QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        offset = self.contentOffset()
+        bottom = self.viewport().rect().bottom()
+        block = self.firstVisibleBlock()
+        while block.isValid():
+            if not block.isVisible():
+                block = self.next_visible_block(block)
+                continue
+            geometry = self.blockBoundingGeometry(block).translated(offset)
+            if geometry.top() > bottom:
+                break
+            hidden = self.hidden_long_lines_after(block)
+            if hidden:
+                layout = block.layout()
+                line = layout.lineAt(layout.lineCount() - 1)
+                x = int(geometry.left() + layout.position().x() + line.x() + line.naturalTextWidth()) + metrics.horizontalAdvance("  ")
+                y = int(geometry.top() + layout.position().y() + line.y())
+                cursor = QTextCursor(hidden[0])
+                cursor.movePosition(QTextCursor.MoveOperation.Right, QTextCursor.MoveMode.KeepAnchor, 80)
+                size = sum(hidden_block.length() - 1 for hidden_block in hidden)
+                suffix = f" (скрыто строк: {len(hidden)}, символов: {size})"
+                available = self.viewport().width() - x - 8 - metrics.horizontalAdvance("⋯ " + suffix)
+                label = "⋯ " + metrics.elidedText(cursor.selectedText() + "…", Qt.TextElideMode.ElideRight, max(0, available)) + suffix
+                rect = QRect(x, y, metrics.horizontalAdvance(label) + 8, int(line.height()))
+                painter.fillRect(rect, QColor("#3A2F40"))
+                painter.setPen(QColor("#C586C0"))
+                painter.drawText(rect.adjusted(4, 0, 0, 0), Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, label)
+                self.long_line_placeholders.append((rect, hidden))
+            block = self.next_visible_block(block)
+    def mouseDoubleClickEvent(self, event):
+        for rect, hidden in self.long_line_placeholders:
+            if rect.contains(event.position().toPoint()):
+                for block in hidden:
+                    self.show_long_lines(block)
+                return
+        super().mouseDoubleClickEvent(event)
+    def apply_text_diff(self, new_text):
+        old_lines = self.snapshot().text.split('\n')
+        new_lines = new_text.split('\n')
+        prefix = 0
+        limit = min(len(old_lines), len(new_lines))
+        while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+            suffix += 1
+        old_middle = old_lines[prefix:len(old_lines) - suffix]
+        new_middle = new_lines[prefix:len(new_lines) - suffix]
+        if not old_middle and not new_middle:
+            return 0
+        matcher = difflib.SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+        opcodes = [op for op in matcher.get_opcodes() if op[0] != 'equal']
+        cursor = QTextCursor(self.document())
+        cursor.beginEditBlock()
+        for tag, i1, i2, j1, j2 in reversed(opcodes):
+            self._replace_lines(cursor, prefix + i1, prefix + i2, new_middle[j1:j2])
+        cursor.endEditBlock()
+        return len(opcodes)
+    def _replace_lines(self, cursor, first, last, lines):
+        doc = self.document()
+        count = doc.blockCount()
+        if first == last:
+            if first < count:
+                cursor.setPosition(doc.findBlockByNumber(first).position())
+                cursor.insertText('\n'.join(lines) + '\n')
+            else:
+                cursor.movePosition(QTextCursor.MoveOperation.End)
+                cursor.insertText('\n' + '\n'.join(lines))
+            return
+        start_block = doc.findBlockByNumber(first)
+        end_block = doc.findBlockByNumber(last - 1)
+        if lines:
+            cursor.setPosition(start_block.position())
+            cursor.setPosition(end_block.position() + end_block.length() - 1, QTextCursor.MoveMode.KeepAnchor)
+            cursor.insertText('\n'.join(lines))
+        elif last < count:
+            cursor.setPosition(start_block.position())
+            cursor.setPosition(doc.findBlockByNumber(last).position(), QTextCursor.MoveMode.KeepAnchor)
+            cursor.removeSelectedText()
+        elif first > 0:
+            previous = doc.findBlockByNumber(first - 1)
+            cursor.setPosition(previous.position() + previous.length() - 1)
+            cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+            cursor.removeSelectedText()
+        else:
+            cursor.select(QTextCursor.SelectionType.Document)
+            cursor.removeSelectedText()
     def highlight_matching_bracket(self):
         extra = []
         pairs = {'(': ')', '[': ']', '{': '}', '"': '"', "'": "'", '`': '`', '*': '*', '_': '_'}
         cursor = self.textCursor()
         pos = cursor.position()
-        doc = self.document().toPlainText()
+        doc = self.snapshot().text
         if pos > 0 and pos <= len(doc):
             char = doc[pos-1]
             if char in pairs:
@@ -536,17 +4532,19 @@ class MarkdownEditorWidget(QPlainTextEdit):
                     extra.extend([sel1, sel2])
         self.setExtraSelections(self.extraSelections() + extra)
     def _find_matching(self, text, pos, left, right):
+        forward = range(pos + 1, min(len(text), pos + 1 + self.highlighter.long_line_limit))
+        backward = range(pos - 2, max(-1, pos - 2 - self.highlighter.long_line_limit), -1)
         if left == right:
-            for i in range(pos+1, len(text)):
+            for i in forward:
                 if text[i] == right:
                     return i
-            for i in range(pos-2, -1, -1):
+            for i in backward:
                 if text[i] == left:
                     return i
             return None
         if left in '([{':
             depth = 1
-            for i in range(pos+1, len(text)):
+            for i in forward:
                 if text[i] == left:
                     depth += 1
                 elif text[i] == right:
@@ -555,7 +4553,7 @@ class MarkdownEditorWidget(QPlainTextEdit):
                         return i
         if right in ')]}':
             depth = 1
-            for i in range(pos-2, -1, -1):
+            for i in backward:
                 if text[i] == right:
                     depth += 1
                 elif text[i] == left:
@@ -569,7 +4567,7 @@ class MarkdownEditorWidget(QPlainTextEdit):
         while max_num >= 10:
             max_num /= 10
             digits += 1
-        space = 3 + self.fontMetrics().horizontalAdvance('9') * digits
+        space = 3 + self.diff_marker_width + self.fold_marker_width + self.fontMetrics().horizontalAdvance('9') * digits
         return space
     def update_line_number_area_width(self, _):
         self.setViewportMargins(self.line_number_area_width(), 0, 0, 0)
@@ -591,16 +4589,30 @@ class MarkdownEditorWidget(QPlainTextEdit):
         block_number = block.blockNumber()
         top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
         bottom = top + self.blockBoundingRect(block).height()
+        last_visible = self.cursorForPosition(QPoint(0, self.viewport().height())).blockNumber()
+        markers = self.saved_diff.markers(block_number, last_visible + 1)
+        width = self.line_number_area.width()
         while block.isValid() and top <= event.rect().bottom():
             if block.isVisible() and bottom >= event.rect().top():
                 number = str(block_number + 1)
                 painter.setPen(QColor("#444B53"))
-                rect = QRect(0, int(top), self.line_number_area.width(), self.fontMetrics().height())
+                rect = QRect(0, int(top), width - self.fold_marker_width, self.fontMetrics().height())
                 painter.drawText(rect, Qt.AlignmentFlag.AlignRight, number)
-            block = block.next()
+                if self.folds.is_foldable(block):
+                    painter.setPen(QColor("#808080"))
+                    rect = QRect(width - self.fold_marker_width, int(top), self.fold_marker_width, self.fontMetrics().height())
+                    painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, "▸" if block_number in self.folds.folds else "▾")
+                if self.hidden_long_lines_before(block):
+                    painter.fillRect(QRect(self.diff_marker_width + 1, int(top), width, 2), QColor("#C586C0"))
+                marker = markers.get(block_number)
+                if marker == "deleted":
+                    painter.fillRect(QRect(0, int(top) - 1, self.diff_marker_width + 2, 3), self.diff_colors[marker])
+                elif marker:
+                    painter.fillRect(QRect(0, int(top), self.diff_marker_width, int(bottom - top)), self.diff_colors[marker])
+            block = self.next_visible_block(block)
             top = bottom
             bottom = top + self.blockBoundingRect(block).height()
-            block_number += 1
+            block_number = block.blockNumber()
     def highlight_current_line(self):
         extra_selections = []
         if not self.isReadOnly():
@@ -611,16 +4623,23 @@ class MarkdownEditorWidget(QPlainTextEdit):
             selection.cursor = self.textCursor()
             selection.cursor.clearSelection()
             extra_selections.append(selection)
-        self.setExtraSelections(extra_selections)
+        self.setExtraSelections(extra_selections + self.search_selections)
+    def set_search_selections(self, selections):
+        self.search_selections = selections
+        self.highlight_current_line()
+        self.highlight_matching_bracket()
 class MarkdownEditor(QMainWindow):
-    def __init__(self):
+    def __init__(self, files=(), cache_dir=CACHE_DIR, plugin_dir=PLUGIN_DIR, settings=None):
         super().__init__()
         self.setWindowTitle("Markdown Editor")
         self.setWindowIcon(QIcon("Markdown_Editor.ico"))
         self.setMinimumSize(800, 600)
         self.current_file = None
         self.file_changed = False
-        self.settings = QSettings("MarkdownEditor", "MarkdownEditor")
+        self.cache_dir = cache_dir
+        self.plugin_dir = plugin_dir
+        self.settings = settings if settings is not None else QSettings("MarkdownEditor", "MarkdownEditor")
+        self.session = SessionStore(os.path.join(cache_dir, "session.json"))
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
         self.main_layout = QHBoxLayout(self.central_widget)
@@ -629,12 +4648,30 @@ class MarkdownEditor(QMainWindow):
         self.editor = MarkdownEditorWidget()
         self.preview = QTextBrowser()
         self.preview.setOpenExternalLinks(True)
-        self.markdown_renderer = MarkdownRenderer()
+        self.loading_file = False
+        self.preview_html = ""
+        self.preview_server = None
+        self.math_renderer = MathRenderer(self, os.path.join(cache_dir, "math"))
+        self.render_plugins = load_render_plugins(plugin_dir)
+        self.markdown_renderer = MarkdownRenderer(RenderCache(
+            os.path.join(cache_dir, "render"), max_bytes=int(self.settings.value("renderCacheMB", 256)) * 1024 * 1024
+        ), self.math_renderer, self.render_plugins)
+        self.background_render = BackgroundRenderThread(self.create_background_renderer, self)
+        self.background_render.rendered.connect(self.on_background_rendered)
+        self.math_timer = QTimer(self)
+        self.math_timer.setSingleShot(True)
+        self.math_timer.setInterval(100)
+        self.math_timer.timeout.connect(self.update_preview)
+        self.math_renderer.formula_ready.connect(self.math_timer.start)
         self.splitter.addWidget(self.editor)
         self.splitter.addWidget(self.preview)
         self.splitter.setSizes([400, 400])  
         self.main_layout.addWidget(self.splitter)
         self.create_file_tree()
+        self.create_problems_panel()
+        self.create_workspace_services()
+        self.create_export_queue()
+        self.create_memory_budget()
         self.menu_bar = QMenuBar(self)
         self.setMenuBar(self.menu_bar)
         self.create_menu()
@@ -645,6 +4682,8 @@ class MarkdownEditor(QMainWindow):
         self.autosave_timer = QTimer(self)
         self.autosave_timer.timeout.connect(self.autosave)
         self.autosave_timer.start(10000)       
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self.on_file_changed_externally)
         self.load_settings()
         self.editor.setPlainText("""# Добро пожаловать в Markdown Editor!
 Это **простой** редактор Markdown с *превью* в реальном времени.
@@ -659,6 +4698,144 @@ def hello_world():
 [Узнать больше о Markdown](https://www.markdownguide.org/)
 """)
         self.update_preview()
+        self.restore_session(files)
+    def create_problems_panel(self):
+        self.problems_view = ProblemsView(self)
+        self.problems_dock = QDockWidget("Проблемы", self)
+        self.problems_dock.setWidget(self.problems_view)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.problems_dock)
+        self.problems_dock.hide()
+    def create_workspace_services(self):
+        self.workspace_root = None
+        self.workspace_thread = WorkspaceThread(self, self.cache_dir)
+        self.workspace_thread.problems_ready.connect(self.on_link_problems)
+        self.workspace_thread.updated.connect(self.on_workspace_updated)
+        self.editor.completion_provider = self.complete_markdown
+        self.workspace_watcher = WorkspaceWatcher(self)
+        self.workspace_watcher.changed.connect(self.refresh_workspace)
+        self.backlinks_view = BacklinksView(self)
+        self.backlinks_dock = QDockWidget("Обратные ссылки", self)
+        self.backlinks_dock.setWidget(self.backlinks_view)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.backlinks_dock)
+        self.backlinks_dock.hide()
+        self.metadata_dock = QDockWidget("Метаданные", self)
+        self.metadata_view = MetadataView(self)
+        self.metadata_dock.setWidget(self.metadata_view)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.metadata_dock)
+        self.metadata_dock.hide()
+    def set_workspace_root(self, root):
+        root = os.path.abspath(root)
+        if root == self.workspace_root:
+            return
+        self.workspace_root = root
+        self.workspace_thread.set_root(root)
+        self.workspace_watcher.set_root(root)
+        self.refresh_workspace()
+    def refresh_workspace(self, check_links=False):
+        if self.workspace_root:
+            self.workspace_thread.refresh(check_links)
+    def on_workspace_updated(self, changed, removed):
+        self.update_backlinks()
+        if changed or removed or not self.metadata_view.results.topLevelItemCount():
+            self.update_metadata_results()
+    def update_metadata_results(self):
+        metadata_index = self.workspace_thread.metadata
+        if not self.metadata_dock.isVisible() or metadata_index is None:
+            return
+        started = time.perf_counter()
+        try:
+            results = metadata_index.query(self.metadata_view.query())
+            metadata = metadata_index.metadata(results[:self.metadata_view.max_results])
+        except sqlite3.Error:
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        self.metadata_view.set_results(metadata_index.root, results, metadata, elapsed)
+    def toggle_long_line_collapse(self, checked):
+        self.settings.setValue("collapseLongLines", checked)
+        self.editor.collapse_long_lines = checked
+        if checked:
+            hidden = self.editor.hide_long_lines()
+            if hidden:
+                self.statusBar().showMessage(f"Скрыто длинных строк: {hidden} (двойной щелчок по номерам строк показывает их)", 5000)
+        else:
+            self.editor.show_long_lines()
+    def toggle_metadata(self):
+        if self.metadata_dock.isVisible():
+            self.metadata_dock.hide()
+        else:
+            self.metadata_dock.show()
+            if not self.workspace_root:
+                self.set_workspace_root(self.file_tree.root_directory())
+            self.update_metadata_results()
+            self.metadata_view.query_edit.setFocus()
+    def complete_markdown(self, line):
+        if self.workspace_thread.completion is None or not CompletionIndex.has_context(line):
+            return None
+        rel = self.workspace_thread.relative_path(self.current_file) or ""
+        if not self.workspace_thread.lock.acquire(blocking=False):
+            return None
+        try:
+            return self.workspace_thread.completion.complete(line, rel, self.workspace_thread.graph)
+        finally:
+            self.workspace_thread.lock.release()
+    def update_backlinks(self):
+        if not self.backlinks_dock.isVisible() or self.workspace_thread.graph is None:
+            return
+        rel = self.workspace_thread.relative_path(self.current_file)
+        with self.workspace_thread.lock:
+            graph = self.workspace_thread.graph
+            backlinks = graph.backlinks(rel) if rel else []
+            unresolved = graph.unresolved()
+            unresolved_key = (id(graph), graph.unresolved_version)
+        self.backlinks_view.set_links(self.workspace_root, backlinks, unresolved, unresolved_key)
+    def toggle_backlinks(self):
+        if self.backlinks_dock.isVisible():
+            self.backlinks_dock.hide()
+        else:
+            self.backlinks_dock.show()
+            if not self.workspace_root:
+                self.set_workspace_root(self.file_tree.root_directory())
+            self.update_backlinks()
+    def build_site(self):
+        if getattr(self, "site_build_thread", None) is not None and self.site_build_thread.isRunning():
+            return
+        output = QFileDialog.getExistingDirectory(
+            self, "Папка для сайта", self.settings.value("siteOutput", ""), QFileDialog.Option.ShowDirsOnly
+        )
+        if not output:
+            return
+        self.settings.setValue("siteOutput", output)
+        self.site_build_thread = SiteBuildThread(self.file_tree.root_directory(), output, self, self.plugin_dir, self.cache_dir)
+        self.site_build_thread.progress.connect(
+            lambda done, total: self.statusBar().showMessage(f"Сборка сайта: {done}/{total}")
+        )
+        self.site_build_thread.build_finished.connect(
+            lambda stats: self.statusBar().showMessage(
+                f"Сайт собран: страниц {stats['pages']}, пересобрано {stats['built']}", 5000
+            )
+        )
+        self.site_build_thread.build_failed.connect(
+            lambda error: QMessageBox.warning(self, "Ошибка", f"Не удалось собрать сайт: {error}")
+        )
+        self.statusBar().showMessage("Сборка сайта...")
+        self.site_build_thread.start()
+    def check_links(self):
+        self.set_workspace_root(self.file_tree.root_directory())
+        self.problems_dock.show()
+        self.statusBar().showMessage("Проверка ссылок...")
+        self.refresh_workspace(check_links=True)
+    def on_link_problems(self, root, problems):
+        self.problems_view.set_problems(root, problems)
+        self.problems_dock.setWindowTitle(f"Проблемы ({len(problems)})")
+        self.statusBar().showMessage(f"Проверка ссылок завершена: проблем {len(problems)}", 5000)
+    def go_to_line(self, line):
+        block = self.editor.document().findBlockByNumber(max(0, line - 1))
+        if block.isValid():
+            cursor = self.editor.textCursor()
+            cursor.setPosition(block.position())
+            self.editor.setTextCursor(cursor)
+            self.editor.centerCursor()
+            self.editor.setFocus()
     def create_file_tree(self):
         self.file_tree = FileTreeView(self)
         self.file_tree_dock = QDockWidget("Файлы", self)
@@ -698,6 +4875,13 @@ def hello_world():
         export_menu.addAction(export_html_action)
         export_menu.addAction(export_pdf_action)
         export_menu.addAction(export_docx_action)
+        export_menu.addSeparator()
+        export_many_action = QAction("Экспорт &нескольких...", self)
+        export_many_action.triggered.connect(self.export_many)
+        export_menu.addAction(export_many_action)
+        export_jobs_action = QAction("Задания экспорта", self)
+        export_jobs_action.triggered.connect(self.export_dock.show)
+        export_menu.addAction(export_jobs_action)
         file_menu.addMenu(export_menu)
         file_menu.addSeparator()
         exit_action = QAction("&Выход", self)
@@ -708,10 +4892,14 @@ def hello_world():
         undo_action = QAction("&Отменить", self)
         undo_action.setShortcut("Ctrl+Z")
         undo_action.triggered.connect(self.editor.undo)
+        undo_action.setEnabled(False)
+        self.editor.undoAvailable.connect(undo_action.setEnabled)
         edit_menu.addAction(undo_action)
         redo_action = QAction("&Повторить", self)
         redo_action.setShortcut("Ctrl+Shift+Z")
         redo_action.triggered.connect(self.editor.redo)
+        redo_action.setEnabled(False)
+        self.editor.redoAvailable.connect(redo_action.setEnabled)
         edit_menu.addAction(redo_action)
         edit_menu.addSeparator()
         cut_action = QAction("&Вырезать", self)
@@ -735,6 +4923,10 @@ def hello_world():
         replace_action.setShortcut("Ctrl+H")
         replace_action.triggered.connect(self.show_replace_dialog)
         edit_menu.addAction(replace_action)
+        workspace_replace_action = QAction("Заменить в проекте...", self)
+        workspace_replace_action.setShortcut("Ctrl+Shift+H")
+        workspace_replace_action.triggered.connect(self.show_workspace_replace_dialog)
+        edit_menu.addAction(workspace_replace_action)
         view_menu = self.menu_bar.addMenu("&Вид")
         editor_only_action = QAction("&Только редактор", self)
         editor_only_action.triggered.connect(self.show_editor_only)
@@ -751,10 +4943,44 @@ def hello_world():
         file_tree_action.setChecked(True)
         file_tree_action.triggered.connect(self.toggle_file_tree)
         view_menu.addAction(file_tree_action)
+        self.preview_server_action = QAction("Превью в браузере", self)
+        self.preview_server_action.setCheckable(True)
+        self.preview_server_action.toggled.connect(self.toggle_preview_server)
+        view_menu.addAction(self.preview_server_action)
+        memory_action = QAction("Использование памяти...", self)
+        memory_action.triggered.connect(self.show_memory_report)
+        view_menu.addAction(memory_action)
+        render_plugins_action = QAction("Плагины рендеринга...", self)
+        render_plugins_action.triggered.connect(self.show_render_plugins)
+        view_menu.addAction(render_plugins_action)
+        backlinks_action = QAction("Обратные ссылки", self)
+        backlinks_action.triggered.connect(self.toggle_backlinks)
+        view_menu.addAction(backlinks_action)
+        metadata_action = QAction("Метаданные", self)
+        metadata_action.triggered.connect(self.toggle_metadata)
+        view_menu.addAction(metadata_action)
+        fold_all_action = QAction("Свернуть все разделы", self)
+        fold_all_action.triggered.connect(self.editor.folds.fold_all)
+        view_menu.addAction(fold_all_action)
+        unfold_all_action = QAction("Развернуть все разделы", self)
+        unfold_all_action.triggered.connect(self.editor.folds.unfold_all)
+        view_menu.addAction(unfold_all_action)
+        collapse_action = QAction("Сворачивать длинные строки", self)
+        collapse_action.setCheckable(True)
+        collapse_action.setChecked(self.settings.value("collapseLongLines", False, type=bool))
+        self.editor.collapse_long_lines = collapse_action.isChecked()
+        collapse_action.toggled.connect(self.toggle_long_line_collapse)
+        view_menu.addAction(collapse_action)
         project_menu = self.menu_bar.addMenu("&Проект")
         open_dir_action = QAction("Открыть директорию...", self)
         open_dir_action.triggered.connect(self.open_directory)
         project_menu.addAction(open_dir_action)
+        check_links_action = QAction("Проверить ссылки", self)
+        check_links_action.triggered.connect(self.check_links)
+        project_menu.addAction(check_links_action)
+        build_site_action = QAction("Собрать сайт...", self)
+        build_site_action.triggered.connect(self.build_site)
+        project_menu.addAction(build_site_action)
     def create_toolbar(self):
         self.toolbar = QToolBar("Панель инструментов")
         self.toolbar.setIconSize(QSize(18, 18))
@@ -806,10 +5032,88 @@ def hello_world():
         self.toolbar.addAction(hr_action)
     def create_statusbar(self):
         self.statusBar().showMessage("Готово")
+        self.undo_label = QLabel()
+        self.statusBar().addPermanentWidget(self.undo_label)
+        self.editor.undo_history.set_limits(
+            int(self.settings.value("undoMaxSteps", 1000)),
+            int(self.settings.value("undoMaxMB", 64)) * 1024 * 1024
+        )
+        self.editor.undo_history.changed.connect(self.update_undo_label)
+        self.update_undo_label()
+        self.editor.highlighter.long_line_limit = int(self.settings.value("longLineLimit", 10000))
+    def update_undo_label(self):
+        history = self.editor.undo_history
+        self.undo_label.setText(f"Отмена: {len(history.undo_steps)} шаг., {format_size(history.bytes)}")
     def update_preview(self):
-        markdown_text = self.editor.toPlainText()
-        html = self.markdown_renderer.render(markdown_text)
+        if self.loading_file:
+            return
+        markdown_text = self.editor.snapshot().text
+        if self.preview_server is not None:
+            blocks = self.markdown_renderer.render_blocks(markdown_text)
+            self.preview_server.publish(self.preview_title(), blocks)
+            html = self.markdown_renderer.wrap_blocks(blocks)
+        else:
+            html = self.markdown_renderer.render(markdown_text)
+        self.preview_html = html
+        self.preview.setHtml(html)
+        if self.markdown_renderer.needs_background:
+            self.background_render.request(markdown_text)
+    def create_background_renderer(self):
+        return MarkdownRenderer(self.markdown_renderer.cache, self.math_renderer, self.render_plugins, background=True)
+    def create_export_renderer(self):
+        return MarkdownRenderer(self.markdown_renderer.cache, self.math_renderer, self.render_plugins, export=True)
+    def on_background_rendered(self, text, blocks, complete):
+        if self.loading_file or text != self.editor.snapshot().text:
+            return
+        html = self.markdown_renderer.wrap_blocks(blocks)
+        if complete and self.markdown_renderer.cache is not None:
+            self.markdown_renderer.cache.put(self.markdown_renderer.cache.key(text, self.markdown_renderer.options_key), html)
+        if html == self.preview_html:
+            return
+        if self.preview_server is not None:
+            self.preview_server.publish(self.preview_title(), blocks)
+        scroll = self.preview.verticalScrollBar().value()
+        self.preview_html = html
         self.preview.setHtml(html)
+        self.preview.verticalScrollBar().setValue(scroll)
+    def show_render_plugins(self):
+        states = {"active": "активен", "deferred": "в фоне", "suspended": "приостановлен", "disabled": "отключен"}
+        lines = [f"Последний рендер: {self.markdown_renderer.last_render_ms:.1f} мс"]
+        for name, state, last_ms, max_ms, budget_ms in self.markdown_renderer.plugin_report():
+            lines.append(f"{name}: {states[state]}, {last_ms:.1f} мс (макс. {max_ms:.1f}, бюджет {budget_ms:.0f})")
+        lines.append(f"Каталог плагинов: {self.plugin_dir}")
+        box = QMessageBox(QMessageBox.Icon.Information, "Плагины рендеринга", "\n".join(lines), QMessageBox.StandardButton.Ok, self)
+        reset_button = box.addButton("Включить все", QMessageBox.ButtonRole.ActionRole)
+        box.exec()
+        if box.clickedButton() == reset_button:
+            for plugin in self.markdown_renderer.plugins:
+                plugin.state = "active"
+            self.update_preview()
+    def preview_title(self):
+        return os.path.basename(self.current_file) if self.current_file else "Markdown Editor"
+    def toggle_preview_server(self, enabled):
+        if not enabled:
+            if self.preview_server is not None:
+                self.preview_server.stop()
+                self.preview_server = None
+                self.statusBar().showMessage("Сервер превью остановлен", 3000)
+            return
+        port = int(self.settings.value("previewServerPort", 8765))
+        server = PreviewServer(self.markdown_renderer, port=port)
+        try:
+            server.start()
+        except OSError:
+            server = PreviewServer(self.markdown_renderer)
+            try:
+                server.start()
+            except OSError as e:
+                QMessageBox.warning(self, "Ошибка", f"Не удалось запустить сервер превью: {str(e)}")
+                self.preview_server_action.setChecked(False)
+                return
+        self.preview_server = server
+        self.update_preview()
+        QDesktopServices.openUrl(QUrl(server.url()))
+        self.statusBar().showMessage(f"Превью в браузере: {server.url()}")
     def show_editor_only(self):
         self.splitter.setSizes([1, 0])
     def show_preview_only(self):
@@ -883,10 +5187,13 @@ def hello_world():
             self.setWindowTitle("Markdown Editor *")
     def new_file(self):
         if self.maybe_save():
+            self.remember_session_state()
             self.editor.clear()
+            self.editor.saved_diff.set_base(None)
             self.current_file = None
             self.file_changed = False
             self.setWindowTitle("Markdown Editor")
+            self.watch_current_file()
     def open_file(self):
         if self.maybe_save():
             file_path, _ = QFileDialog.getOpenFileName(
@@ -898,18 +5205,33 @@ def hello_world():
     def load_file(self, file_path):
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
-                self.editor.setPlainText(file.read())
+                text = file.read()
+            self.remember_session_state()
+            entry = self.session.get(file_path)
+            restored = entry is not None and entry.get("hash") == text_digest(text) and entry.get("states") is not None
+            self.loading_file = True
+            try:
+                self.editor.set_document_text(text, self.editor.highlighter.decode_states(entry["states"]) if restored else None)
+            finally:
+                self.loading_file = False
+            self.editor.saved_diff.set_base(text)
+            self.preview_html = self.markdown_renderer.render_cached(text)
+            blocks = self.markdown_renderer.last_blocks
+            self.preview.setHtml(self.preview_html)
+            if self.markdown_renderer.needs_background:
+                self.background_render.request(text)
+            if entry is not None:
+                self.restore_view_state(entry)
+            if self.preview_server is not None:
+                self.preview_server.publish(self.preview_title(), blocks if blocks is not None else self.markdown_renderer.render_blocks(text))
             self.current_file = file_path
             self.file_changed = False
+            self.watch_current_file()
             self.setWindowTitle(f"Markdown Editor - {os.path.basename(file_path)}")
             self.statusBar().showMessage(f"Файл {os.path.basename(file_path)} загружен")
-            recent_files = self.settings.value("recentFiles", [])
-            if file_path in recent_files:
-                recent_files.remove(file_path)
-            recent_files.insert(0, file_path)
-            recent_files = recent_files[:10]  
-            self.settings.setValue("recentFiles", recent_files)
-            self.update_recent_files_menu()
+            self.update_backlinks()
+            self.memory_budget.enforce()
+            self.add_recent_file(file_path)
             return True
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось открыть файл: {str(e)}")
@@ -926,104 +5248,189 @@ def hello_world():
         if file_path:
             return self.save_to_file(file_path)
         return False
+    def remember_session_state(self):
+        if not self.current_file:
+            return
+        cursor = self.editor.textCursor()
+        entry = {
+            "cursor": cursor.position(),
+            "anchor": cursor.anchor(),
+            "scroll": self.editor.verticalScrollBar().value(),
+            "preview_scroll": self.preview.verticalScrollBar().value(),
+            "hash": None,
+            "states": None,
+        }
+        if not self.file_changed:
+            entry["hash"] = text_digest(self.editor.snapshot().text)
+            entry["states"] = self.editor.highlighter.encode_states()
+        self.session.put(self.current_file, entry)
+    def restore_view_state(self, entry):
+        limit = self.editor.document().characterCount() - 1
+        cursor = self.editor.textCursor()
+        cursor.setPosition(min(entry.get("anchor", 0), limit))
+        cursor.setPosition(min(entry.get("cursor", 0), limit), QTextCursor.MoveMode.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.editor.verticalScrollBar().setValue(entry.get("scroll", 0))
+        QTimer.singleShot(0, lambda: self.preview.verticalScrollBar().setValue(entry.get("preview_scroll", 0)))
+    def save_session(self):
+        self.remember_session_state()
+        self.session.current = self.current_file
+        try:
+            self.session.save()
+        except OSError:
+            pass
+    def restore_session(self, files=()):
+        self.session.load()
+        if files:
+            self.file_changed = False
+            self.open_paths(files)
+        elif self.session.current and os.path.exists(self.session.current):
+            self.file_changed = False
+            self.load_file(self.session.current)
+    def open_paths(self, paths):
+        paths = [os.path.abspath(path) for path in paths]
+        existing = [path for path in paths if os.path.isfile(path)]
+        missing = [path for path in paths if not os.path.isfile(path)]
+        if existing and self.maybe_save():
+            for path in reversed(existing[1:]):
+                self.add_recent_file(path)
+            self.load_file(existing[0])
+            if len(existing) > 1:
+                self.statusBar().showMessage(f"Остальные файлы ({len(existing) - 1}) добавлены в недавние")
+        if missing:
+            self.statusBar().showMessage(f"Файл не найден: {', '.join(missing)}")
+    def open_from_instance(self, paths):
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+        self.open_paths(paths)
+    def add_recent_file(self, file_path):
+        recent_files = self.settings.value("recentFiles", [])
+        if file_path in recent_files:
+            recent_files.remove(file_path)
+        recent_files.insert(0, file_path)
+        recent_files = recent_files[:10]  
+        self.settings.setValue("recentFiles", recent_files)
+        self.update_recent_files_menu()
     def save_to_file(self, file_path):
         try:
+            text = self.editor.snapshot().text
             with open(file_path, 'w', encoding='utf-8') as file:
-                file.write(self.editor.toPlainText())
+                file.write(text)
+            self.editor.saved_diff.set_base(text)
+            self.markdown_renderer.store(text, self.preview_html)
             self.current_file = file_path
             self.file_changed = False
+            self.watch_current_file()
             self.setWindowTitle(f"Markdown Editor - {os.path.basename(file_path)}")
             self.statusBar().showMessage(f"Файл {os.path.basename(file_path)} сохранен")
-            recent_files = self.settings.value("recentFiles", [])
-            if file_path in recent_files:
-                recent_files.remove(file_path)
-            recent_files.insert(0, file_path)
-            recent_files = recent_files[:10]  
-            self.settings.setValue("recentFiles", recent_files)
-            self.update_recent_files_menu()
+            if file_path.lower().endswith(MARKDOWN_EXTENSIONS):
+                self.refresh_workspace(check_links=self.problems_dock.isVisible())
+            self.add_recent_file(file_path)
             return True
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить файл: {str(e)}")
             return False
+    def watch_current_file(self):
+        watched = self.file_watcher.files()
+        if watched:
+            self.file_watcher.removePaths(watched)
+        if self.current_file and os.path.exists(self.current_file):
+            self.file_watcher.addPath(self.current_file)
+    def on_file_changed_externally(self, path):
+        if path != self.current_file:
+            return
+        if os.path.exists(path):
+            self.reload_changed_file(path)
+        else:
+            QTimer.singleShot(200, lambda: self.reload_changed_file(path))
+    def reload_changed_file(self, path):
+        if path != self.current_file or not os.path.exists(path):
+            return
+        if path not in self.file_watcher.files():
+            self.file_watcher.addPath(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                text = file.read()
+        except (OSError, UnicodeDecodeError):
+            return
+        self.editor.saved_diff.set_base(text)
+        if text == self.editor.snapshot().text:
+            return
+        if self.file_changed:
+            reply = QMessageBox.question(
+                self, "Файл изменен",
+                f"Файл {os.path.basename(path)} изменен другой программой. Загрузить изменения?\n"
+                "Несохраненные правки будут потеряны.",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+        start = time.perf_counter()
+        changes = self.editor.apply_text_diff(text)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.file_changed = False
+        self.setWindowTitle(f"Markdown Editor - {os.path.basename(path)}")
+        self.statusBar().showMessage(
+            f"Файл {os.path.basename(path)} обновлен с диска: изменений {changes}, {elapsed:.0f} мс", 5000
+        )
     def autosave(self):
         if self.file_changed and self.current_file:
             self.save_to_file(self.current_file)
             self.statusBar().showMessage("Автосохранение выполнено", 2000)
-    def export_html(self):
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "Экспорт в HTML", "", 
-            "HTML Files (*.html);;All Files (*)"
-        )
+    def create_export_queue(self):
+        self.export_queue = ExportQueue(self.create_export_renderer, self)
+        self.export_queue.job_updated.connect(self.on_export_job_updated)
+        self.export_view = ExportJobsView(self)
+        self.export_dock = QDockWidget("Экспорт", self)
+        self.export_dock.setWidget(self.export_view)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.export_dock)
+        self.export_dock.hide()
+    def current_export_document(self):
+        return ExportDocument(self.current_file, self.editor.snapshot().text)
+    def export_file(self, format, title, file_filter):
+        file_path, _ = QFileDialog.getSaveFileName(self, title, "", file_filter)
         if file_path:
-            try:
-                html = self.markdown_renderer.render(self.editor.toPlainText())
-                with open(file_path, 'w', encoding='utf-8') as file:
-                    file.write(html)
-                self.statusBar().showMessage(f"Экспорт в HTML выполнен: {os.path.basename(file_path)}")
-            except Exception as e:
-                QMessageBox.warning(self, "Ошибка", f"Не удалось экспортировать в HTML: {str(e)}")
+            self.export_queue.submit([ExportJob(self.current_export_document(), format, file_path)])
+    def export_html(self):
+        self.export_file("html", "Экспорт в HTML", "HTML Files (*.html);;All Files (*)")
     def export_pdf(self):
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "Экспорт в PDF", "", 
-            "PDF Files (*.pdf);;All Files (*)"
-        )
-        if file_path:
-            try:
-                from PyQt6.QtPrintSupport import QPrinter
-                printer = QPrinter(QPrinter.PrinterMode.HighResolution)
-                printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
-                printer.setOutputFileName(file_path)
-                self.preview.document().print_(printer)
-                self.statusBar().showMessage(f"Экспорт в PDF выполнен: {os.path.basename(file_path)}")
-            except Exception as e:
-                QMessageBox.warning(self, "Ошибка", f"Не удалось экспортировать в PDF: {str(e)}")
+        self.export_file("pdf", "Экспорт в PDF", "PDF Files (*.pdf);;All Files (*)")
     def export_docx(self):
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "Экспорт в DOCX", "", 
-            "Word Files (*.docx);;All Files (*)"
-        )
-        if file_path:
-            try:
-                try:
-                    import docx
-                except ImportError:
-                    QMessageBox.warning(
-                        self, "Ошибка", 
-                        "Для экспорта в DOCX требуется библиотека python-docx.\n"
-                        "Установите ее командой: pip install python-docx"
-                    )
-                    return
-                from docx import Document
-                document = Document()
-                html_content = self.preview.toHtml()
-                document.add_heading("Документ Markdown", 0)
-                markdown_text = self.editor.toPlainText()
-                lines = markdown_text.split('\n')
-                for line in lines:
-                    if line.startswith('# '):
-                        document.add_heading(line[2:], level=1)
-                    elif line.startswith('## '):
-                        document.add_heading(line[3:], level=2)
-                    elif line.startswith('### '):
-                        document.add_heading(line[4:], level=3)
-                    elif line.startswith('#### '):
-                        document.add_heading(line[5:], level=4)
-                    elif line.startswith('- ') or line.startswith('* '):
-                        document.add_paragraph(line[2:], style='List Bullet')
-                    elif re.match(r'^\d+\.\s', line):
-                        document.add_paragraph(re.sub(r'^\d+\.\s', '', line), style='List Number')
-                    elif line.strip():
-                        line = re.sub(r'\*\*(.*?)\*\*', r'\1', line)
-                        line = re.sub(r'\*(.*?)\*', r'\1', line)
-                        line = re.sub(r'`(.*?)`', r'\1', line)
-                        line = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', line)
-                        document.add_paragraph(line)
-                    else:
-                        document.add_paragraph('')
-                document.save(file_path)
-                self.statusBar().showMessage(f"Экспорт в DOCX выполнен: {os.path.basename(file_path)}")
-            except Exception as e:
-                QMessageBox.warning(self, "Ошибка", f"Не удалось экспортировать в DOCX: {str(e)}")
+        self.export_file("docx", "Экспорт в DOCX", "Word Files (*.docx);;All Files (*)")
+    def export_many(self):
+        current_name = os.path.basename(self.current_file) if self.current_file else "Без имени"
+        output = self.settings.value("exportDirectory", "") or (os.path.dirname(self.current_file) if self.current_file else "")
+        dialog = ExportDialog(self, current_name, output)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        files = dialog.selected_files()
+        formats = dialog.selected_formats()
+        output = dialog.output_directory()
+        if not files or not formats or not output:
+            return
+        self.settings.setValue("exportDirectory", output)
+        jobs = []
+        for path in files:
+            document = ExportDocument(path) if path else self.current_export_document()
+            stem = os.path.splitext(document.name())[0] if document.path else "document"
+            for format in formats:
+                jobs.append(ExportJob(document, format, os.path.join(output, stem + EXPORT_FORMATS[format][1])))
+        self.export_dock.show()
+        self.export_queue.submit(jobs)
+    def on_export_job_updated(self, job):
+        self.export_view.update_job(job)
+        if job.status == "failed":
+            self.export_dock.show()
+        done, total = self.export_queue.progress()
+        if done < total:
+            self.statusBar().showMessage(f"Экспорт: {done}/{total}")
+        elif total == 1 and job.status == "done":
+            self.statusBar().showMessage(f"Экспорт в {EXPORT_FORMATS[job.format][0]} выполнен: {os.path.basename(job.output)}", 5000)
+        else:
+            failed = sum(job.status == "failed" for job in self.export_queue.batch)
+            self.statusBar().showMessage(f"Экспорт завершен: {total}, ошибок {failed}", 5000)
     def maybe_save(self):
         if not self.file_changed:
             return True
@@ -1040,9 +5447,21 @@ def hello_world():
     def closeEvent(self, event):
         if self.maybe_save():
             self.save_settings()
+            self.save_session()
+            self.stop_services()
             event.accept()
         else:
             event.ignore()
+    def stop_services(self):
+        self.workspace_thread.rerun = False
+        self.workspace_thread.wait()
+        self.export_queue.cancel_all()
+        self.math_renderer.shutdown()
+        self.export_queue.shutdown()
+        self.background_render.wait()
+        self.editor.saved_diff.thread.wait()
+        if self.preview_server is not None:
+            self.preview_server.stop()
     def load_settings(self):
         geometry = self.settings.value("geometry")
         if geometry:
@@ -1053,6 +5472,7 @@ def hello_world():
         last_directory = self.settings.value("lastDirectory")
         if last_directory and isinstance(last_directory, str) and os.path.exists(last_directory):
             self.file_tree.set_root_directory(last_directory)
+            self.set_workspace_root(last_directory)
     def save_settings(self):
         self.settings.setValue("geometry", self.saveGeometry())
         self.settings.setValue("splitterSizes", self.splitter.sizes())
@@ -1067,6 +5487,39 @@ def hello_world():
         dialog = FindReplaceDialog(self)
         dialog.setWindowIcon(QIcon("Markdown_Editor.ico"))
         dialog.exec()
+    def create_memory_budget(self):
+        self.memory_budget = MemoryBudget(self, int(self.settings.value("memoryBudgetMB", 512)) * 1024 * 1024)
+        editor = self.editor
+        budget = self.memory_budget
+        budget.register("Формулы в памяти", self.math_renderer.memory_bytes, self.math_renderer.evict_memory, 0)
+        budget.register("Подсветка блоков кода", editor.fence_highlighter.cache_bytes, editor.fence_highlighter.evict, 1)
+        if MARKDOWN_IT_AVAILABLE:
+            budget.register(
+                "Лексеры Pygments", lambda: get_code_lexer.cache_info().currsize * 16 * 1024,
+                lambda amount: get_code_lexer.cache_info().currsize * 16 * 1024 + (get_code_lexer.cache_clear() or 0), 2
+            )
+        budget.register("История отмены", lambda: editor.undo_history.bytes, editor.undo_history.trim, 10)
+        budget.register("Документ", lambda: editor.document().characterCount() * 2 + editor.document().blockCount() * 200
+                        + editor.undo_history.shadow_bytes())
+        budget.register("Превью", lambda: len(self.preview_html) * 4)
+        budget.register("Индекс проекта", self.workspace_memory_bytes)
+        budget.evicted.connect(lambda evicted: self.statusBar().showMessage(
+            "Превышен бюджет памяти, освобождено: " + ", ".join(f"{name} {format_size(size)}" for name, size in evicted), 5000
+        ))
+    def workspace_memory_bytes(self):
+        thread = self.workspace_thread
+        if thread.index is None:
+            return 0
+        size = len(thread.index.files) * 1024 + len(thread.index.assets) * 200
+        if thread.completion is not None:
+            size += (thread.completion.paths.size + thread.completion.headings.size + thread.completion.tags.size) * 200
+        return size
+    def show_memory_report(self):
+        MemoryReportDialog(self.memory_budget, self).exec()
+    def show_workspace_replace_dialog(self):
+        root = self.workspace_root or self.file_tree.root_directory()
+        dialog = WorkspaceReplaceDialog(self, root)
+        dialog.exec()
     def update_recent_files_menu(self):
         self.recent_files_menu.clear()
         recent_files = self.settings.value("recentFiles", [])
@@ -1095,6 +5548,7 @@ def hello_world():
         if directory:
             self.file_tree.set_root_directory(directory)
             self.settings.setValue("lastDirectory", directory)
+            self.set_workspace_root(directory)
 def apply_modern_dark_theme(app):
     app.setStyle("Fusion")
     font = QFont("Segoe UI", 12)
@@ -1237,10 +5691,282 @@ def apply_modern_dark_theme(app):
     }
     """
     app.setStyleSheet(qss)
+LATENCY_KEY_MODIFIERS = {
+    "ctrl": Qt.KeyboardModifier.ControlModifier,
+    "shift": Qt.KeyboardModifier.ShiftModifier,
+    "alt": Qt.KeyboardModifier.AltModifier,
+}
+class TraceRecorder(QObject):
+    def __init__(self, editor, path):
+        super().__init__(editor)
+        self.editor = editor
+        self.file = open(path, 'w', encoding='utf-8')
+        self.last = time.perf_counter()
+        self.scroll_value = editor.verticalScrollBar().value()
+        editor.installEventFilter(self)
+        editor.verticalScrollBar().valueChanged.connect(self.on_scroll)
+    def write(self, event):
+        now = time.perf_counter()
+        delay = int((now - self.last) * 1000)
+        self.last = now
+        if delay:
+            self.file.write(json.dumps({"delay": min(delay, 2000)}) + "\n")
+        self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self.file.flush()
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.KeyPress:
+            name = Qt.Key(event.key()).name[4:] if event.key() in Qt.Key._value2member_map_ else ""
+            modifiers = [name for name, flag in LATENCY_KEY_MODIFIERS.items() if event.modifiers() & flag]
+            record = {"key": name, "text": event.text()}
+            if modifiers:
+                record["modifiers"] = modifiers
+            self.write(record)
+        return False
+    def on_scroll(self, value):
+        if value != self.scroll_value:
+            self.write({"scroll": value - self.scroll_value})
+            self.scroll_value = value
+def latency_fixture_text(sections=200):
+    parts = []
+    for number in range(sections):
+        parts.append(f"# Раздел {number}\n\n")
+        parts.append("Текст с **жирным**, *курсивом*, `кодом` и [ссылкой](other.md#part). " * 3 + "\n\n")
+        parts.append("".join(f"- пункт {item} со [ссылкой](file{item}.md)\n" for item in range(8)) + "\n")
+        parts.append("```python\n" + "".join(f"def f{item}(x):\n    return x * {item}  # comment\n" for item in range(6)) + "```\n\n")
+        parts.append("| a | b |\n|---|---|\n| 1 | 2 |\n\nФормула $x^2 + y^2$ в тексте.\n\n")
+    return "".join(parts)
+def default_latency_trace():
+    events = [{"goto": 0.5}]
+    sentence = "Новый абзац с *выделением* и [ссылкой](notes.md), набранный в середине документа. "
+    for index, char in enumerate(sentence):
+        events.append({"key": "", "text": char})
+        events.append({"delay": 30})
+        if index % 40 == 39:
+            events.append({"key": "Backspace", "text": ""})
+            events.append({"delay": 30})
+    events.append({"key": "Return", "text": "\r"})
+    for step in range(30):
+        events.append({"scroll": 3 if step < 20 else -3})
+        events.append({"delay": 16})
+    events.append({"goto": 0.9})
+    for char in "```python\nprint('hello')\n```":
+        events.append({"key": "Return", "text": "\r"} if char == "\n" else {"key": "", "text": char})
+        events.append({"delay": 30})
+    for step in range(10):
+        events.append({"key": "PageDown", "text": ""})
+        events.append({"delay": 50})
+    events.append({"delay": 500})
+    return events
+def load_latency_trace(path):
+    if path == "auto":
+        return default_latency_trace()
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+def latency_percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(-(-percent * len(ordered) // 100)) - 1))]
+def parse_latency_budget(spec):
+    budget = {}
+    for part in (spec or "").split(','):
+        if not part.strip():
+            continue
+        name, value = part.split('=', 1)
+        kind, _, stat = name.strip().rpartition('.')
+        budget[(kind or "all", stat)] = float(value)
+    return budget
+def replay_latency_event(app, editor, event):
+    if "goto" in event:
+        block = editor.document().findBlockByNumber(int(event["goto"] * (editor.document().blockCount() - 1)))
+        cursor = editor.textCursor()
+        cursor.setPosition(block.position())
+        editor.setTextCursor(cursor)
+        editor.centerCursor()
+        return "goto"
+    if "scroll" in event:
+        scroll_bar = editor.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.value() + int(event["scroll"]))
+        return "scroll"
+    modifiers = Qt.KeyboardModifier.NoModifier
+    for name in event.get("modifiers", ()):
+        modifiers |= LATENCY_KEY_MODIFIERS[name]
+    text = event.get("text", "")
+    key = getattr(Qt.Key, f"Key_{event['key']}", None) if event.get("key") else None
+    if key is None:
+        key = Qt.Key(ord(text.upper())) if len(text) == 1 and text.upper().isascii() and text.upper().isalnum() else Qt.Key.Key_unknown
+    for event_type in (QEvent.Type.KeyPress, QEvent.Type.KeyRelease):
+        QApplication.sendEvent(editor, QKeyEvent(event_type, key, modifiers, text))
+    return "key"
+def run_latency_replay(trace, fixture=None, budget_spec="", json_path=None):
+    temp_home = tempfile.mkdtemp(prefix="markdown-editor-latency-")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    events = load_latency_trace(trace)
+    generated = os.path.join(temp_home, "fixture", "fixture.md")
+    if fixture is None:
+        fixture = generated
+        os.makedirs(os.path.dirname(generated))
+        atomic_write(fixture, latency_fixture_text())
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    started = time.perf_counter()
+    settings = QSettings(os.path.join(temp_home, "settings.ini"), QSettings.Format.IniFormat)
+    window = MarkdownEditor([fixture], os.path.join(temp_home, "cache"), os.path.join(temp_home, "plugins"), settings)
+    window.resize(1200, 800)
+    window.show()
+    app.processEvents()
+    samples = {"key": [], "scroll": [], "goto": [], "idle": []}
+    samples["load"] = [(time.perf_counter() - started) * 1000]
+    editor = window.editor
+    editor.setFocus()
+    for event in events:
+        if "delay" in event:
+            deadline = time.perf_counter() + event["delay"] / 1000
+            while time.perf_counter() < deadline:
+                begin = time.perf_counter()
+                app.processEvents()
+                elapsed = (time.perf_counter() - begin) * 1000
+                if elapsed >= 1:
+                    samples["idle"].append(elapsed)
+                else:
+                    time.sleep(0.001)
+            continue
+        begin = time.perf_counter()
+        kind = replay_latency_event(app, editor, event)
+        app.processEvents()
+        samples[kind].append((time.perf_counter() - begin) * 1000)
+    window.file_changed = False
+    window.stop_services()
+    shutil.rmtree(temp_home, ignore_errors=True)
+    stats = {}
+    for kind, values in list(samples.items()) + [("all", samples["key"] + samples["scroll"] + samples["goto"])]:
+        if values:
+            stats[kind] = {"count": len(values), "p50": latency_percentile(values, 50), "p90": latency_percentile(values, 90),
+                           "p95": latency_percentile(values, 95), "p99": latency_percentile(values, 99), "max": max(values)}
+    print(f"Документ: {fixture if fixture != generated else 'сгенерированный'}, строк: {editor.document().blockCount()}, событий: {len(events)}")
+    print(f"{'тип':<8}{'число':>7}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}  (мс)")
+    for kind, row in stats.items():
+        print(f"{kind:<8}{row['count']:>7}" + "".join(f"{row[stat]:>9.1f}" for stat in ("p50", "p90", "p95", "p99", "max")))
+    failures = []
+    for (kind, stat), limit in parse_latency_budget(budget_spec).items():
+        value = stats.get(kind, {}).get(stat)
+        if value is not None and value > limit:
+            failures.append(f"{kind}.{stat} = {value:.1f} мс > {limit:g} мс")
+    for failure in failures:
+        print(f"Превышен бюджет: {failure}")
+    if json_path:
+        atomic_write(json_path, json.dumps({"fixture": fixture if fixture != generated else None, "stats": stats, "failures": failures}, ensure_ascii=False, indent=2))
+    return 1 if failures else 0
+INSTANCE_SERVER_NAME = f"markdown-editor-{hashlib.sha1(os.path.expanduser('~').encode('utf-8')).hexdigest()[:12]}"
+QT_VALUE_OPTIONS = {
+    "-platform", "-platformpluginpath", "-platformtheme", "-plugin", "-style", "-stylesheet", "-session",
+    "-display", "-geometry", "-qwindowgeometry", "-qwindowicon", "-qwindowtitle", "-screen"
+}
+class InstanceServer(QObject):
+    files_received = Signal(object)
+    def __init__(self, name=INSTANCE_SERVER_NAME, parent=None):
+        super().__init__(parent)
+        self.name = name
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.on_new_connection)
+        self.buffers = {}
+    def listen(self, timeout=1000):
+        if self.server.listen(self.name):
+            return True
+        probe = QLocalSocket()
+        probe.connectToServer(self.name)
+        if probe.waitForConnected(timeout):
+            probe.disconnectFromServer()
+            return False
+        if probe.error() not in (QLocalSocket.LocalSocketError.ServerNotFoundError,
+                                 QLocalSocket.LocalSocketError.ConnectionRefusedError):
+            return False
+        QLocalServer.removeServer(self.name)
+        return self.server.listen(self.name)
+    def close(self):
+        self.server.close()
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.buffers[socket] = b""
+            socket.readyRead.connect(lambda socket=socket: self.on_ready_read(socket))
+            socket.disconnected.connect(lambda socket=socket: self.on_disconnected(socket))
+    def on_ready_read(self, socket):
+        data = self.buffers.get(socket, b"") + bytes(socket.readAll())
+        if b"\n" not in data:
+            self.buffers[socket] = data
+            return
+        self.buffers[socket] = b""
+        try:
+            files = [str(path) for path in json.loads(data.split(b"\n", 1)[0].decode('utf-8')).get("files", [])]
+        except (ValueError, AttributeError):
+            socket.disconnectFromServer()
+            return
+        socket.write(b"ok\n")
+        socket.flush()
+        self.files_received.emit(files)
+    def on_disconnected(self, socket):
+        self.buffers.pop(socket, None)
+        socket.deleteLater()
+def send_to_running_instance(files, name=INSTANCE_SERVER_NAME, timeout=1000):
+    socket = QLocalSocket()
+    socket.connectToServer(name)
+    if not socket.waitForConnected(timeout):
+        return False
+    socket.write((json.dumps({"files": [os.path.abspath(path) for path in files]}) + "\n").encode('utf-8'))
+    if not socket.waitForBytesWritten(timeout) or not socket.waitForReadyRead(timeout * 3):
+        return False
+    delivered = bytes(socket.readAll()).startswith(b"ok")
+    socket.disconnectFromServer()
+    return delivered
+def split_qt_arguments(argv):
+    own = []
+    qt_args = []
+    arguments = iter(argv)
+    for argument in arguments:
+        if argument in QT_VALUE_OPTIONS:
+            qt_args.append(argument)
+            qt_args.append(next(arguments, ""))
+        else:
+            own.append(argument)
+    return own, qt_args
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(prog="main.py", description="Markdown Editor")
+    parser.add_argument("files", nargs="*", metavar="FILE", help="файлы для открытия")
+    parser.add_argument("--new-instance", action="store_true", help="не передавать файлы уже запущенному редактору")
+    parser.add_argument("--check-links", metavar="DIR", help="проверить ссылки и изображения в директории и выйти")
+    parser.add_argument("--build-site", nargs=2, metavar=("DIR", "OUT"), help="собрать HTML-сайт из директории и выйти")
+    parser.add_argument("--query", nargs=2, metavar=("DIR", "QUERY"), help="найти файлы по метаданным front matter и выйти")
+    parser.add_argument("--jobs", type=int, default=None, help="число процессов для сборки сайта")
+    parser.add_argument("--latency-replay", metavar="TRACE", help="воспроизвести запись нажатий (или auto) без окна и вывести задержки")
+    parser.add_argument("--latency-fixture", metavar="FILE", help="документ для --latency-replay (по умолчанию генерируется)")
+    parser.add_argument("--latency-budget", metavar="SPEC", default="", help="бюджеты задержек, например p95=50,key.max=200")
+    parser.add_argument("--latency-json", metavar="FILE", help="сохранить результаты --latency-replay в JSON")
+    parser.add_argument("--record-trace", metavar="FILE", help="записывать нажатия и прокрутку редактора в файл")
+    own_args, qt_args = split_qt_arguments(sys.argv[1:])
+    args, unknown = parser.parse_known_args(own_args)
+    qt_args += unknown
+    if args.check_links:
+        sys.exit(run_link_check(args.check_links))
+    if args.query:
+        sys.exit(run_metadata_query(*args.query))
+    if args.build_site:
+        sys.exit(run_site_build(*args.build_site, workers=args.jobs))
+    if args.latency_replay:
+        sys.exit(run_latency_replay(args.latency_replay, args.latency_fixture, args.latency_budget, args.latency_json))
+    if not args.new_instance and send_to_running_instance(args.files):
+        sys.exit(0)
+    app = QApplication(sys.argv[:1] + qt_args)
+    instance_server = None
+    if not args.new_instance:
+        instance_server = InstanceServer()
+        instance_server.listen()
     apply_modern_dark_theme(app)
-    window = MarkdownEditor()
+    window = MarkdownEditor(args.files)
+    if args.record_trace:
+        TraceRecorder(window.editor, args.record_trace)
+    if instance_server is not None:
+        instance_server.setParent(window)
+        instance_server.files_received.connect(window.open_from_instance)
     window.show()
     sys.exit(app.exec())
 if __name__ == "__main__":